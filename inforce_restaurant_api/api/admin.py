@@ -11,6 +11,7 @@ class EmployeeAdmin(admin.ModelAdmin):
         'created_at',
         'created_by'
     )
+    list_select_related = ('user',)
 
 
 class RestaurantAdmin(admin.ModelAdmin):
@@ -31,13 +32,33 @@ class MenuAdmin(admin.ModelAdmin):
         'votes',
         'created_at'
     )
+    list_select_related = ('restaurant',)
 
 
 class VoteAdmin(admin.ModelAdmin):
     list_display = ('id', 'employee', 'menu', 'voted_at')
+    # Employee.__str__ reads the user and Menu.__str__ the restaurant.
+    list_select_related = ('employee__user', 'menu__restaurant')
+
+
+class VoteArchiveAdmin(admin.ModelAdmin):
+    list_display = ('id', 'employee_id', 'menu_id', 'business_day')
+
+
+class DailyResultAdmin(admin.ModelAdmin):
+    list_display = ('business_day', 'restaurant', 'votes', 'rank')
+    list_select_related = ('restaurant',)
+
+
+class RankedBallotAdmin(admin.ModelAdmin):
+    list_display = ('id', 'employee', 'business_day', 'menu_ids', 'cast_at')
+    list_select_related = ('employee__user',)
 
 
 admin.site.register(Employee, EmployeeAdmin)
 admin.site.register(Restaurant, RestaurantAdmin)
 admin.site.register(Menu, MenuAdmin)
 admin.site.register(Vote, VoteAdmin)
+admin.site.register(DailyResult, DailyResultAdmin)
+admin.site.register(VoteArchive, VoteArchiveAdmin)
+admin.site.register(RankedBallot, RankedBallotAdmin)
@@ -0,0 +1,186 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Vote, VoteArchive, get_business_day
+
+# Votes are kept per calendar month of their business day. On PostgreSQL
+# the Vote table is partitioned by month (migration 0012), so the hot
+# "voted today?" checks only touch the current partition. Elsewhere closed
+# months are moved to VoteArchive. Either way closed months are exported
+# to gzipped NDJSON files and, past VOTE_RETENTION_DAYS, pruned.
+
+EXPORT_FIELDS = ('id', 'employee_id', 'menu_id', 'voted_at', 'business_day')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def closed_before(today=None):
+    """First day of the oldest month that is not closed yet; earlier months are."""
+    today = today or get_business_day()
+    return month_start(today - timedelta(days=settings.VOTE_ARCHIVE_AFTER_DAYS))
+
+
+def retention_cutoff(today=None):
+    """First day of the oldest month that is kept, or None to keep everything."""
+    if settings.VOTE_RETENTION_DAYS is None:
+        return None
+    today = today or get_business_day()
+    return month_start(today - timedelta(days=settings.VOTE_RETENTION_DAYS))
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [Vote._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def partition_name(month):
+    return f'{Vote._meta.db_table}_y{month:%Y}m{month:%m}'
+
+
+def ensure_partitions(today=None, months_ahead=2):
+    """
+    Create the monthly Vote partitions up to ``months_ahead`` months from now.
+
+    Votes of a month without a partition land in the default partition;
+    they are moved into the new partition when it is created.
+    """
+    quote = connection.ops.quote_name
+    table, default = Vote._meta.db_table, Vote._meta.db_table + '_default'
+    month = month_start(today or get_business_day())
+    created = []
+    for _ in range(months_ahead + 1):
+        name, end = partition_name(month), next_month(month)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is None:
+                cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS)')
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM {quote(default)} WHERE business_day >= %s AND business_day < %s '
+                    f'RETURNING *) INSERT INTO {quote(name)} SELECT * FROM moved', [month, end])
+                cursor.execute(
+                    f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)',
+                    [month, end])
+                created.append(month)
+        month = end
+    return created
+
+
+def archive_month(month):
+    """Move the votes of ``month`` from Vote to VoteArchive. Returns the number moved."""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field) for field in EXPORT_FIELDS)
+    period = 'business_day >= %s AND business_day < %s'
+    params = [month, next_month(month)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Plain SQL: a queryset delete would load every row to send post_delete.
+        cursor.execute(
+            f'INSERT INTO {quote(VoteArchive._meta.db_table)} ({columns}) '
+            f'SELECT {columns} FROM {quote(Vote._meta.db_table)} WHERE {period}', params)
+        cursor.execute(f'DELETE FROM {quote(Vote._meta.db_table)} WHERE {period}', params)
+        return cursor.rowcount
+
+
+def export_path(directory, month):
+    return os.path.join(directory, f'votes-{month:%Y-%m}.ndjson.gz')
+
+
+def export_month(month, directory):
+    """
+    Write the votes of ``month`` to ``votes-YYYY-MM.ndjson.gz`` in ``directory``.
+
+    Rows come from both Vote and VoteArchive, one JSON object per line.
+    The file is written under a temporary name and renamed, so an existing
+    export is always complete. Returns the number of votes written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = export_path(directory, month)
+    temporary = path + '.tmp'
+    count = 0
+    period = {'business_day__gte': month, 'business_day__lt': next_month(month)}
+    try:
+        with gzip.open(temporary, 'wt', encoding='utf-8') as file:
+            for model in (VoteArchive, Vote):
+                rows = model.objects.filter(**period).order_by('id').values_list(*EXPORT_FIELDS)
+                for row in rows.iterator(chunk_size=2000):
+                    vote = dict(zip(EXPORT_FIELDS, row))
+                    vote['voted_at'] = vote['voted_at'].isoformat()
+                    vote['business_day'] = vote['business_day'].isoformat()
+                    file.write(json.dumps(vote, separators=(',', ':')) + '\n')
+                    count += 1
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return count
+
+
+def prune_month(month):
+    """Delete the votes of ``month`` from Vote (dropping its partition) and VoteArchive."""
+    quote = connection.ops.quote_name
+    period = 'business_day >= %s AND business_day < %s'
+    params = [month, next_month(month)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_partitioned():
+            cursor.execute(f'DROP TABLE IF EXISTS {quote(partition_name(month))}')
+        for model in (Vote, VoteArchive):
+            cursor.execute(f'DELETE FROM {quote(model._meta.db_table)} WHERE {period}', params)
+
+
+def vote_months(model, before):
+    return list(model.objects.filter(business_day__lt=before).dates('business_day', 'month'))
+
+
+class ArchiveReport:
+
+    def __init__(self):
+        self.partitions = []
+        self.archived = {}
+        self.exported = {}
+        self.pruned = []
+        self.not_exported = []
+
+
+def archive_votes(directory, today=None):
+    """
+    Archive, export and prune closed months of votes. Returns an ``ArchiveReport``.
+
+    A month is closed ``VOTE_ARCHIVE_AFTER_DAYS`` days after it ends. Each
+    closed month is exported once; months older than ``VOTE_RETENTION_DAYS``
+    are pruned, but only once their export exists.
+    """
+    report = ArchiveReport()
+    before = closed_before(today)
+    if is_partitioned():
+        report.partitions = ensure_partitions(today)
+    else:
+        for month in vote_months(Vote, before):
+            report.archived[month] = archive_month(month)
+
+    for month in sorted(set(vote_months(Vote, before) + vote_months(VoteArchive, before))):
+        if directory and not os.path.exists(export_path(directory, month)):
+            report.exported[month] = export_month(month, directory)
+
+    cutoff = retention_cutoff(today)
+    if cutoff is not None:
+        cutoff = min(cutoff, before)
+        for month in sorted(set(vote_months(Vote, cutoff) + vote_months(VoteArchive, cutoff))):
+            if directory and os.path.exists(export_path(directory, month)):
+                prune_month(month)
+                report.pruned.append(month)
+            else:
+                report.not_exported.append(month)
+    return report
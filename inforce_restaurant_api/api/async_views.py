@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import ClaimsJWTAuthentication
+from .caching import body_response, cache_body, choose_encoding, get_cached_body, get_validators, set_validators
+from .db.routers import replica_reads, use_primary_after
+from .leaderboard import get_leaderboard, load_from_database
+from .models import Restaurant, get_business_day
+from .profiling import query_budget
+from .renderers import ORJSONRenderer
+from .serializers import RestaurantListSerializer
+from .views import get_menu_list_data, get_results_data
+from .voting import cast_vote, get_employee_id
+
+# Async counterparts of the hot read and vote endpoints for ASGI
+# deployments (API_ASYNC_VIEWS). Authentication, the business day, ETag
+# checks and leaderboard reads run on the event loop; whatever database
+# work a request needs is done in a single sync_to_async call, since
+# Django 4.0 has no async ORM.
+
+jwt_authentication = ClaimsJWTAuthentication()
+renderer = ORJSONRenderer()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(renderer.render(data), status=status_code, content_type='application/json')
+
+
+def method_not_allowed(request):
+    return render({"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+def authenticate(request):
+    """
+    Authenticate the request's JWT from its claims, without touching the database.
+
+    Returns ``(user, None)`` or ``(None, error_response)``, with the same
+    status codes the DRF views give for missing and invalid credentials.
+    """
+    try:
+        result = jwt_authentication.authenticate(request)
+    except AuthenticationFailed as e:
+        # SessionAuthentication comes first in DEFAULT_AUTHENTICATION_CLASSES,
+        # so DRF answers bad credentials with 403 rather than 401.
+        return None, render(e.detail, status.HTTP_403_FORBIDDEN)
+    if result is None:
+        return None, render(
+            {"detail": "Authentication credentials were not provided."}, status.HTTP_403_FORBIDDEN)
+    return result[0], None
+
+
+async def conditional_get(request, build_data):
+    today = get_business_day()
+    etag, last_modified, version = get_validators(today)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        use_primary_after(version)
+        key = (request.path, today, version)
+        encoding = choose_encoding(request)
+        body = get_cached_body(key, encoding)
+        if body is None:
+            data = await build_data(today)
+            body = cache_body(key, renderer.render(data), encoding)
+        response = body_response(body, encoding)
+    return set_validators(response, etag, last_modified)
+
+
+@query_budget(1)
+@replica_reads
+async def menu_list(request):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    return await conditional_get(request, sync_to_async(get_menu_list_data))
+
+
+@query_budget(1)
+@replica_reads
+async def results(request):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+
+    async def build_data(today):
+        ranking = get_leaderboard().get_ranking(today)
+        if ranking is None:
+            ranking = await sync_to_async(load_from_database)(today)
+        return get_results_data(today, ranking)
+
+    return await conditional_get(request, build_data)
+
+
+def list_restaurants(request):
+    paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+    page = paginator.paginate_queryset(Restaurant.objects.all(), Request(request))
+    serializer = RestaurantListSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data).data
+
+
+@query_budget(1)
+@replica_reads
+async def restaurants(request):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    return render(await sync_to_async(list_restaurants)(request))
+
+
+def vote_as_user(user, menu_id):
+    return cast_vote(get_employee_id(user), menu_id)
+
+
+@query_budget(5)
+async def vote(request, menu_id):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    user, error = authenticate(request)
+    if error:
+        return error
+    res, status_code = await sync_to_async(vote_as_user)(user, menu_id)
+    return render(res, status_code)
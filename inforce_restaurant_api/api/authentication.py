@@ -0,0 +1,133 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+# Revoked tokens.
+#
+# Revocations are appended to a log in the shared cache: a counter, and
+# one entry per revocation under its number that expires with the token.
+# Each worker keeps the revoked ids in memory and reads the entries added
+# since its last look every REVOKED_TOKENS_REFRESH_INTERVAL seconds, so
+# authenticating a request costs no cache read in between. The counter
+# relies on the backend's incr, which is atomic on memcached and redis.
+
+REVOKED_COUNT_KEY = 'api:revoked-tokens'
+REVOKED_KEY = 'api:revoked-tokens:{}'
+
+
+class ClaimsUser(TokenUser):
+    """
+    Authenticated user backed by the claims of an access token.
+
+    ``get_token`` embeds the employee id, role and username, so views can
+    identify the caller without loading the User or Employee rows. Tokens
+    issued before those claims existed still authenticate; their
+    ``employee_id`` is None and callers fall back to a database lookup.
+    """
+
+    @cached_property
+    def employee_id(self):
+        return self.token.get('employee_id')
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def is_staff(self):
+        return self.role in ('admin', 'staff')
+
+    @cached_property
+    def is_superuser(self):
+        return self.role == 'admin'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts the token's claims instead of reading the User table."""
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        if is_revoked(validated_token):
+            raise InvalidToken('Token has been revoked')
+        return ClaimsUser(validated_token)
+
+
+class RevokedTokens:
+    """The worker's copy of the revocation log: token ids with their expiry."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._expiry = {}
+        self._seen = 0
+        self._retry = ()
+        self._refreshed_at = None
+
+    def __contains__(self, jti):
+        self.refresh_if_due()
+        expiry = self._expiry.get(jti)
+        return expiry is not None and expiry > time.time()
+
+    def add(self, jti, expiry):
+        timeout = expiry - int(time.time())
+        if timeout <= 0:
+            return
+        try:
+            number = cache.incr(REVOKED_COUNT_KEY)
+        except ValueError:
+            cache.add(REVOKED_COUNT_KEY, 0, None)
+            number = cache.incr(REVOKED_COUNT_KEY)
+        cache.set(REVOKED_KEY.format(number), (jti, expiry), timeout)
+        with self._lock:
+            self._expiry[jti] = expiry
+
+    def refresh_if_due(self):
+        now = time.monotonic()
+        interval = settings.REVOKED_TOKENS_REFRESH_INTERVAL
+        if self._refreshed_at is not None and now - self._refreshed_at < interval:
+            return
+        with self._lock:
+            if self._refreshed_at is not None and now - self._refreshed_at < interval:
+                return
+            self._refreshed_at = now
+            count = cache.get(REVOKED_COUNT_KEY, 0)
+            if count < self._seen:
+                # The counter was evicted and started over.
+                self._seen, self._retry = 0, ()
+            numbers = [*self._retry, *range(self._seen + 1, count + 1)]
+            entries = cache.get_many([REVOKED_KEY.format(number) for number in numbers]) if numbers else {}
+            for jti, expiry in entries.values():
+                self._expiry[jti] = expiry
+            # A revoking worker takes its number before it writes the entry;
+            # look for new numbers still missing once more next time.
+            self._retry = [
+                number for number in range(self._seen + 1, count + 1)
+                if REVOKED_KEY.format(number) not in entries]
+            self._seen = count
+            now = time.time()
+            self._expiry = {jti: expiry for jti, expiry in self._expiry.items() if expiry > now}
+
+
+_revoked = RevokedTokens()
+
+
+def is_revoked(token):
+    return token[api_settings.JTI_CLAIM] in _revoked
+
+
+def revoke_token(token):
+    """
+    Deny ``token`` until it expires.
+
+    Log entries live in the shared cache only as long as the token itself
+    would, so the deny-list stays as small as the set of revoked tokens
+    still in circulation.
+    """
+    _revoked.add(token[api_settings.JTI_CLAIM], token['exp'])
@@ -0,0 +1,212 @@
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.files.base import ContentFile
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from .caching import body_cache
+from .leaderboard import get_leaderboard
+from .models import User, Employee, Restaurant, Menu
+
+# Helpers for the benchmark management commands. Benchmarks run in-process
+# against a throwaway test database, so they never touch real data.
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """Create the test database, yield, and destroy it again."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        get_leaderboard().reset()
+        body_cache.clear()
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def create_menus(count, prefix='Restaurant'):
+    """Create ``count`` restaurants with a menu each for today."""
+    menus = []
+    for number in range(count):
+        restaurant = Restaurant.objects.create(
+            name=f'{prefix} {number}', contact_no=f'+380{number:09d}', address='Lviv')
+        menus.append(Menu.objects.create(
+            restaurant=restaurant,
+            file=ContentFile(b'menu', name=f'benchmark-{number}.txt'),
+            uploaded_by='benchmark'))
+    return menus
+
+
+def create_employees(count, prefix='benchmark'):
+    users = User.objects.bulk_create(
+        User(username=f'{prefix}-{number}', email=f'{prefix}-{number}@example.com')
+        for number in range(count))
+    Employee.objects.bulk_create(
+        Employee(user=user, employee_no=f'B{number}') for number, user in enumerate(users))
+    return users
+
+
+def delete_menus(menus):
+    for menu in menus:
+        menu.file.delete(save=False)
+
+
+class Timer:
+    """Wall-clock time of a ``with`` block."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def format_rate(requests, seconds):
+    return f'{requests / seconds:,.0f} req/s' if seconds else 'n/a'
+
+
+# Load generation for benchmark_lunch_rush: the same scenario runs through
+# the Django stack in-process (with query counts) or against a server URL.
+
+Result = namedtuple('Result', 'status etag seconds queries')
+
+
+class InProcessClient:
+    """Sends requests through the middleware and URLconf with the test client, counting queries."""
+
+    counts_queries = True
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+        extra = {f'HTTP_{name.upper().replace("-", "_")}': value for name, value in (headers or {}).items()}
+        try:
+            with CaptureQueriesContext(connection) as queries, Timer() as timer:
+                if method == 'POST':
+                    response = client.post(path, body, content_type='application/json', **extra)
+                else:
+                    response = client.get(path, **extra)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        finally:
+            # Under WSGI every request opens its own connection too.
+            connections.close_all()
+        return Result(response.status_code, response.get('ETag'), timer.elapsed, len(queries))
+
+
+class HTTPClient:
+    """Sends requests to a running server."""
+
+    counts_queries = False
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, headers=None, body=None):
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        with Timer() as timer:
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                    status, etag = response.status, response.headers.get('ETag')
+            except urllib.error.HTTPError as e:
+                # urllib raises for every status >= 300, 304 included.
+                e.read()
+                status, etag = e.code, e.headers.get('ETag')
+            except OSError:
+                status, etag = 0, None
+        return Result(status, etag, timer.elapsed, None)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        self.seconds = 0.0
+
+    def add(self, result):
+        self.latencies.append(result.seconds)
+        if result.queries is not None:
+            self.queries.append(result.queries)
+        if not 200 <= result.status < 400:
+            self.errors += 1
+
+    def as_dict(self):
+        def milliseconds(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            'requests': len(self.latencies),
+            'errors': self.errors,
+            'throughput': round(len(self.latencies) / self.seconds, 1) if self.seconds else None,
+            'p50': milliseconds(percentile(self.latencies, 0.50)),
+            'p95': milliseconds(percentile(self.latencies, 0.95)),
+            'p99': milliseconds(percentile(self.latencies, 0.99)),
+            'queries': round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+        }
+
+
+def run_phase(calls, stats, concurrency):
+    """Run the ``calls`` (functions returning a ``Result``) on ``concurrency`` threads."""
+    with ThreadPoolExecutor(concurrency) as pool, Timer() as timer:
+        results = list(pool.map(lambda call: call(), calls))
+    for result in results:
+        stats.add(result)
+    stats.seconds += timer.elapsed
+    return results
+
+
+def compare_baseline(current, baseline, tolerance):
+    """
+    Regressions of ``current`` endpoint stats against a saved ``baseline``.
+
+    p95 latency, throughput and errors may move by ``tolerance`` (a
+    fraction) before they count. Queries per request may rise by less than
+    half a query, which cache misses can account for; an extra query in
+    every request cannot hide there.
+    """
+    regressions = []
+    for name, stats in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if base['p95'] and stats['p95'] and stats['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95']} ms -> {stats['p95']} ms")
+        if base['throughput'] and stats['throughput'] and stats['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput']} -> {stats['throughput']} req/s")
+        if base['queries'] is not None and stats['queries'] is not None and stats['queries'] >= base['queries'] + 0.5:
+            regressions.append(f"{name}: queries per request {base['queries']} -> {stats['queries']}")
+        if stats['errors'] > base['errors'] * (1 + tolerance):
+            regressions.append(f"{name}: errors {base['errors']} -> {stats['errors']}")
+    return regressions
@@ -0,0 +1,171 @@
+import gzip
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .db.routers import use_primary_after
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+VERSION_KEY = 'api:content-version'
+
+
+def get_content_version():
+    """
+    Version of everything the menu list and results are built from.
+
+    The version is the time of the last Menu, Vote or Restaurant write in
+    nanoseconds, so it doubles as the Last-Modified date.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = _set_content_version()
+    return version
+
+
+def bump_content_version():
+    _set_content_version()
+    # Bump again once the write is visible, so a poll that read the old
+    # rows in between cannot keep serving them under the new version.
+    transaction.on_commit(_set_content_version)
+
+
+def _set_content_version():
+    version = time.time_ns()
+    cache.set(VERSION_KEY, version, None)
+    return version
+
+
+class BodyCache:
+    """Small LRU of rendered (and compressed) response bodies."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+
+
+body_cache = BodyCache()
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    if encoding == 'gzip':
+        return gzip.compress(body, mtime=0)
+    return body
+
+
+def choose_encoding(request):
+    accepted = {
+        value.split(';')[0].strip()
+        for value in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')
+    }
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return 'identity'
+
+
+def get_validators(day):
+    """ETag, Last-Modified timestamp and content version for a business day."""
+    version = get_content_version()
+    return f'"{day.isoformat()}-{version}"', version // 1_000_000_000, version
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def get_cached_body(key, encoding):
+    """The body cached under ``key`` in ``encoding``, compressing the identity body if needed."""
+    body = body_cache.get(key + (encoding,))
+    if body is None:
+        identity = body_cache.get(key + ('identity',))
+        if identity is not None:
+            body = compress(identity, encoding)
+            body_cache.set(key + (encoding,), body)
+    return body
+
+
+def cache_body(key, identity, encoding):
+    body_cache.set(key + ('identity',), identity)
+    body = compress(identity, encoding)
+    body_cache.set(key + (encoding,), body)
+    return body
+
+
+def body_response(body, encoding):
+    response = HttpResponse(body, content_type='application/json')
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Serve a GET endpoint with ETag/Last-Modified validators.
+
+    ``get_conditional_data`` builds the payload for a business day. It
+    only runs when the content version or business day changed since the
+    last build on this worker; unchanged polls cost one version lookup and
+    get a 304, and changed ones reuse a body that was rendered (by the
+    view's JSON renderer) and compressed once per version.
+    """
+
+    def get_conditional_data(self, request, day):
+        raise NotImplementedError
+
+    def conditional_get(self, request, day):
+        etag, last_modified, version = get_validators(day)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            use_primary_after(version)
+            if request.accepted_renderer.format == 'json':
+                response = self.cached_response(request, day, version)
+            else:
+                response = Response(data=self.get_conditional_data(request, day))
+        return set_validators(response, etag, last_modified)
+
+    def cached_response(self, request, day, version):
+        key = (request.path, day, version)
+        encoding = choose_encoding(request)
+        body = get_cached_body(key, encoding)
+        if body is None:
+            identity = request.accepted_renderer.render(self.get_conditional_data(request, day))
+            body = cache_body(key, identity, encoding)
+        return body_response(body, encoding)
@@ -0,0 +1,79 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+def to_business_day(value):
+    """Calendar day of ``value`` in the configured TIME_ZONE."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+class SystemClock:
+    """
+    Wall clock that resolves the business day on every call.
+
+    The day is cached together with the epoch second at which it ends, so
+    between midnights ``today()`` is a single ``time.time()`` comparison
+    and a long-running worker still moves to the new day on its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._rollover_at = 0.0
+
+    def now(self):
+        return timezone.now()
+
+    def today(self):
+        if time.time() >= self._rollover_at:
+            with self._lock:
+                now = self.now()
+                day = to_business_day(now)
+                next_day = datetime.combine(day + timedelta(days=1), datetime.min.time())
+                if settings.USE_TZ:
+                    next_day = timezone.make_aware(next_day)
+                self._day, self._rollover_at = day, next_day.timestamp()
+        return self._day
+
+
+class FrozenClock:
+    """Clock that stays at ``now`` until moved; for tests."""
+
+    def __init__(self, now):
+        self._now = now
+
+    def now(self):
+        return self._now
+
+    def today(self):
+        return to_business_day(self._now)
+
+    def move_to(self, now):
+        self._now = now
+
+    def advance(self, **kwargs):
+        self._now += timedelta(**kwargs)
+
+
+_clock = None
+
+
+def get_clock():
+    global _clock
+    if _clock is None:
+        _clock = import_string(settings.BUSINESS_CLOCK)()
+    return _clock
+
+
+def set_clock(clock):
+    """Replace the process clock and return the previous one (None resets to BUSINESS_CLOCK)."""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
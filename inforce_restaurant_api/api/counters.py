@@ -0,0 +1,85 @@
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+from .archive import retention_cutoff
+from .models import Menu, MenuVoteCounter, Vote, VoteArchive
+
+# Sent with ``menu_id`` and ``amount`` once a vote count change is committed.
+menu_votes_changed = Signal()
+# Sent with the same arguments when the change is made, inside its transaction.
+menu_votes_changing = Signal()
+
+
+def get_shard_count():
+    return max(int(getattr(settings, 'VOTE_COUNTER_SHARDS', 1)), 1)
+
+
+def increment_menu_votes(menu_id, amount=1):
+    """
+    Atomically add ``amount`` votes to a menu.
+
+    With a single shard the increment is applied to ``Menu.votes`` as an
+    ``UPDATE ... SET votes = votes + n``. With several shards it goes to a
+    randomly picked ``MenuVoteCounter`` row, so concurrent voters on the
+    same menu do not all queue behind one row lock.
+    """
+    menu_votes_changing.send(sender=Menu, menu_id=menu_id, amount=amount)
+    transaction.on_commit(
+        lambda: menu_votes_changed.send(sender=Menu, menu_id=menu_id, amount=amount))
+
+    shards = get_shard_count()
+    if shards == 1:
+        Menu.objects.filter(id=menu_id).update(votes=F('votes') + amount)
+        return
+
+    shard = random.randrange(shards)
+    counters = MenuVoteCounter.objects.filter(menu_id=menu_id, shard=shard)
+    if counters.update(count=F('count') + amount):
+        return
+    try:
+        with transaction.atomic():
+            MenuVoteCounter.objects.create(menu_id=menu_id, shard=shard, count=amount)
+    except IntegrityError:
+        counters.update(count=F('count') + amount)
+
+
+def with_live_votes(queryset):
+    """Annotate menus with ``live_votes``: ``Menu.votes`` plus all counter shards."""
+    return queryset.annotate(
+        live_votes=F('votes') + Coalesce(Sum('vote_counters__count'), Value(0)))
+
+
+def get_menu_votes(menu_id):
+    return with_live_votes(Menu.objects.filter(id=menu_id)).values_list('live_votes', flat=True).get()
+
+
+def reconcile_menu_votes(menus):
+    """
+    Rebuild ``Menu.votes`` from the ``Vote`` table and drop the counter shards.
+
+    Archived votes count too. Menus of months that may have been pruned
+    under ``VOTE_RETENTION_DAYS`` are left alone, since their votes are
+    gone. Each menu is locked for the duration of its rebuild. Votes committed
+    after the recount keep incrementing (or recreate) their shard, so the
+    live total stays exact while the command runs.
+    """
+    cutoff = retention_cutoff()
+    if cutoff is not None:
+        menus = menus.filter(business_day__gte=cutoff)
+    changed = 0
+    for menu_id in menus.values_list('id', flat=True):
+        with transaction.atomic():
+            menu = Menu.objects.select_for_update().only('id', 'votes').get(id=menu_id)
+            list(MenuVoteCounter.objects.select_for_update().filter(menu_id=menu_id).values_list('id'))
+            total = Vote.objects.filter(menu_id=menu_id).aggregate(total=Count('id'))['total'] + \
+                VoteArchive.objects.filter(menu_id=menu_id).count()
+            MenuVoteCounter.objects.filter(menu_id=menu_id).delete()
+            if menu.votes != total:
+                Menu.objects.filter(id=menu_id).update(votes=total)
+                changed += 1
+    return changed
@@ -0,0 +1,39 @@
+from django.db.backends.postgresql import base, creation
+
+from api.db.pool import PooledDatabaseCreationMixin, PooledDatabaseWrapperMixin
+
+
+def check_connection(connection):
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except base.Database.Error:
+        return False
+    return True
+
+
+def reset_connection(connection):
+    # Outside autocommit, or after a failed statement, the connection may
+    # still be in a transaction.
+    if connection.info.transaction_status != base.Database.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseCreation(PooledDatabaseCreationMixin, creation.DatabaseCreation):
+    pass
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """PostgreSQL with pooled connections; ENGINE = 'api.db.backends.postgresql'."""
+
+    creation_class = DatabaseCreation
+    check_connection = staticmethod(check_connection)
+    reset_connection = staticmethod(reset_connection)
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        # The base class sets this only on connections it opens itself.
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
@@ -0,0 +1,32 @@
+from django.db.backends.sqlite3 import base, creation
+
+from api.db.pool import PooledDatabaseCreationMixin, PooledDatabaseWrapperMixin
+
+
+def check_connection(connection):
+    try:
+        connection.execute('SELECT 1').fetchone()
+    except base.Database.Error:
+        return False
+    return True
+
+
+def reset_connection(connection):
+    if connection.in_transaction:
+        connection.rollback()
+
+
+class DatabaseCreation(PooledDatabaseCreationMixin, creation.DatabaseCreation):
+    pass
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """SQLite with pooled connections; ENGINE = 'api.db.backends.sqlite3'."""
+
+    creation_class = DatabaseCreation
+    check_connection = staticmethod(check_connection)
+    reset_connection = staticmethod(reset_connection)
+
+    def pooling_enabled(self):
+        # An in-memory database lives and dies with its one connection.
+        return not self.is_in_memory_db()
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from ..middleware import HybridMiddleware
+
+# Connection pooling for the database backends in api/db/backends.
+#
+# Django opens a connection per request and closes it at the end (with
+# CONN_MAX_AGE = 0), so every request pays for a TCP and auth handshake.
+# The pooled backends hand the closed connection back to a pool instead,
+# and the next request of any thread in the worker takes it from there.
+# A pool holds at most POOL["MAX_SIZE"] connections; checkouts beyond that
+# wait up to POOL["TIMEOUT"] seconds and then fail with PoolExhausted (503).
+# Connections idle longer than POOL["CHECK_AFTER"] seconds are checked
+# before use, and connections older than POOL["MAX_LIFETIME"] are closed.
+
+DEFAULT_OPTIONS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5.0,
+    'MAX_LIFETIME': 1800.0,
+    'CHECK_AFTER': 5.0,
+}
+
+STATS = ('checkouts', 'failures', 'wait_seconds', 'opened', 'expired', 'unhealthy')
+
+
+class PoolExhausted(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The server is busy, try again shortly.'
+    default_code = 'pool_exhausted'
+
+
+class ConnectionPool:
+    """
+    A bounded pool of DB-API connections to one database.
+
+    ``checkout`` hands out an idle connection, most recently used first,
+    or opens one with ``connect`` while fewer than ``max_size`` are open.
+    ``check(connection)`` tells whether an idle connection still works and
+    ``reset(connection)`` rolls back whatever a returned one left open.
+    """
+
+    def __init__(self, max_size, timeout, max_lifetime, check_after, check, reset):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.check = check
+        self.reset = reset
+        self.closed = False
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()
+        self._opened_at = {}
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.stats = dict.fromkeys(STATS, 0)
+
+    def checkout(self, connect):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.stats['failures'] += 1
+                self.stats['wait_seconds'] += time.monotonic() - start
+            raise PoolExhausted()
+        try:
+            connection = self._take_idle()
+            if connection is None:
+                connection = connect()
+                with self._lock:
+                    self._opened_at[connection] = time.monotonic()
+                    self.stats['opened'] += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.stats['checkouts'] += 1
+            self.stats['wait_seconds'] += time.monotonic() - start
+        return connection
+
+    def _take_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, returned_at = self._idle.pop()
+            if self._expired(connection):
+                self._discard(connection, 'expired')
+            elif time.monotonic() - returned_at >= self.check_after and not self.check(connection):
+                self._discard(connection, 'unhealthy')
+            else:
+                return connection
+
+    def release(self, connection, discard=False):
+        """Take ``connection`` back; ``discard`` closes it instead, e.g. after it broke."""
+        try:
+            if discard or self.closed:
+                self._discard(connection)
+            elif self._expired(connection):
+                self._discard(connection, 'expired')
+            else:
+                try:
+                    self.reset(connection)
+                except Exception:
+                    self._discard(connection, 'unhealthy')
+                else:
+                    with self._lock:
+                        self._idle.append((connection, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def _expired(self, connection):
+        opened_at = self._opened_at.get(connection)
+        return opened_at is None or time.monotonic() - opened_at >= self.max_lifetime
+
+    def _discard(self, connection, reason=None):
+        with self._lock:
+            self._opened_at.pop(connection, None)
+            if reason:
+                self.stats[reason] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close the idle connections, and the others as they come back."""
+        self.closed = True
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, _ = self._idle.pop()
+            self._discard(connection)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=self.max_size, in_use=self.in_use, idle=len(self._idle))
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, options, check, reset):
+    """The pool of ``alias`` for ``conn_params`` in this process, created on first use."""
+    # Keyed by process too: a forked worker must not use, or close, the
+    # connections it inherited from its parent.
+    key = (os.getpid(), alias, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = {**DEFAULT_OPTIONS, **options}
+            pool = _pools[key] = ConnectionPool(
+                options['MAX_SIZE'], options['TIMEOUT'], options['MAX_LIFETIME'], options['CHECK_AFTER'],
+                check, reset)
+        return pool
+
+
+def close_pools(alias=None):
+    """Close the pools of ``alias``, or all of them; later checkouts start new pools."""
+    with _pools_lock:
+        keys = [key for key in _pools if alias is None or key[1] == alias]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """This process's pool counters and gauges, summed per database alias."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key[1], pool) for key, pool in _pools.items() if key[0] == pid]
+    stats = {}
+    for alias, pool in pools:
+        total = stats.setdefault(alias, {})
+        for name, value in pool.snapshot().items():
+            total[name] = total.get(name, 0) + value
+    return stats
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Takes the connections of a Django ``DatabaseWrapper`` from a pool.
+
+    Backends set ``check_connection`` and ``reset_connection``, see
+    ``ConnectionPool``, and may turn ``pooling_enabled`` off.
+    """
+
+    connection_pool = None
+
+    def pooling_enabled(self):
+        return True
+
+    def get_new_connection(self, conn_params):
+        if not self.pooling_enabled():
+            return super().get_new_connection(conn_params)
+        pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get('POOL', {}),
+            self.check_connection, self.reset_connection)
+        connection = pool.checkout(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params))
+        self.connection_pool = pool
+        return connection
+
+    def _close(self):
+        pool, self.connection_pool = self.connection_pool, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        # Closed inside a transaction (e.g. on an error), the connection
+        # must not be reused: Django rolls back on it once the block exits.
+        pool.release(self.connection, discard=self.in_atomic_block)
+
+
+class PooledDatabaseCreationMixin:
+    """Closes the pools before the test database is dropped, since open connections block that."""
+
+    def destroy_test_db(self, *args, **kwargs):
+        close_pools(self.connection.alias)
+        return super().destroy_test_db(*args, **kwargs)
+
+
+class PoolExhaustedMiddleware(HybridMiddleware):
+    """
+    Answer ``PoolExhausted`` with 503 outside of DRF views too.
+
+    DRF views turn it into a 503 themselves; this covers the async views
+    and the admin.
+    """
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, PoolExhausted):
+            response = JsonResponse({'detail': str(exception.detail)}, status=exception.status_code)
+            response['Retry-After'] = '1'
+            return response
+        return None
@@ -0,0 +1,42 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Recording the SQL of a request.
+#
+# ``connection.execute_wrapper`` only wraps the connection of the calling
+# thread, and under ASGI a request's queries run on a sync_to_async thread
+# whose connections the middleware on the event loop never sees. So every
+# connection gets one permanent wrapper that hands each statement to the
+# recorders of the current context, and ``recording`` adds a recorder to
+# it; context variables follow the request into sync_to_async threads.
+# Recorders have the signature of execute wrappers; ``context["connection"]``
+# tells which database ran the statement.
+
+_recorders = ContextVar('sql_recorders', default=())
+
+
+def dispatch(execute, sql, params, many, context):
+    recorders = _recorders.get()
+    for recorder in reversed(recorders):
+        execute = functools.partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install(sender, connection, **kwargs):
+    if dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(dispatch)
+
+
+@contextmanager
+def recording(recorder):
+    """Pass the statements run in this context, on any connection, through ``recorder``."""
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
@@ -0,0 +1,167 @@
+import itertools
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.module_loading import import_string
+
+from ..middleware import HybridMiddleware
+
+# Read replicas.
+#
+# Views that only read opt in with ``replica_reads = True`` (or the
+# ``replica_reads`` decorator); their queries go to one of the
+# DATABASE_REPLICAS aliases, picked by DATABASE_REPLICA_STRATEGY.
+# Everything else uses the primary. Once a request writes, its remaining
+# queries use the primary, and the client gets a cookie that keeps its
+# reads on the primary for REPLICA_PIN_SECONDS, longer than the
+# replicas lag behind, so it always sees its own writes.
+
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    """Whether the current request may read from replicas, and whether it wrote."""
+
+    __slots__ = ('request', 'use_replicas', 'wrote')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.use_replicas = None
+        self.wrote = False
+
+    def may_use_replicas(self):
+        """
+        Decided on the first read after URL resolution, from the method, the
+        pin cookie and the view; reads before that use the primary.
+        """
+        if self.use_replicas is None:
+            match = getattr(self.request, 'resolver_match', None)
+            if match is None:
+                return False
+            self.use_replicas = (
+                self.request.method in SAFE_METHODS and PIN_COOKIE not in self.request.COOKIES
+                and allows_replica_reads(match.func))
+        return self.use_replicas
+
+
+_state = ContextVar('replica_routing', default=None)
+
+
+class RandomStrategy:
+
+    def choose(self, replicas):
+        return random.choice(replicas)
+
+
+class RoundRobinStrategy:
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, replicas):
+        return replicas[next(self._counter) % len(replicas)]
+
+
+_strategies = {}
+
+
+def get_strategy(path):
+    strategy = _strategies.get(path)
+    if strategy is None:
+        strategy = _strategies[path] = import_string(path)()
+    return strategy
+
+
+class ReplicaRouter:
+    """
+    Send the reads of replica-enabled requests to a replica.
+
+    Replicas hold copies of the primary's tables, so relations between
+    them are allowed and migrations only run on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        replicas = settings.DATABASE_REPLICAS
+        if state is None or state.wrote or not replicas or not state.may_use_replicas():
+            return None
+        return get_strategy(settings.DATABASE_REPLICA_STRATEGY).choose(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def replica_reads(view):
+    """Let a function view read from the replicas, like ``replica_reads = True`` on a view class."""
+    view.replica_reads = True
+    return view
+
+
+def allows_replica_reads(view):
+    if getattr(view, 'replica_reads', False):
+        return True
+    return getattr(getattr(view, 'view_class', None), 'replica_reads', False)
+
+
+def use_primary_after(written_at):
+    """
+    Read from the primary if the last write, at ``written_at`` ns, may not have reached the replicas.
+
+    For responses cached until the next write: built from a lagging
+    replica, they would keep serving the old rows.
+    """
+    state = _state.get()
+    if state is not None and time.time_ns() - written_at < settings.REPLICA_PIN_SECONDS * 1e9:
+        state.use_replicas = False
+
+
+class ReplicaMiddleware(HybridMiddleware):
+    """
+    Route the request's queries and pin clients that wrote to the primary.
+
+    The replica decision is left to the router rather than made in a
+    ``process_view``, which Django would run on a thread in async stacks.
+    """
+
+    def handle(self, request):
+        state = RoutingState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return pin_to_primary(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return pin_to_primary(state, response)
+
+
+def pin_to_primary(state, response):
+    if state.wrote and settings.DATABASE_REPLICAS:
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+    return response
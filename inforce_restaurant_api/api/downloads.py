@@ -0,0 +1,145 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+CACHE_CONTROL = 'public, max-age=86400'
+
+
+class RangeFile:
+    """
+    A file limited to ``length`` bytes from ``start``.
+
+    Reads stop at the end of the range, so servers that iterate the
+    response send exactly that part. ``fileno`` and ``tell`` still reach
+    the open file, so a WSGI ``file_wrapper`` (gunicorn) can ``sendfile``
+    the range straight from the page cache: it starts at the current
+    offset and stops at the Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def close(self):
+        self.file.close()
+
+
+def get_etag(name, stat):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    if DIGEST_RE.match(stem):
+        # Content-addressed files are named by their digest.
+        return quote_etag(stem)
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def parse_range(header, size):
+    """
+    ``(start, length)`` of a single byte range, None to send the whole file.
+
+    Raises ValueError if the range cannot be satisfied. Several ranges in
+    one request are answered with the whole file, as RFC 7233 allows.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError(header)
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def serve_file(request, storage, name):
+    """
+    Respond with the stored file ``name``; Python never reads the body itself.
+
+    Conditional requests get a 304 from the ETag. With
+    ``MENU_FILE_SENDFILE`` set, the body is left to the reverse proxy via
+    ``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache, lighttpd),
+    which also handles ranges. Otherwise single ranges are served here,
+    through the WSGI server's sendfile when it has one. Storages without
+    local paths redirect to the file's URL.
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return HttpResponseRedirect(storage.url(name))
+    stat = os.stat(path)
+    etag = get_etag(name, stat)
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, name, path, stat.st_size, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def _file_response(request, name, path, size, etag):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    mode = settings.MENU_FILE_SENDFILE
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(settings.MENU_FILE_ACCEL_PREFIX.rstrip('/') + '/' + name)
+        else:
+            response['X-Sendfile'] = path
+        response['Content-Disposition'] = f'inline; filename="{os.path.basename(name)}"'
+        return response
+
+    if_range = request.META.get('HTTP_IF_RANGE')
+    try:
+        byte_range = None if if_range and if_range != etag else parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, filename=os.path.basename(name))
+    else:
+        start, length = byte_range
+        response = FileResponse(
+            RangeFile(file, start, length), status=206,
+            content_type=content_type, filename=os.path.basename(name))
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
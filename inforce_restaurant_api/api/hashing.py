@@ -0,0 +1,176 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins at once, try again shortly.'
+    default_code = 'hashing_overloaded'
+
+
+class HashingPool:
+    """
+    Runs password hashing in a pool of worker processes.
+
+    Hashing is deliberately slow. Done on request threads, a burst of
+    logins ties up every thread and core of the web workers, and votes
+    queue behind it. Here at most ``max_workers`` hashes run at once and
+    at most ``max_queued`` more wait; beyond that ``submit`` raises
+    ``HashingOverloaded`` straight away, so a login storm gets quick 503s
+    instead of ever growing latency.
+    """
+
+    def __init__(self, max_workers, max_queued):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, fn, *args, wait=False):
+        """Queue ``fn(*args)``. With ``wait``, block for a free slot instead of raising."""
+        if not self._slots.acquire(blocking=wait):
+            raise HashingOverloaded()
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool for this and later calls.
+                self._reset()
+                future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # forkserver: workers must not inherit the locks and threads
+                # of a busy, multi-threaded server process.
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=django.setup)
+            return self._executor
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def _make_password(password):
+    return make_password(password)
+
+
+def _verify_password(password, encoded):
+    """Check ``password`` and rehash it if ``encoded`` uses an outdated hasher or work factor."""
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False, None
+
+    is_correct = hasher.verify(password, encoded)
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    if is_correct and must_update:
+        return True, make_password(password)
+    if not is_correct and not hasher_changed and must_update:
+        # Take as long as a current hash would, so the work factor of an
+        # account cannot be told from the response time.
+        hasher.harden_runtime(password, encoded)
+    return is_correct, None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE)
+    return _pool
+
+
+def close_hashing_pool():
+    """Stop the worker processes; the next hash starts a pool with the current settings."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def hash_password(password):
+    """Hash ``password`` for storage, off the request thread when the pool is enabled."""
+    if password is None or not settings.PASSWORD_HASHING_WORKERS:
+        return _make_password(password)
+    return get_hashing_pool().run(_make_password, password)
+
+
+def hash_passwords(passwords):
+    """
+    Hash many passwords, in parallel when the pool is enabled.
+
+    Bulk callers wait for free slots rather than getting a 503, and keep at
+    most one hash per worker in flight, so queue room is left for logins.
+    """
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return [_make_password(password) for password in passwords]
+
+    pool = get_hashing_pool()
+    hashes = []
+    pending = deque()
+    for password in passwords:
+        if len(pending) == pool.max_workers:
+            hashes.append(pending.popleft().result())
+        if password is None:
+            pending.append(_done(_make_password(None)))
+        else:
+            pending.append(pool.submit(_make_password, password, wait=True))
+    hashes.extend(future.result() for future in pending)
+    return hashes
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def verify_password(password, encoded):
+    """
+    Check ``password`` against ``encoded``.
+
+    Returns ``(is_correct, new_encoded)``; ``new_encoded`` is the upgraded
+    hash to store when the hasher or its work factor changed, else None.
+    """
+    if not encoded:
+        return False, None
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return _verify_password(password, encoded)
+    return get_hashing_pool().run(_verify_password, password, encoded)
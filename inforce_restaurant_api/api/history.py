@@ -0,0 +1,113 @@
+from django.db import IntegrityError, transaction
+
+from .counters import with_live_votes
+from .leaderboard import rank
+from .models import DailyResult, Menu, get_business_day
+
+# Results of closed business days. Each day's menus are ranked once, when
+# the day is over, into DailyResult rows; historical reports then read
+# those few rows per day instead of counting the Vote table.
+
+
+def rollup_day(day):
+    """Replace the ``DailyResult`` rows of ``day`` with its menus' vote counts and ranks."""
+    entries = rank([
+        {'id': row['id'], 'restaurant_id': row['restaurant_id'], 'votes': row['live_votes']}
+        for row in with_live_votes(Menu.objects.filter(business_day=day)).values('id', 'restaurant_id', 'live_votes')
+    ])
+    with transaction.atomic():
+        DailyResult.objects.filter(business_day=day).delete()
+        DailyResult.objects.bulk_create(
+            DailyResult(
+                business_day=day, restaurant_id=entry['restaurant_id'], menu_id=entry['id'],
+                votes=entry['votes'], rank=entry['rank'])
+            for entry in entries)
+    return len(entries)
+
+
+def pending_days(today=None):
+    """Closed business days with menus but no ``DailyResult`` rows yet."""
+    today = today or get_business_day()
+    menus = Menu.objects.filter(business_day__lt=today).exclude(
+        business_day__in=DailyResult.objects.values('business_day'))
+    return list(menus.order_by('business_day').values_list('business_day', flat=True).distinct())
+
+
+def rollup_closed_days(today=None):
+    """Roll up every pending closed day. Returns the days rolled up."""
+    days = pending_days(today)
+    for day in days:
+        try:
+            rollup_day(day)
+        except IntegrityError:
+            # Another worker rolled the same day up at the same moment.
+            pass
+    return days
+
+
+def get_history(start, end, restaurant_id=None):
+    """
+    Results of the closed days from ``start`` to ``end``, with per-restaurant totals.
+
+    Every day lists its winners and each restaurant's votes, rank and vote
+    share. Restaurants are summed up over the range: days on the list,
+    wins, votes, vote share and win streaks. A streak counts consecutive
+    days with results on which the restaurant ranked first (ties count);
+    days without any menus, like weekends, do not break it.
+    ``restaurant_id`` limits the output to one restaurant, with shares
+    still taken of all votes.
+    """
+    rows = DailyResult.objects.filter(business_day__range=(start, end)).order_by(
+        'business_day', 'rank', 'restaurant_id').values_list(
+        'business_day', 'restaurant_id', 'restaurant__name', 'menu_id', 'votes', 'rank')
+
+    days, totals = [], {}
+    for business_day, restaurant, name, menu, votes, position in rows:
+        if not days or days[-1]['business_day'] != business_day:
+            days.append({'business_day': business_day, 'total_votes': 0, 'winners': [], 'results': []})
+        day = days[-1]
+        day['total_votes'] += votes
+        entry = {'restaurant_id': restaurant, 'restaurant': name, 'menu': menu, 'votes': votes, 'rank': position}
+        day['results'].append(entry)
+        if position == 1:
+            day['winners'].append(name)
+        totals.setdefault(restaurant, {
+            'id': restaurant, 'name': name, 'days': 0, 'wins': 0, 'votes': 0,
+            'vote_share': 0.0, 'longest_streak': 0, 'current_streak': 0})
+
+    total_votes = 0
+    for day in days:
+        total_votes += day['total_votes']
+        winners = set()
+        for entry in day['results']:
+            entry['vote_share'] = share(entry['votes'], day['total_votes'])
+            summary = totals[entry['restaurant_id']]
+            summary['days'] += 1
+            summary['votes'] += entry['votes']
+            if entry['rank'] == 1:
+                summary['wins'] += 1
+                winners.add(entry['restaurant_id'])
+        for restaurant, summary in totals.items():
+            summary['current_streak'] = summary['current_streak'] + 1 if restaurant in winners else 0
+            summary['longest_streak'] = max(summary['longest_streak'], summary['current_streak'])
+        day['business_day'] = day['business_day'].isoformat()
+
+    restaurants = sorted(totals.values(), key=lambda summary: (-summary['wins'], -summary['votes'], summary['id']))
+    for summary in restaurants:
+        summary['vote_share'] = share(summary['votes'], total_votes)
+    if restaurant_id is not None:
+        restaurants = [summary for summary in restaurants if summary['id'] == restaurant_id]
+        for day in days:
+            day['results'] = [entry for entry in day['results'] if entry['restaurant_id'] == restaurant_id]
+
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'total_votes': total_votes,
+        'days': days,
+        'restaurants': restaurants,
+    }
+
+
+def share(votes, total):
+    return round(votes / total, 4) if total else 0.0
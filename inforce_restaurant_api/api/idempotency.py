@@ -0,0 +1,63 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+
+# Idempotency keys for the vote endpoints.
+#
+# A client that never got the answer to a request sends it again with the
+# same Idempotency-Key header. The first request with a key stores its
+# response in the shared cache for IDEMPOTENCY_KEY_TTL seconds, and
+# repeats get that response back instead of running again. Keys belong to
+# an employee; one reused for a different request is answered with 422,
+# and one whose first request is still running with 409.
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY = 'api:idempotency:{}:{}'
+MAX_KEY_LENGTH = 255
+# How long a request holds its key; longer than any request runs, short
+# enough that a worker dying mid-request does not lock the client out.
+RUNNING_TIMEOUT = 60
+
+
+def run_idempotent(request, employee_id, fingerprint, action):
+    """
+    The ``(payload, status)`` of ``action()``, or of the first request with the same idempotency key.
+
+    ``fingerprint`` identifies what the request does, e.g. its method and
+    arguments. Returns ``(payload, status, replayed)``.
+    """
+    key = request.META.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return (*action(), False)
+    if len(key) > MAX_KEY_LENGTH:
+        res = {"msg": f'Idempotency-Key is longer than {MAX_KEY_LENGTH} characters.', "data": None, "success": False}
+        return res, status.HTTP_400_BAD_REQUEST, False
+
+    cache_key = KEY.format(employee_id, hashlib.sha256(key.encode()).hexdigest())
+    if not cache.add(cache_key, (fingerprint, None), RUNNING_TIMEOUT):
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return replay(fingerprint, *stored)
+        # Expired in between: this request runs after all.
+        cache.set(cache_key, (fingerprint, None), RUNNING_TIMEOUT)
+
+    try:
+        res, status_code = action()
+    except BaseException:
+        cache.delete(cache_key)
+        raise
+    cache.set(cache_key, (fingerprint, (res, status_code)), settings.IDEMPOTENCY_KEY_TTL)
+    return res, status_code, False
+
+
+def replay(fingerprint, stored_fingerprint, response):
+    if stored_fingerprint != fingerprint:
+        res = {"msg": 'This Idempotency-Key was used for a different request.', "data": None, "success": False}
+        return res, status.HTTP_422_UNPROCESSABLE_ENTITY, False
+    if response is None:
+        res = {"msg": 'A request with this Idempotency-Key is still in progress.', "data": None, "success": False}
+        return res, status.HTTP_409_CONFLICT, False
+    return (*response, True)
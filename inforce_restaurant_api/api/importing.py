@@ -0,0 +1,156 @@
+import codecs
+import csv
+import json
+import os
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .hashing import hash_passwords
+from .models import User, Employee
+from .serializers import EmployeeImportSerializer
+
+FORMATS = ('csv', 'ndjson')
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.created = 0
+        self.rejected = []
+
+    def reject(self, row, errors):
+        self.rejected.append({"row": row, "errors": errors})
+
+    def as_dict(self):
+        return {"created": self.created, "rejected": self.rejected}
+
+
+def guess_format(name, content_type=None):
+    extension = os.path.splitext(name or '')[1].lower()
+    if extension == '.csv' or content_type == 'text/csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl') or content_type in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return None
+
+
+def read_rows(stream, format):
+    """
+    Yield ``(row_number, row)`` from a binary CSV or NDJSON stream, one row at a time.
+
+    ``row`` is None for a line that could not be parsed. Row numbers count
+    lines of the file, including the CSV header, so they can be looked up
+    in an editor.
+    """
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            row.pop(None, None)
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+
+
+def import_employees(rows, created_by=None, chunk_size=500):
+    """
+    Create employees (and their users) from ``(row_number, row)`` pairs.
+
+    Rows are validated and inserted ``chunk_size`` at a time: duplicates of
+    existing emails, usernames and employee numbers are found with one
+    query per table per chunk, the chunk's passwords are hashed in
+    parallel, and users and employees are inserted with one
+    ``bulk_create`` each in a transaction. Returns an ``ImportReport``.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            report.rejected.sort(key=lambda rejected: rejected["row"])
+            return report
+        _import_chunk(chunk, created_by, report)
+
+
+def _import_chunk(chunk, created_by, report):
+    valid = []
+    for number, row in chunk:
+        if row is None:
+            report.reject(number, {"row": ["Could not parse this row."]})
+            continue
+        serializer = EmployeeImportSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            report.reject(number, serializer.errors)
+    if not valid:
+        return
+
+    passwords = hash_passwords([data.get('password') or None for _, data in valid])
+    try:
+        with transaction.atomic():
+            report.created += _insert_employees(valid, passwords, created_by, report)
+    except IntegrityError:
+        # Someone created a clashing user between the check and the insert.
+        with transaction.atomic():
+            report.created += _insert_employees(valid, passwords, created_by, report)
+
+
+def _insert_employees(valid, passwords, created_by, report):
+    emails = {data['email'] for _, data in valid}
+    usernames = {data['username'] for _, data in valid}
+    taken_emails, taken_usernames = set(), set()
+    for email, username in User.objects.filter(
+            Q(email__in=emails) | Q(username__in=usernames)).values_list('email', 'username'):
+        taken_emails.add(email)
+        taken_usernames.add(username)
+    taken_numbers = set(Employee.objects.filter(
+        employee_no__in={data['employee_no'] for _, data in valid}).values_list('employee_no', flat=True))
+
+    users, employees = [], []
+    rejected = []
+    for (number, data), password in zip(valid, passwords):
+        errors = {}
+        if data['email'] in taken_emails:
+            errors['email'] = [f"User with email {data['email']} already exists."]
+        if data['username'] in taken_usernames:
+            errors['username'] = [f"User with username {data['username']} already exists."]
+        if data['employee_no'] in taken_numbers:
+            errors['employee_no'] = [f"EMPLOYEE NO {data['employee_no']} already exists"]
+        if errors:
+            rejected.append((number, errors))
+            continue
+        # Later rows of the same upload clash with this one.
+        taken_emails.add(data['email'])
+        taken_usernames.add(data['username'])
+        taken_numbers.add(data['employee_no'])
+
+        user = User(
+            email=data['email'],
+            first_name=data['first_name'].capitalize(),
+            last_name=data['last_name'].capitalize(),
+            username=data['username'],
+            is_active=True,
+            phone=data['phone'],
+            is_staff=True,
+            created_by=created_by,
+            password=password,
+        )
+        users.append(user)
+        employees.append(Employee(user=user, employee_no=data['employee_no'], created_by=created_by))
+
+    User.objects.bulk_create(users)
+    Employee.objects.bulk_create(employees)
+    # Only report rejections once the chunk is in, so a retry does not repeat them.
+    for number, errors in rejected:
+        report.reject(number, errors)
+    return len(employees)
@@ -0,0 +1,259 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from .counters import increment_menu_votes
+from .models import Employee, Menu, Vote, get_business_day, get_current_time
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    """
+    In-process write-behind buffer for votes.
+
+    Accepted votes are kept in memory and written with one ``bulk_create``
+    plus one counter update per menu, either when ``max_size`` votes are
+    pending or every ``flush_interval`` seconds. When ``journal_dir`` is
+    set, every vote is appended and fsync'd to a per-process journal before
+    it is acknowledged, and journals left behind by a crashed worker are
+    replayed the next time a buffer is started.
+    """
+
+    def __init__(self, max_size=500, flush_interval=1.0, journal_dir=None):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.journal_dir = journal_dir
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._pending_keys = set()
+        self._segments = []
+        self._journal = None
+        self._segment_no = 0
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+            self.replay_journals()
+            self._open_journal()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='vote-buffer-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, employee_id, menu_id, voted_at=None):
+        """Buffer a vote. Returns False if the employee already has a pending vote that day."""
+        voted_at = voted_at or get_current_time()
+        key = (employee_id, get_business_day(voted_at))
+        with self._lock:
+            if key in self._pending_keys:
+                return False
+            if self._journal is not None:
+                self._write_journal(employee_id, menu_id, voted_at)
+            self._pending.append((employee_id, menu_id, voted_at))
+            self._pending_keys.add(key)
+            pending = len(self._pending)
+
+        if pending >= self.max_size:
+            if self._thread is None:
+                self.flush()
+            else:
+                self._wakeup.set()
+        return True
+
+    def is_pending(self, employee_id, day):
+        return (employee_id, day) in self._pending_keys
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write all pending votes to the database. Returns the number inserted."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+                keys, self._pending_keys = self._pending_keys, set()
+                segments = self._rotate_journal()
+
+            try:
+                inserted = write_votes(batch)
+            except Exception:
+                with self._lock:
+                    self._pending = batch + self._pending
+                    self._pending_keys |= keys
+                    self._segments = segments + self._segments
+                raise
+
+            for path, journal in segments:
+                os.remove(path)
+                journal.close()
+            return inserted
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        try:
+            self.flush()
+        finally:
+            if self._journal is not None:
+                os.remove(self._journal.name)
+                self._journal.close()
+                self._journal = None
+
+    def replay_journals(self):
+        """Write votes from journals whose owning process is gone."""
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, 'votes-*.journal*'))):
+            with open(path, 'r+') as journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                batch = []
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line was never acknowledged.
+                        continue
+                    batch.append((entry['employee'], entry['menu'], datetime.fromisoformat(entry['voted_at'])))
+                try:
+                    replayed += write_votes(batch)
+                except Exception:
+                    # Leave the journal for the next start rather than
+                    # keep the buffer, and every vote after it, from starting.
+                    logger.exception('Could not replay the journaled votes of %s', path)
+                    continue
+                os.remove(path)
+        if replayed:
+            logger.info('Replayed %s journaled votes', replayed)
+        return replayed
+
+    def _run(self):
+        try:
+            while not self._closed.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Vote buffer flush failed, keeping %s votes pending', len(self._pending))
+                finally:
+                    connection.close()
+        finally:
+            connection.close()
+
+    def _open_journal(self):
+        path = os.path.join(self.journal_dir, f'votes-{os.getpid()}.journal')
+        self._journal = open(path, 'a')
+        fcntl.flock(self._journal, fcntl.LOCK_EX)
+
+    def _write_journal(self, employee_id, menu_id, voted_at):
+        entry = {'employee': employee_id, 'menu': menu_id, 'voted_at': voted_at.isoformat()}
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self):
+        if self._journal is None:
+            return []
+        self._segment_no += 1
+        segment = f'{self._journal.name}.{self._segment_no}'
+        # The lock travels with the renamed file, so a replaying worker
+        # cannot pick the segment up while this flush is in progress.
+        os.rename(self._journal.name, segment)
+        segments, self._segments = self._segments + [(segment, self._journal)], []
+        self._open_journal()
+        return segments
+
+
+def write_votes(batch):
+    """
+    Insert buffered ``(employee_id, menu_id, voted_at)`` votes.
+
+    Votes of employees who already voted that day (for example after a
+    journal replay, or a concurrent unbuffered vote) are skipped, and so
+    are votes whose menu or employee was deleted while they were buffered,
+    which would otherwise fail the whole batch. Returns the number of
+    votes inserted.
+    """
+    if not batch:
+        return 0
+
+    try:
+        with transaction.atomic():
+            return _insert_votes(batch)
+    except IntegrityError:
+        # Someone voted between the lookup and the insert; look again.
+        with transaction.atomic():
+            return _insert_votes(batch)
+
+
+def _insert_votes(batch):
+    batch = [
+        (employee_id, menu_id, voted_at, get_business_day(voted_at))
+        for employee_id, menu_id, voted_at in batch
+    ]
+    menus = set(Menu.objects.filter(id__in={vote[1] for vote in batch}).values_list('id', flat=True))
+    employees = set(Employee.objects.filter(id__in={vote[0] for vote in batch}).values_list('id', flat=True))
+    existing = set(Vote.objects.filter(
+        employee_id__in={vote[0] for vote in batch},
+        business_day__in={vote[3] for vote in batch},
+    ).values_list('employee_id', 'business_day'))
+    votes = []
+    for employee_id, menu_id, voted_at, day in batch:
+        if menu_id not in menus or employee_id not in employees:
+            logger.warning('Dropping the buffered vote of employee %s for menu %s: one of them was deleted',
+                           employee_id, menu_id)
+            continue
+        if (employee_id, day) in existing:
+            continue
+        existing.add((employee_id, day))
+        votes.append(Vote(employee_id=employee_id, menu_id=menu_id, voted_at=voted_at, business_day=day))
+
+    Vote.objects.bulk_create(votes)
+    for menu_id, amount in Counter(vote.menu_id for vote in votes).items():
+        increment_menu_votes(menu_id, amount)
+    return len(votes)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                buffer = VoteBuffer(
+                    max_size=settings.VOTE_BUFFER_MAX_SIZE,
+                    flush_interval=settings.VOTE_BUFFER_FLUSH_INTERVAL,
+                    journal_dir=settings.VOTE_BUFFER_JOURNAL_DIR,
+                )
+                buffer.start()
+                _buffer = buffer
+    return _buffer
+
+
+def is_buffered():
+    return settings.VOTE_INGESTION == 'buffered'
@@ -0,0 +1,308 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .counters import with_live_votes
+from .listing import ranking_entries
+from .models import Menu, get_business_day
+
+MAGIC = b'LDB2'
+# magic, capacity, day ordinal, menu count, version, loads
+HEADER = struct.Struct('<4siiiQQ')
+HEADER_SIZE = 32
+# menu id, votes, restaurant name, file url, created_at
+SLOT = struct.Struct('<qq1024s512s32s')
+
+
+class Leaderboard:
+    """
+    Today's menus and their vote counts in a memory-mapped file.
+
+    Every worker process on a node maps the same file, so a vote recorded
+    by one worker is immediately visible to the others. Writers serialise
+    on an exclusive ``flock`` (plus a thread lock, since ``flock`` does not
+    exclude threads sharing a descriptor); readers take a shared lock. The
+    board is only rebuilt from the database when it does not hold the
+    requested day, i.e. after a reboot or at day rollover.
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.size = HEADER_SIZE + SLOT.size * capacity
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked(fcntl.LOCK_EX):
+            if os.fstat(self._fd).st_size != self.size:
+                os.ftruncate(self._fd, self.size)
+            self._map = mmap.mmap(self._fd, self.size)
+            magic, capacity, *_ = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or capacity != self.capacity:
+                self._write_header(0, 0, 0, 0)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def get_ranking(self, day):
+        """Return today's ranking, or None if the board does not hold ``day``."""
+        with self._locked(fcntl.LOCK_SH):
+            _, _, board_day, count, _, _ = self._read_header()
+            if board_day != day.toordinal():
+                return None
+            entries = [self._read_slot(index) for index in range(count)]
+        return rank(entries)
+
+    def get_version(self):
+        with self._locked(fcntl.LOCK_SH):
+            return self._read_header()[4]
+
+    def get_loads(self):
+        """How often the board, or a menu on it, has been read from the database; see ``record_votes``."""
+        with self._locked(fcntl.LOCK_SH):
+            return self._read_header()[5]
+
+    def load(self, day, entries):
+        """Replace the board with ``entries`` for ``day``. Returns False if they do not fit."""
+        with self._locked(fcntl.LOCK_EX):
+            return self._load(day, entries)
+
+    def load_missing(self, day, read_entries):
+        """
+        Return the ranking of ``day``, loading ``read_entries()`` first unless the board holds it.
+
+        The entries are read under the exclusive lock: votes recorded
+        meanwhile wait for the board to hold the day instead of missing it,
+        and a worker loading at the same time finds the day already there
+        instead of overwriting the votes recorded since.
+        """
+        with self._locked(fcntl.LOCK_EX):
+            _, _, board_day, count, _, _ = self._read_header()
+            if board_day == day.toordinal():
+                entries = [self._read_slot(index) for index in range(count)]
+            else:
+                entries = read_entries()
+                self._load(day, entries)
+        return rank(entries)
+
+    def _load(self, day, entries):
+        *_, version, loads = self._read_header()
+        if len(entries) > self.capacity:
+            self._write_header(0, 0, version + 1, loads + 1)
+            return False
+        for index, entry in enumerate(entries):
+            self._write_slot(index, entry)
+        self._write_header(day.toordinal(), len(entries), version + 1, loads + 1)
+        return True
+
+    def add_menu(self, day, entry):
+        with self._locked(fcntl.LOCK_EX):
+            _, _, board_day, count, version, loads = self._read_header()
+            if board_day != day.toordinal() or self._find(count, entry['id']) is not None:
+                return
+            if count == self.capacity:
+                # Too many menus to track; fall back to the database.
+                self._write_header(0, 0, version + 1, loads)
+                return
+            self._write_slot(count, entry)
+            self._write_header(board_day, count + 1, version + 1, loads)
+
+    def record_votes(self, menu_id, amount=1, loads=None, read_votes=None):
+        """
+        Add ``amount`` votes to a menu.
+
+        ``loads`` is ``get_loads()`` from before the votes were committed.
+        If the board has been read from the database since, that read may
+        already include them, so the menu's count is set from
+        ``read_votes()`` (None for a deleted menu) instead of incremented.
+        """
+        with self._locked(fcntl.LOCK_EX):
+            _, _, board_day, count, version, board_loads = self._read_header()
+            index = self._find(count, menu_id)
+            if index is None:
+                return
+            offset = HEADER_SIZE + SLOT.size * index
+            if loads is not None and loads != board_loads:
+                votes = read_votes()
+                if votes is None:
+                    return
+                # Votes whose loads predate this read may be in it as well.
+                board_loads += 1
+            else:
+                votes = struct.unpack_from('<q', self._map, offset + 8)[0] + amount
+            struct.pack_into('<q', self._map, offset + 8, votes)
+            self._write_header(board_day, count, version + 1, board_loads)
+
+    def remove_menu(self, menu_id):
+        with self._locked(fcntl.LOCK_EX):
+            _, _, board_day, count, version, loads = self._read_header()
+            index = self._find(count, menu_id)
+            if index is None:
+                return
+            # Move the last slot into the freed one.
+            last = HEADER_SIZE + SLOT.size * (count - 1)
+            if index != count - 1:
+                offset = HEADER_SIZE + SLOT.size * index
+                self._map[offset:offset + SLOT.size] = self._map[last:last + SLOT.size]
+            self._write_header(board_day, count - 1, version + 1, loads)
+
+    def reset(self):
+        with self._locked(fcntl.LOCK_EX):
+            *_, version, loads = self._read_header()
+            self._write_header(0, 0, version + 1, loads + 1)
+
+    def _find(self, count, menu_id):
+        for index in range(count):
+            if struct.unpack_from('<q', self._map, HEADER_SIZE + SLOT.size * index)[0] == menu_id:
+                return index
+        return None
+
+    def _read_header(self):
+        return HEADER.unpack_from(self._map, 0)
+
+    def _write_header(self, day, count, version, loads):
+        HEADER.pack_into(self._map, 0, MAGIC, self.capacity, day, count, version, loads)
+
+    def _read_slot(self, index):
+        menu_id, votes, restaurant, file, created_at = SLOT.unpack_from(self._map, HEADER_SIZE + SLOT.size * index)
+        return {
+            'id': menu_id,
+            'file': _decode(file),
+            'restaurant': _decode(restaurant),
+            'votes': votes,
+            'created_at': _decode(created_at),
+        }
+
+    def _write_slot(self, index, entry):
+        SLOT.pack_into(
+            self._map,
+            HEADER_SIZE + SLOT.size * index,
+            entry['id'],
+            entry['votes'],
+            _encode(entry['restaurant'], 1024),
+            _encode(entry['file'], 512),
+            _encode(entry['created_at'], 32),
+        )
+
+    def _locked(self, operation):
+        return _FileLock(self._lock, self._fd, operation)
+
+
+class _FileLock:
+
+    def __init__(self, lock, fd, operation):
+        self.lock = lock
+        self.fd = fd
+        self.operation = operation
+
+    def __enter__(self):
+        self.lock.acquire()
+        fcntl.flock(self.fd, self.operation)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+def _encode(value, size):
+    # Cut on a character boundary so a long value still decodes.
+    return (value or '').encode()[:size].decode(errors='ignore').encode()
+
+
+def _decode(value):
+    return value.rstrip(b'\0').decode()
+
+
+def rank(entries):
+    """
+    Order entries by votes and assign standard competition ranks.
+
+    Tied menus share a rank and the next rank is skipped (1, 2, 2, 4);
+    ties are listed by menu id so the order is stable between polls.
+    """
+    entries = sorted(entries, key=lambda entry: (-entry['votes'], entry['id']))
+    previous_votes = None
+    for position, entry in enumerate(entries, start=1):
+        if entry['votes'] != previous_votes:
+            current_rank = position
+            previous_votes = entry['votes']
+        entry['rank'] = current_rank
+    return entries
+
+
+def menu_entry(menu, votes):
+    return {
+        'id': menu.id,
+        'file': menu.file.url if menu.file else None,
+        'restaurant': menu.restaurant.name,
+        'votes': votes,
+        'created_at': menu.created_at.isoformat(),
+    }
+
+
+def get_default_path():
+    # Derive the name from the database so separate deployments and the
+    # test database never share a board.
+    digest = hashlib.sha1(str(connection.settings_dict['NAME']).encode()).hexdigest()[:12]
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f'restaurant_api_leaderboard-{digest}')
+
+
+_board = None
+_board_lock = threading.Lock()
+
+
+def get_leaderboard():
+    global _board
+    if _board is None:
+        with _board_lock:
+            if _board is None:
+                _board = Leaderboard(
+                    settings.LEADERBOARD_PATH or get_default_path(),
+                    settings.LEADERBOARD_CAPACITY)
+    return _board
+
+
+def load_from_database(day):
+    return get_leaderboard().load_missing(day, lambda: ranking_entries(day))
+
+
+def get_ranking(day=None):
+    """Today's ranking from shared memory, rebuilding it from the database if needed."""
+    day = day or get_business_day()
+    ranking = get_leaderboard().get_ranking(day)
+    if ranking is None:
+        ranking = load_from_database(day)
+    return ranking
+
+
+def record_votes_on_commit(menu_id, amount=1):
+    """
+    Add ``amount`` votes to a menu once the current transaction commits.
+
+    A worker may reload the board between the commit and the callback and
+    read these votes from the database already; the board's load count,
+    taken now, tells ``Leaderboard.record_votes`` not to add them again.
+    """
+    board = get_leaderboard()
+    loads = board.get_loads()
+    transaction.on_commit(lambda: board.record_votes(menu_id, amount, loads, lambda: read_menu_votes(menu_id)))
+
+
+def read_menu_votes(menu_id):
+    return with_live_votes(Menu.objects.filter(id=menu_id)).values_list('live_votes', flat=True).first()
+
+
+def remove_menu(menu_id):
+    get_leaderboard().remove_menu(menu_id)
+
+
+def add_menu(menu):
+    get_leaderboard().add_menu(menu.business_day, menu_entry(menu, menu.votes))
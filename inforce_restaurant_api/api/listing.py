@@ -0,0 +1,59 @@
+from rest_framework import serializers
+
+from .counters import with_live_votes
+from .models import Menu
+
+# Read path of the menu list and results. Menus are fetched as flat rows
+# (restaurant name, live vote count and all) with one joined query, and
+# turned into the exact output of MenuListSerializer without building
+# model instances or running DRF's per-field machinery for every row.
+
+MENU_ROW_FIELDS = (
+    'id', 'restaurant__name', 'live_votes', 'file', 'created_at', 'updated_at', 'uploaded_by', 'business_day')
+
+_datetime = serializers.DateTimeField().to_representation
+_date = serializers.DateField().to_representation
+
+
+def menu_rows(queryset=None):
+    """``values()`` rows of the menus in ``queryset`` with their live vote counts."""
+    queryset = Menu.objects.all() if queryset is None else queryset
+    return with_live_votes(queryset).values(*MENU_ROW_FIELDS)
+
+
+def file_url(name, request=None):
+    if not name:
+        return None
+    url = Menu._meta.get_field('file').storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def serialize_menu_rows(rows, request=None):
+    """The ``MenuListSerializer(many=True).data`` of ``rows``, key for key."""
+    return [
+        {
+            'id': row['id'],
+            'restaurant': row['restaurant__name'],
+            'votes': row['live_votes'],
+            'file': file_url(row['file'], request),
+            'created_at': _datetime(row['created_at']),
+            'updated_at': _datetime(row['updated_at']),
+            'uploaded_by': row['uploaded_by'],
+            'business_day': _date(row['business_day']),
+        }
+        for row in rows
+    ]
+
+
+def ranking_entries(day):
+    """Leaderboard entries of the menus of ``day``, from one query."""
+    return [
+        {
+            'id': row['id'],
+            'file': file_url(row['file']),
+            'restaurant': row['restaurant__name'],
+            'votes': row['live_votes'],
+            'created_at': row['created_at'].isoformat(),
+        }
+        for row in menu_rows(Menu.objects.filter(business_day=day))
+    ]
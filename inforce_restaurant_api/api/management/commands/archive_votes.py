@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_votes
+
+
+class Command(BaseCommand):
+    help = ('Move closed months of votes out of the hot Vote table (or create the coming monthly '
+            'partitions on PostgreSQL), export them to gzipped NDJSON and prune those past '
+            'VOTE_RETENTION_DAYS. Run it daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--export-dir', default=settings.VOTE_ARCHIVE_DIR,
+            help='Directory of the votes-YYYY-MM.ndjson.gz exports (default: VOTE_ARCHIVE_DIR).')
+
+    def handle(self, *args, **options):
+        report = archive_votes(options['export_dir'])
+        for month in report.partitions:
+            self.stdout.write(f'Created the partition of {month:%Y-%m}.')
+        for month, count in report.archived.items():
+            self.stdout.write(f'Archived {count} votes of {month:%Y-%m}.')
+        for month, count in report.exported.items():
+            self.stdout.write(f'Exported {count} votes of {month:%Y-%m}.')
+        for month in report.pruned:
+            self.stdout.write(f'Pruned the votes of {month:%Y-%m}.')
+        for month in report.not_exported:
+            self.stderr.write(self.style.WARNING(f'Kept the votes of {month:%Y-%m}: they have not been exported.'))
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import Timer, benchmark_database, create_employees, format_rate
+from api.hashing import close_hashing_pool
+from api.models import User
+from api.views import UserLoginAPIView
+
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = ('Measure logins per second with password hashing on the request threads and in '
+            'hashing process pools of one and of --workers processes, in-process on a throwaway database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Logins per run.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Logins in flight at once.')
+        parser.add_argument('--workers', type=int, default=settings.PASSWORD_HASHING_WORKERS,
+                            help='Hashing processes for the full pool run.')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = UserLoginAPIView.as_view()
+
+        def login(request):
+            try:
+                return view(request).status_code
+            finally:
+                connections.close_all()
+
+        with benchmark_database():
+            users = create_employees(options['logins'])
+            User.objects.update(password=make_password(PASSWORD))
+
+            for workers in sorted({0, 1, max(options['workers'], 1)}):
+                requests = [
+                    factory.post(reverse('api:login'), {'email': user.email, 'password': PASSWORD}, format='json')
+                    for user in users
+                ]
+                # Let every login queue, so the run measures throughput rather than 503s.
+                with override_settings(PASSWORD_HASHING_WORKERS=workers, PASSWORD_HASHING_QUEUE=len(requests)):
+                    try:
+                        with ThreadPoolExecutor(options['concurrency']) as pool, Timer() as timer:
+                            codes = list(pool.map(login, requests))
+                    finally:
+                        close_hashing_pool()
+
+                rate = format_rate(len(codes), timer.elapsed)
+                if workers:
+                    per_core = format_rate(len(codes) / workers, timer.elapsed)
+                    self.stdout.write(f'pool of {workers:<3} {rate:>12}   {per_core:>12} per process')
+                else:
+                    self.stdout.write(f'inline      {rate:>12}')
+                failed = sum(code != 202 for code in codes)
+                if failed:
+                    self.stderr.write(self.style.WARNING(f'{failed} logins failed'))
@@ -0,0 +1,156 @@
+import json
+import random
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from api.benchmarks import (
+    EndpointStats, HTTPClient, InProcessClient, benchmark_database, compare_baseline, create_employees,
+    create_menus, delete_menus, run_phase)
+from api.hashing import close_hashing_pool
+from api.models import Restaurant, User
+from api.token import get_token
+
+PASSWORD = 'lunch-rush-password'
+PREFIX = 'lunch-rush'
+PHASES = ('login', 'menu_list', 'vote', 'results')
+
+
+class Command(BaseCommand):
+    help = ('Replay a lunch rush (login burst, menu list polling, vote spike, results polling) and '
+            'report throughput, p50/p95/p99 latency and queries per request for each endpoint. Runs '
+            'in-process on a throwaway database, or against a local server with --url.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=20, help="Restaurants with a menu on today's list.")
+        parser.add_argument('--employees', type=int, default=200, help='Employees who poll and vote.')
+        parser.add_argument(
+            '--logins', type=int, default=50,
+            help='Employees who log in during the burst. Logins turned away with 503 by a full '
+                 'hashing queue count as errors.')
+        parser.add_argument('--polls', type=int, default=5, help='Polls of the menu list and of the results per employee.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once.')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the vote choices.')
+        parser.add_argument(
+            '--url', help='Base URL of a local server to load instead, e.g. http://127.0.0.1:8000. '
+                          'Its data is seeded into (and removed from) the configured database.')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', metavar='PATH', help='Compare the results with this JSON baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Fraction by which latency and throughput may drift from the baseline.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = json.load(file)['endpoints']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not read the baseline {options['compare']}: {e}")
+
+        client = HTTPClient(options['url']) if options['url'] else InProcessClient()
+        with self.seeded(options) as (menus, users):
+            try:
+                stats = self.run(client, menus, users, options)
+            finally:
+                close_hashing_pool()
+
+        endpoints = {name: stats[name].as_dict() for name in PHASES}
+        self.report(endpoints)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as file:
+                json.dump({
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'mode': 'http' if options['url'] else 'in-process',
+                    'options': {name: options[name] for name in (
+                        'restaurants', 'employees', 'logins', 'polls', 'concurrency', 'seed')},
+                    'endpoints': endpoints,
+                }, file, indent=2)
+            self.stdout.write(f"Saved the baseline to {options['save_baseline']}.")
+        if baseline is not None:
+            regressions = compare_baseline(endpoints, baseline, options['tolerance'])
+            for regression in regressions:
+                self.stderr.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}.')
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}."))
+
+    @contextmanager
+    def seeded(self, options):
+        if options['url']:
+            if Restaurant.objects.filter(name__startswith=PREFIX).exists():
+                raise CommandError(f'Restaurants named "{PREFIX} ..." exist; remove them or finish the last run.')
+            try:
+                yield self.seed(options)
+            finally:
+                # Deleting the restaurants takes their menus, files and votes along.
+                Restaurant.objects.filter(name__startswith=PREFIX).delete()
+                User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+        else:
+            with benchmark_database():
+                menus, users = self.seed(options)
+                try:
+                    yield menus, users
+                finally:
+                    delete_menus(menus)
+
+    def seed(self, options):
+        menus = create_menus(options['restaurants'], prefix=PREFIX)
+        users = create_employees(options['employees'], prefix=PREFIX)
+        User.objects.filter(id__in=[user.id for user in users]).update(password=make_password(PASSWORD))
+        return menus, users
+
+    def run(self, client, menus, users, options):
+        stats = {name: EndpointStats() for name in PHASES}
+        concurrency = options['concurrency']
+        tokens = [f"Bearer {get_token(user)['access']}" for user in users]
+
+        login_url = reverse('api:login')
+        run_phase([
+            lambda user=user: client.request('POST', login_url, body={'email': user.email, 'password': PASSWORD})
+            for user in users[:options['logins']]
+        ], stats['login'], concurrency)
+
+        self.poll(client, reverse('api:menu-list'), tokens, options['polls'], stats['menu_list'], concurrency)
+
+        # A few favourites get most of the votes.
+        choices = random.Random(options['seed']).choices(
+            menus, weights=[1 / (rank + 1) for rank in range(len(menus))], k=len(tokens))
+        run_phase([
+            lambda token=token, menu=menu: client.request(
+                'GET', reverse('api:new-vote', kwargs={'menu_id': menu.id}), headers={'Authorization': token})
+            for token, menu in zip(tokens, choices)
+        ], stats['vote'], concurrency)
+
+        self.poll(client, reverse('api:results'), tokens, options['polls'], stats['results'], concurrency)
+        return stats
+
+    def poll(self, client, url, tokens, rounds, stats, concurrency):
+        """Every employee polls ``url`` ``rounds`` times, revalidating with the last ETag it got."""
+        etags = {}
+
+        def fetch(number):
+            headers = {'Authorization': tokens[number]}
+            if number in etags:
+                headers['If-None-Match'] = etags[number]
+            result = client.request('GET', url, headers=headers)
+            if result.etag:
+                etags[number] = result.etag
+            return result
+
+        for _ in range(rounds):
+            run_phase([lambda number=number: fetch(number) for number in range(len(tokens))], stats, concurrency)
+
+    def report(self, endpoints):
+        self.stdout.write(
+            f"{'endpoint':<10} {'requests':>8} {'errors':>6} {'req/s':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+        for name, stats in endpoints.items():
+            values = [stats[key] for key in ('throughput', 'p50', 'p95', 'p99', 'queries')]
+            throughput, p50, p95, p99, queries = ('n/a' if value is None else value for value in values)
+            self.stdout.write(
+                f"{name:<10} {stats['requests']:>8} {stats['errors']:>6} {throughput:>9} "
+                f"{p50:>8} {p95:>8} {p99:>8} {queries:>8}")
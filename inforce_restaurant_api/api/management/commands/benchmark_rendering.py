@@ -0,0 +1,53 @@
+import io
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api import renderers
+from api.benchmarks import Timer, benchmark_database, create_menus, delete_menus
+from api.models import Menu, get_business_day
+from api.renderers import ORJSONParser, ORJSONRenderer
+from api.serializers import MenuListSerializer
+from api.views import get_menu_list_data
+
+
+class Command(BaseCommand):
+    help = ("Time rendering and parsing a business day's menu list with DRF's JSON classes "
+            'and with the orjson ones, on a throwaway database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menus', type=int, default=500, help="Menus on today's list.")
+        parser.add_argument('--repeat', type=int, default=200, help='Renders and parses per variant.')
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            self.stderr.write(self.style.WARNING('orjson is not installed; the orjson classes fall back to json.'))
+        with benchmark_database():
+            menus = create_menus(options['menus'])
+            try:
+                self.run(options['repeat'])
+            finally:
+                delete_menus(menus)
+
+    def run(self, repeat):
+        today = get_business_day()
+        envelope = get_menu_list_data(today)
+        serializer_data = {
+            "msg": 'success',
+            "data": MenuListSerializer(Menu.objects.filter(business_day=today), many=True).data,
+            "success": True}
+        body = ORJSONRenderer().render(envelope)
+        self.stdout.write(f'{len(envelope["data"])} menus, {len(body):,} bytes')
+
+        self.report('serializer + JSONRenderer', repeat, lambda: JSONRenderer().render(serializer_data))
+        self.report('rows + JSONRenderer', repeat, lambda: JSONRenderer().render(envelope.as_dict()))
+        self.report('rows + ORJSONRenderer', repeat, lambda: ORJSONRenderer().render(envelope))
+        self.report('JSONParser', repeat, lambda: JSONParser().parse(io.BytesIO(body)))
+        self.report('ORJSONParser', repeat, lambda: ORJSONParser().parse(io.BytesIO(body)))
+
+    def report(self, name, repeat, run):
+        with Timer() as timer:
+            for _ in range(repeat):
+                run()
+        self.stdout.write(f'{name:<26} {timer.elapsed / repeat * 1000:8.3f} ms')
@@ -0,0 +1,59 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import Timer
+from api.tally import Tally
+
+
+class Command(BaseCommand):
+    help = ('Time the ranked-choice tally: adding ballots one by one, reading the IRV and Borda '
+            'results after each new ballot, and recounting every IRV round from scratch. No database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ballots', type=int, default=10000, help='Ballots in the tally.')
+        parser.add_argument('--menus', type=int, default=12, help='Menus on the ballot.')
+        parser.add_argument('--ranked', type=int, default=5, help='Most menus a ballot ranks.')
+        parser.add_argument('--repeat', type=int, default=200, help='Ballots added after the tally is full.')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the ballots.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        menus = list(range(1, options['menus'] + 1))
+        # A few favourites get most of the first choices.
+        weights = [1 / rank for rank in range(1, len(menus) + 1)]
+
+        def ballot():
+            first = rng.choices(menus, weights)[0]
+            rest = rng.sample([menu for menu in menus if menu != first], min(options['ranked'], len(menus)) - 1)
+            return [first] + rest[:rng.randint(0, len(rest))]
+
+        tally = Tally(menus)
+        ballots = [ballot() for _ in range(options['ballots'])]
+        with Timer() as timer:
+            for ranking in ballots:
+                tally.add(ranking)
+        self.report(f'add {len(ballots)} ballots', timer.elapsed)
+
+        with Timer() as timer:
+            result = tally.irv()
+        self.report('first IRV count', timer.elapsed)
+        self.stdout.write(
+            f"{len(tally.groups)} distinct rankings, {len(result['rounds'])} rounds, winner {result['winner']}")
+
+        repeat = options['repeat']
+        for name, method in (('add + IRV result', tally.irv), ('add + Borda result', tally.borda)):
+            with Timer() as timer:
+                for _ in range(repeat):
+                    tally.add(ballot())
+                    method()
+            self.report(name, timer.elapsed / repeat)
+
+        with Timer() as timer:
+            for _ in range(repeat):
+                tally.stale_from = 0
+                tally.irv()
+        self.report('IRV recount of all rounds', timer.elapsed / repeat)
+
+    def report(self, name, seconds):
+        self.stdout.write(f'{name:<28} {seconds * 1000:9.3f} ms')
@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import async_views
+from api.benchmarks import Timer, benchmark_database, create_employees, create_menus, delete_menus, format_rate
+from api.views import CurrentDayMenuList, ResultsAPIView, VoteAPIView
+
+ENDPOINTS = ('menu_list', 'results', 'vote')
+
+
+class Command(BaseCommand):
+    help = ('Compare the sync views run on a thread pool (as under WSGI) with the async views '
+            'run on one event loop (as under ASGI), in-process on a throwaway database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once.')
+        parser.add_argument('--menus', type=int, default=20, help="Menus on today's list.")
+        parser.add_argument('--endpoint', choices=ENDPOINTS, action='append', help='Only run this endpoint.')
+
+    def handle(self, *args, **options):
+        self.factory = RequestFactory()
+        with benchmark_database():
+            menus = create_menus(options['menus'])
+            try:
+                for endpoint in options['endpoint'] or ENDPOINTS:
+                    self.run(endpoint, menus, options['requests'], options['concurrency'])
+            finally:
+                delete_menus(menus)
+
+    def run(self, endpoint, menus, count, concurrency):
+        if endpoint == 'vote':
+            # Every vote needs its own employee, or all but the first are rejected.
+            users = create_employees(2 * count)
+            tokens = [f'Bearer {AccessToken.for_user(user)}' for user in users]
+            sync_requests = self.vote_requests(menus, tokens[:count])
+            async_requests = self.vote_requests(menus, tokens[count:])
+            sync_view, async_view = VoteAPIView.as_view(), async_views.vote
+        else:
+            url = reverse(f'api:{endpoint.replace("_", "-")}')
+            sync_requests = [(self.factory.get(url), {}) for _ in range(count)]
+            async_requests = [(self.factory.get(url), {}) for _ in range(count)]
+            sync_view, async_view = {
+                'menu_list': (CurrentDayMenuList.as_view(), async_views.menu_list),
+                'results': (ResultsAPIView.as_view(), async_views.results),
+            }[endpoint]
+
+        sync_seconds, sync_responses = self.run_sync(sync_view, sync_requests, concurrency)
+        async_seconds, async_responses = asyncio.run(self.run_async(async_view, async_requests, concurrency))
+        self.stdout.write(
+            f'{endpoint:<10} sync: {format_rate(count, sync_seconds):>14}   '
+            f'async: {format_rate(count, async_seconds):>14}')
+        failed = sum(response.status_code >= 400 for response in sync_responses + async_responses)
+        if failed:
+            self.stderr.write(self.style.WARNING(f'{endpoint}: {failed} requests failed'))
+
+    def vote_requests(self, menus, tokens):
+        return [
+            (self.factory.get(reverse('api:new-vote', kwargs={'menu_id': menu.id}), HTTP_AUTHORIZATION=token),
+             {'menu_id': menu.id})
+            for token, menu in zip(tokens, menus * len(tokens))
+        ]
+
+    def run_sync(self, view, requests, concurrency):
+        def call(request):
+            try:
+                response = view(request[0], **request[1])
+                # DRF responses render lazily; cached bodies are plain HttpResponses.
+                return response.render() if hasattr(response, 'render') else response
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(concurrency) as pool, Timer() as timer:
+            responses = list(pool.map(call, requests))
+        return timer.elapsed, responses
+
+    async def run_async(self, view, requests, concurrency):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def call(request):
+            async with limit:
+                return await view(request[0], **request[1])
+
+        with Timer() as timer:
+            responses = await asyncio.gather(*(call(request) for request in requests))
+        return timer.elapsed, responses
@@ -0,0 +1,39 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importing import FORMATS, guess_format, import_employees, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create employees from a CSV or NDJSON file and report every rejected row.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or NDJSON file.')
+        parser.add_argument('--format', choices=FORMATS, help='File format; guessed from the extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows validated and inserted per batch.')
+        parser.add_argument('--created-by', help='Recorded as created_by on the new users and employees.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or guess_format(options['path'])
+        if file_format is None:
+            raise CommandError('Cannot tell the file format, pass --format.')
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = import_employees(
+                    read_rows(stream, file_format),
+                    created_by=options['created_by'],
+                    chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(e)
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+
+        for rejected in report.rejected:
+            errors = '; '.join(
+                f'{field}: {" ".join(str(message) for message in messages)}'
+                for field, messages in rejected['errors'].items())
+            self.stderr.write(f'row {rejected["row"]}: {errors}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.created} employees, rejected {len(report.rejected)} rows.'))
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.profiling import make_profiling_token
+
+
+class Command(BaseCommand):
+    help = ('Print a token that profiles the requests sending it as "X-Profile: <token>" for the next '
+            'PROFILING_TOKEN_MAX_AGE seconds; the response names the profile in X-Profile-Id.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profiling_token())
+        self.stderr.write(
+            f'Valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds; profiles go to {settings.PROFILING_DIR}.')
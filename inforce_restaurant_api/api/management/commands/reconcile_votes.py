@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.caching import bump_content_version
+from api.counters import reconcile_menu_votes
+from api.leaderboard import get_leaderboard
+from api.models import Menu
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Menu.votes from the Vote table and fold the vote counter shards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Only reconcile menus uploaded on this day (YYYY-MM-DD).')
+        parser.add_argument('--menu', type=int, action='append', help='Only reconcile this menu id.')
+
+    def handle(self, *args, **options):
+        menus = Menu.objects.all()
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+            menus = menus.filter(business_day=day)
+        if options['menu']:
+            menus = menus.filter(id__in=options['menu'])
+
+        changed = reconcile_menu_votes(menus)
+        # The live results hold the counts from before; rebuild them.
+        get_leaderboard().reset()
+        bump_content_version()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {menus.count()} menus, {changed} corrected.'))
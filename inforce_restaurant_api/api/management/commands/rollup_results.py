@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.history import rollup_closed_days, rollup_day
+from api.models import Menu, get_business_day
+
+
+class Command(BaseCommand):
+    help = ('Rank the menus of closed business days into DailyResult rows. Without options, '
+            'rolls up the closed days that are not rolled up yet; run it after midnight.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date', action='append',
+            help='Roll up this day (YYYY-MM-DD) again, e.g. after reconcile_votes corrected it.')
+        parser.add_argument('--rebuild', action='store_true', help='Roll up every closed day again.')
+
+    def handle(self, *args, **options):
+        today = get_business_day()
+        if options['rebuild']:
+            days = list(Menu.objects.filter(business_day__lt=today).order_by(
+                'business_day').values_list('business_day', flat=True).distinct())
+        elif options['date']:
+            try:
+                days = [date.fromisoformat(value) for value in options['date']]
+            except ValueError as e:
+                raise CommandError(f'Invalid date: {e}')
+            if any(day >= today for day in days):
+                raise CommandError('Only closed business days can be rolled up.')
+        else:
+            days = rollup_closed_days(today)
+            self.stdout.write(self.style.SUCCESS(f'Rolled up {len(days)} days.'))
+            return
+
+        for day in days:
+            rollup_day(day)
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {len(days)} days.'))
@@ -0,0 +1,426 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .db.pool import STATS as POOL_COUNTERS, pool_stats
+from .db.recording import recording
+from .middleware import HybridMiddleware
+
+# Per-endpoint request metrics in the Prometheus text format.
+#
+# Every thread records into its own dict, so recording a request takes no
+# lock; a scrape sums the threads' dicts, and a thread's dict is folded
+# into the process totals when the thread ends. With METRICS_DIR set, each
+# worker process also writes its totals to a file there every
+# METRICS_FLUSH_INTERVAL seconds, and /metrics adds up the files of all
+# workers, so any worker can answer for the whole server. The files of
+# exited workers are folded into one, keeping their counters but not their
+# gauges. The connection pools of the pooled database backends
+# (api/db/pool.py) are reported too.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Positions in a series list; the bucket counts follow.
+COUNT, SECONDS, QUERIES, QUERY_SECONDS, BYTES = range(5)
+FIELDS = 5
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsRegistry:
+    """Request counts, latency histograms, SQL counts and time, and response sizes per endpoint."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        # The series of live threads by id(), and those of ended threads.
+        self._shards = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = _ThreadSeries()
+            with self._lock:
+                self._shards[id(holder.series)] = holder.series
+            # The holder goes with the thread's locals when the thread ends.
+            weakref.finalize(holder, self._retire, holder.series)
+        return holder.series
+
+    def _retire(self, shard):
+        with self._lock:
+            if self._shards.pop(id(shard), None) is not None:
+                for key, series in shard.items():
+                    add_series(self._retired, key, series)
+
+    def observe(self, endpoint, method, status, seconds, queries, query_seconds, size):
+        shard = self._shard()
+        key = (endpoint, method, str(status))
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = [0, 0.0, 0, 0.0, 0] + [0] * len(self.buckets)
+        series[COUNT] += 1
+        series[SECONDS] += seconds
+        series[QUERIES] += queries
+        series[QUERY_SECONDS] += query_seconds
+        series[BYTES] += size
+        index = bisect_left(self.buckets, seconds)
+        if index < len(self.buckets):
+            series[FIELDS + index] += 1
+
+    def snapshot(self):
+        """This process's series, summed over its threads."""
+        with self._lock:
+            shards = list(self._shards.values())
+            merged = {key: list(series) for key, series in self._retired.items()}
+        for shard in shards:
+            # list() copies the items in one step, so a thread adding a
+            # series meanwhile does not break the iteration.
+            for key, series in list(shard.items()):
+                add_series(merged, key, series)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards.values():
+                shard.clear()
+            self._retired.clear()
+
+
+class _ThreadSeries:
+    __slots__ = ('series', '__weakref__')
+
+    def __init__(self):
+        self.series = {}
+
+
+def add_series(merged, key, series):
+    total = merged.get(key)
+    if total is None:
+        merged[key] = list(series)
+    else:
+        for index, value in enumerate(series):
+            total[index] += value
+
+
+registry = MetricsRegistry()
+
+
+class WorkerFiles:
+    """The totals of every worker process, shared through one file per process in ``directory``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+
+    def flush(self, registry):
+        with self._lock:
+            self.flushed_at = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = f'{self.path}.{threading.get_ident()}.tmp'
+            with open(temporary, 'w') as file:
+                json.dump({
+                    'buckets': list(registry.buckets),
+                    'series': [list(key) + series for key, series in registry.snapshot().items()],
+                    'pools': pool_stats(),
+                }, file)
+            os.replace(temporary, self.path)
+
+    def is_due(self, interval):
+        return time.monotonic() - self.flushed_at >= interval
+
+    def collect(self, buckets):
+        """The series and pool stats of all workers whose files use ``buckets``, and the number of live workers."""
+        self.retire_exited()
+        merged, pools, workers = {}, {}, 0
+        for name in os.listdir(self.directory):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            data = read_worker_file(os.path.join(self.directory, name))
+            if data is None or tuple(data['buckets']) != tuple(buckets):
+                continue
+            if name != RETIRED_FILE:
+                workers += 1
+            for row in data['series']:
+                add_series(merged, tuple(row[:3]), row[3:])
+            add_pool_stats(pools, data.get('pools', {}))
+        return merged, pools, workers
+
+    def retire_exited(self):
+        """
+        Fold the files of exited workers into RETIRED_FILE.
+
+        Their counters keep counting towards the totals; their gauges (open
+        connections, pool sizes) and the worker itself no longer do.
+        """
+        exited = []
+        for name in os.listdir(self.directory):
+            pid = worker_pid(name)
+            if pid is not None and pid != os.getpid() and not is_alive(pid):
+                exited.append(name)
+        if not exited:
+            return
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired_path = os.path.join(self.directory, RETIRED_FILE)
+            retired = read_worker_file(retired_path) or {'buckets': None, 'series': [], 'pools': {}}
+            merged = {tuple(row[:3]): row[3:] for row in retired['series']}
+            pools = retired['pools']
+            folded = []
+            for name in exited:
+                path = os.path.join(self.directory, name)
+                data = read_worker_file(path)
+                if data is None:
+                    # Folded by another worker meanwhile, or torn.
+                    continue
+                if retired['buckets'] is not None and tuple(data['buckets']) != tuple(retired['buckets']):
+                    # Recorded with other buckets, so it cannot be added up.
+                    folded.append(path)
+                    continue
+                retired['buckets'] = data['buckets']
+                for row in data['series']:
+                    add_series(merged, tuple(row[:3]), row[3:])
+                add_pool_stats(pools, {
+                    alias: {key: stats.get(key, 0) for key in POOL_COUNTERS}
+                    for alias, stats in data.get('pools', {}).items()})
+                folded.append(path)
+            if retired['buckets'] is not None:
+                temporary = f'{retired_path}.{os.getpid()}.tmp'
+                with open(temporary, 'w') as file:
+                    json.dump({
+                        'buckets': retired['buckets'],
+                        'series': [list(key) + series for key, series in merged.items()],
+                        'pools': pools,
+                    }, file)
+                os.replace(temporary, retired_path)
+            for path in folded:
+                os.remove(path)
+
+
+RETIRED_FILE = 'metrics-retired.json'
+
+
+def worker_pid(name):
+    if not (name.startswith('metrics-') and name.endswith('.json')):
+        return None
+    try:
+        return int(name[len('metrics-'):-len('.json')])
+    except ValueError:
+        return None
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_worker_file(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def add_pool_stats(pools, stats_by_alias):
+    for alias, stats in stats_by_alias.items():
+        total = pools.setdefault(alias, {})
+        for name, value in stats.items():
+            total[name] = total.get(name, 0) + value
+
+
+_worker_files = None
+
+
+def get_worker_files():
+    """The ``WorkerFiles`` of METRICS_DIR, or None when metrics stay in-process."""
+    global _worker_files
+    directory = settings.METRICS_DIR
+    if not directory:
+        return None
+    if _worker_files is None or _worker_files.directory != directory:
+        _worker_files = WorkerFiles(directory)
+        atexit.register(_flush_at_exit, _worker_files)
+    return _worker_files
+
+
+def _flush_at_exit(worker_files):
+    if os.path.isdir(worker_files.directory):
+        worker_files.flush(registry)
+
+
+class QueryTimer:
+    """``execute_wrapper`` that counts the queries of a request and adds up their time."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Record each request under its URL name, e.g. ``api:new-vote``.
+
+    Requests that match no URL are recorded as ``unmatched``, so scanners
+    cannot create a series per path. Put it first in MIDDLEWARE to time the
+    whole stack.
+    """
+
+    def handle(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with recording(timer):
+            response = self.get_response(request)
+        worker_files = self.record(request, response, timer, time.perf_counter() - start)
+        if worker_files is not None:
+            worker_files.flush(registry)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with recording(timer):
+            response = await self.get_response(request)
+        worker_files = self.record(request, response, timer, time.perf_counter() - start)
+        if worker_files is not None:
+            await sync_to_async(worker_files.flush, thread_sensitive=False)(registry)
+        return response
+
+    def record(self, request, response, timer, seconds):
+        """Record the request; returns the ``WorkerFiles`` to flush if they are due."""
+        match = request.resolver_match
+        endpoint = match.view_name if match is not None else 'unmatched'
+        if endpoint == 'metrics':
+            return None
+        registry.observe(
+            endpoint, request.method, response.status_code, seconds,
+            timer.queries, timer.seconds, response_size(response))
+        worker_files = get_worker_files()
+        if worker_files is not None and worker_files.is_due(settings.METRICS_FLUSH_INTERVAL):
+            return worker_files
+        return None
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def render(series, buckets, workers=1, pools=None):
+    """The series, and the pool stats by database alias, in the Prometheus text exposition format."""
+    lines = [
+        '# HELP api_workers Worker processes whose metrics are included.',
+        '# TYPE api_workers gauge',
+        f'api_workers {workers}',
+    ]
+    ordered = sorted(series.items())
+
+    lines += [
+        '# HELP api_requests_total Requests by endpoint, method and status.',
+        '# TYPE api_requests_total counter',
+    ]
+    lines += [f'api_requests_total{{{labels(key)}}} {values[COUNT]}' for key, values in ordered]
+
+    lines += [
+        '# HELP api_request_duration_seconds Request latency by endpoint, method and status.',
+        '# TYPE api_request_duration_seconds histogram',
+    ]
+    for key, values in ordered:
+        cumulative = 0
+        for bound, count in zip(buckets, values[FIELDS:]):
+            cumulative += count
+            lines.append(f'api_request_duration_seconds_bucket{{{labels(key)},le="{bound}"}} {cumulative}')
+        lines.append(f'api_request_duration_seconds_bucket{{{labels(key)},le="+Inf"}} {values[COUNT]}')
+        lines.append(f'api_request_duration_seconds_sum{{{labels(key)}}} {values[SECONDS]!r}')
+        lines.append(f'api_request_duration_seconds_count{{{labels(key)}}} {values[COUNT]}')
+
+    for name, index, help_text in (
+            ('api_db_queries_total', QUERIES, 'SQL queries run by requests.'),
+            ('api_db_query_seconds_total', QUERY_SECONDS, 'Time requests spent in SQL queries.'),
+            ('api_response_bytes_total', BYTES, 'Response body bytes sent.')):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [f'{name}{{{labels(key)}}} {values[index]!r}' for key, values in ordered]
+
+    if pools:
+        lines += pool_lines(pools)
+    return '\n'.join(lines) + '\n'
+
+
+def pool_lines(pools):
+    ordered = sorted(pools.items())
+    lines = [
+        '# HELP api_db_pool_size Most connections the pools may open, over all workers.',
+        '# TYPE api_db_pool_size gauge',
+    ]
+    lines += [f'api_db_pool_size{{alias="{alias}"}} {stats.get("size", 0)}' for alias, stats in ordered]
+    lines += [
+        '# HELP api_db_pool_connections Open pooled connections by state.',
+        '# TYPE api_db_pool_connections gauge',
+    ]
+    for alias, stats in ordered:
+        for state in ('in_use', 'idle'):
+            lines.append(f'api_db_pool_connections{{alias="{alias}",state="{state}"}} {stats.get(state, 0)}')
+
+    for name, key, help_text in (
+            ('api_db_pool_checkouts_total', 'checkouts', 'Connections taken from the pool.'),
+            ('api_db_pool_wait_seconds_total', 'wait_seconds', 'Time spent waiting for a pooled connection.'),
+            ('api_db_pool_checkout_failures_total', 'failures', 'Checkouts that timed out on a full pool.'),
+            ('api_db_pool_opened_total', 'opened', 'Connections the pool opened.')):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [f'{name}{{alias="{alias}"}} {stats[key]!r}' for alias, stats in ordered]
+
+    lines += [
+        '# HELP api_db_pool_closed_total Connections the pool closed, by reason.',
+        '# TYPE api_db_pool_closed_total counter',
+    ]
+    for alias, stats in ordered:
+        for reason in ('expired', 'unhealthy'):
+            lines.append(f'api_db_pool_closed_total{{alias="{alias}",reason="{reason}"}} {stats[reason]}')
+    return lines
+
+
+def labels(key):
+    endpoint, method, status = (value.replace('\\', '\\\\').replace('"', '\\"') for value in key)
+    return f'endpoint="{endpoint}",method="{method}",status="{status}"'
+
+
+def metrics_view(request):
+    """``GET /metrics``: this worker's metrics, or every worker's with METRICS_DIR."""
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    worker_files = get_worker_files()
+    if worker_files is None:
+        series, pools, workers = registry.snapshot(), pool_stats(), 1
+    else:
+        worker_files.flush(registry)
+        series, pools, workers = worker_files.collect(registry.buckets)
+    return HttpResponse(render(series, registry.buckets, workers, pools), content_type=CONTENT_TYPE)
@@ -0,0 +1,32 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+class HybridMiddleware:
+    """
+    Base of the API's middleware, which runs natively in sync and async stacks.
+
+    Under ASGI Django adapts sync-only middleware by running the rest of
+    the chain on a thread, which puts every async view behind a thread
+    hop. Subclasses implement ``handle`` for WSGI and ``__acall__`` for
+    ASGI; Django passes ``get_response`` in the mode of the stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
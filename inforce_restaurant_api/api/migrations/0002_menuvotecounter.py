@@ -0,0 +1,27 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuVoteCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_counters', to='api.menu')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='menuvotecounter',
+            constraint=models.UniqueConstraint(fields=('menu', 'shard'), name='unique_menu_vote_counter_shard'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_menuvotecounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='voted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_vote_voted_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menu',
+            name='business_day',
+            field=models.DateField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='business_day',
+            field=models.DateField(null=True, editable=False),
+        ),
+    ]
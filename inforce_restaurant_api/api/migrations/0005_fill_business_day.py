@@ -0,0 +1,55 @@
+from django.db import migrations
+from django.db.models import F, Sum
+from django.utils import timezone
+
+
+def business_day(value):
+    # A copy of api.clock.to_business_day as of this migration.
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def fill_business_day(apps, schema_editor):
+    Menu = apps.get_model('api', 'Menu')
+    MenuVoteCounter = apps.get_model('api', 'MenuVoteCounter')
+    Vote = apps.get_model('api', 'Vote')
+
+    # The old one-menu-a-day check raced and compared against a frozen
+    # date, so a restaurant can have several menus on one day. Keep the
+    # first, move the others' votes onto it and delete them.
+    kept = {}
+    for menu in Menu.objects.only('id', 'restaurant_id', 'created_at').order_by('created_at', 'id').iterator():
+        day = business_day(menu.created_at)
+        first = kept.setdefault((menu.restaurant_id, day), menu.id)
+        if first == menu.id:
+            Menu.objects.filter(id=menu.id).update(business_day=day)
+            continue
+        votes = Menu.objects.filter(id=menu.id).values_list('votes', flat=True).get()
+        votes += MenuVoteCounter.objects.filter(menu_id=menu.id).aggregate(total=Sum('count'))['total'] or 0
+        Vote.objects.filter(menu_id=menu.id).update(menu_id=first)
+        Menu.objects.filter(id=first).update(votes=F('votes') + votes)
+        Menu.objects.filter(id=menu.id).delete()
+
+    # Before the constraint an employee could vote once per menu per day;
+    # keep only the first vote of each day and take the rest off the counts.
+    seen = set()
+    for vote in Vote.objects.only('id', 'employee_id', 'menu_id', 'voted_at').order_by('voted_at', 'id').iterator():
+        day = business_day(vote.voted_at)
+        if (vote.employee_id, day) in seen:
+            Vote.objects.filter(id=vote.id).delete()
+            Menu.objects.filter(id=vote.menu_id).update(votes=F('votes') - 1)
+            continue
+        seen.add((vote.employee_id, day))
+        Vote.objects.filter(id=vote.id).update(business_day=day)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_business_day'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_business_day, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+import api.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_fill_business_day'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='menu',
+            name='business_day',
+            field=models.DateField(db_index=True, default=api.models.get_business_day, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='business_day',
+            field=models.DateField(db_index=True, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='menu',
+            constraint=models.UniqueConstraint(fields=('restaurant', 'business_day'), name='unique_menu_per_restaurant_per_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('employee', 'business_day'), name='unique_vote_per_employee_per_day'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:59
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_business_day_constraints'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='voted_at',
+            field=models.DateTimeField(default=api.models.get_current_time, editable=False),
+        ),
+    ]
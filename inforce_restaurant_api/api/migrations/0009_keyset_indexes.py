@@ -0,0 +1,25 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_stored_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(fields=['created_at', 'id'], name='menu_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['created_at', 'id'], name='restaurant_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['employee', 'voted_at', 'id'], name='vote_employee_voted_id_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('business_day', models.DateField()),
+                ('votes', models.IntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('menu', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.menu')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_results', to='api.restaurant')),
+            ],
+            options={
+                'ordering': ['business_day', 'rank', 'restaurant'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailyresult',
+            index=models.Index(fields=['restaurant', 'business_day'], name='daily_result_restaurant_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyresult',
+            constraint=models.UniqueConstraint(fields=('business_day', 'restaurant'), name='unique_daily_result_per_restaurant_per_day'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_daily_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('employee_id', models.BigIntegerField()),
+                ('menu_id', models.BigIntegerField(db_index=True)),
+                ('voted_at', models.DateTimeField()),
+                ('business_day', models.DateField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def today():
+    # A copy of api.clock.SystemClock.today as of this migration.
+    value = timezone.now()
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_votes(apps, schema_editor):
+    """
+    Turn api_vote into a table partitioned by month of business_day (PostgreSQL only).
+
+    The rows are copied into a new partitioned table with one partition per
+    month up to two months ahead, plus a default partition; the primary key
+    becomes (id, business_day), as partitioned tables require, and the
+    other constraints and indexes are recreated under their old names.
+    Other databases keep a plain table and archive closed months instead.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('api', 'Vote')._meta.db_table
+    quote = schema_editor.quote_name
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [table])
+        if cursor.fetchone():
+            return
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('f', 'u')", [table])
+        constraints = cursor.fetchall()
+        cursor.execute(
+            'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN '
+            '(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)', [table, table])
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN(business_day) FROM {quote(table)}')
+        month = (cursor.fetchone()[0] or today()).replace(day=1)
+
+        old = f'{table}_unpartitioned'
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS) PARTITION BY RANGE (business_day)')
+        cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+        last = next_month(next_month(today().replace(day=1)))
+        while month <= last:
+            cursor.execute(
+                f'CREATE TABLE {quote(f"{table}_y{month:%Y}m{month:%m}")} PARTITION OF {quote(table)} '
+                f'FOR VALUES FROM (%s) TO (%s)', [month, next_month(month)])
+            month = next_month(month)
+
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old)}')
+        if sequence:
+            cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+        # The old table's constraints and indexes keep their names until it is dropped.
+        cursor.execute(f'DROP TABLE {quote(old)}')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_pkey")} PRIMARY KEY (id, business_day)')
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+        for definition in indexes:
+            cursor.execute(definition)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_vote_archive'),
+    ]
+
+    operations = [
+        # Not reversible in place: a partitioned table keeps working as one.
+        migrations.RunPython(partition_votes, migrations.RunPython.noop),
+    ]
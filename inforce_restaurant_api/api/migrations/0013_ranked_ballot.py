@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-18 14:48
+
+import api.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_partition_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankedBallot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rankings', models.BinaryField()),
+                ('cast_at', models.DateTimeField(default=api.models.get_current_time, editable=False)),
+                ('business_day', models.DateField(editable=False)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.employee')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rankedballot',
+            index=models.Index(fields=['business_day', 'cast_at'], name='ballot_day_cast_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rankedballot',
+            constraint=models.UniqueConstraint(fields=('employee', 'business_day'), name='unique_ballot_per_employee_per_day'),
+        ),
+    ]
@@ -1,7 +1,23 @@
+import sys
 import uuid
+from array import array
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from .clock import get_clock, to_business_day
+from .storage import get_menu_storage
+
+
+def get_current_time():
+    return get_clock().now()
+
+
+def get_business_day(value=None):
+    """Business day of ``value``, or today's according to the process clock."""
+    if value is None:
+        return get_clock().today()
+    return to_business_day(value)
+
 
 class User(AbstractUser):
     """Represents user class model"""
@@ -58,6 +74,9 @@ class Restaurant(models.Model):
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='restaurant_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -68,24 +87,171 @@ class Menu(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
         on_delete=models.CASCADE)
-    file = models.FileField(upload_to='menus/')
+    file = models.FileField(upload_to='menus/', storage=get_menu_storage)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     uploaded_by = models.CharField(max_length=50, null=True, blank=True)
     votes = models.IntegerField(default=0)
+    business_day = models.DateField(default=get_business_day, db_index=True, editable=False)
 
     class Meta:
         ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['restaurant', 'business_day'],
+                name='unique_menu_per_restaurant_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='menu_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.restaurant.name
 
 
+class StoredBlob(models.Model):
+    """Represents stored file content class model"""
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=100, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class MenuVoteCounter(models.Model):
+    """Represents menu vote counter shard class model"""
+    menu = models.ForeignKey(
+        Menu,
+        related_name='vote_counters',
+        on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['menu', 'shard'],
+                name='unique_menu_vote_counter_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.menu_id}:{self.shard}'
+
+
 class Vote(models.Model):
     """Represents vote class model"""
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     menu = models.ForeignKey(Menu, on_delete=models.CASCADE)
-    voted_at = models.DateTimeField(auto_now_add=True)
+    voted_at = models.DateTimeField(default=get_current_time, editable=False)
+    business_day = models.DateField(db_index=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['employee', 'business_day'],
+                name='unique_vote_per_employee_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['employee', 'voted_at', 'id'], name='vote_employee_voted_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.business_day is None:
+            self.business_day = get_business_day(self.voted_at)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.employee}'
+
+
+class VoteArchive(models.Model):
+    """Represents archived vote class model"""
+    id = models.BigIntegerField(primary_key=True)
+    employee_id = models.BigIntegerField()
+    menu_id = models.BigIntegerField(db_index=True)
+    voted_at = models.DateTimeField()
+    business_day = models.DateField(db_index=True)
+
+    def __str__(self):
+        return f'{self.employee_id}: {self.menu_id}'
+
+
+class DailyResult(models.Model):
+    """Represents closed business day result class model"""
+    business_day = models.DateField()
+    restaurant = models.ForeignKey(
+        Restaurant,
+        related_name='daily_results',
+        on_delete=models.CASCADE)
+    menu = models.ForeignKey(
+        Menu,
+        null=True,
+        blank=True,
+        related_name='+',
+        on_delete=models.SET_NULL)
+    votes = models.IntegerField()
+    rank = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['business_day', 'rank', 'restaurant']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['business_day', 'restaurant'],
+                name='unique_daily_result_per_restaurant_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['restaurant', 'business_day'], name='daily_result_restaurant_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.business_day}: {self.restaurant_id} #{self.rank}'
+
+
+def pack_ranking(menu_ids):
+    """Menu ids in order of preference as little-endian 32-bit integers."""
+    ranking = array('I', menu_ids)
+    if sys.byteorder == 'big':
+        ranking.byteswap()
+    return ranking.tobytes()
+
+
+def unpack_ranking(data):
+    ranking = array('I')
+    ranking.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        ranking.byteswap()
+    return ranking
+
+
+class RankedBallot(models.Model):
+    """Represents ranked ballot class model"""
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
+    # The ranked menu ids, packed by pack_ranking: 4 bytes a menu.
+    rankings = models.BinaryField()
+    cast_at = models.DateTimeField(default=get_current_time, editable=False)
+    business_day = models.DateField(editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['employee', 'business_day'],
+                name='unique_ballot_per_employee_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['business_day', 'cast_at'], name='ballot_day_cast_idx'),
+        ]
+
+    @property
+    def menu_ids(self):
+        return list(unpack_ranking(self.rankings))
+
+    def save(self, *args, **kwargs):
+        if self.business_day is None:
+            self.business_day = get_business_day(self.cast_at)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.employee}'
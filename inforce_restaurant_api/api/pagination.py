@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first cursor pagination on ``(timestamp, id)``.
+
+    Pages are found with ``WHERE (ts, id) < (cursor ts, cursor id)`` on a
+    composite index rather than with OFFSET, and no COUNT is run, so every
+    page costs the same as the first. Rows inserted while a client pages
+    through are newer than any cursor and never shift later pages.
+
+    ``ordering`` names the timestamp and tie-breaker fields; a view can
+    set ``keyset_ordering``, e.g. ``('voted_at', 'id')``, to use others;
+    the tie-breaker must be an integer.
+    Pages may hold model instances or ``values()`` rows. A view may also
+    page through a list of querysets, such as a table and its archive,
+    whose pages are merged; their ids must not overlap.
+    """
+
+    ordering = ('created_at', 'id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        querysets = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+        results = []
+        for queryset in querysets:
+            results.extend(self.page_of(queryset, position, reverse))
+        if len(querysets) > 1:
+            results.sort(key=self.position, reverse=not reverse)
+            del results[self.page_size + 1:]
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def page_of(self, queryset, position, reverse):
+        timestamp, tiebreak = self.ordering
+        if position is not None:
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{timestamp}__{lookup}': position[0]})
+                | Q(**{timestamp: position[0], f'{tiebreak}__{lookup}': position[1]}))
+        if reverse:
+            queryset = queryset.order_by(timestamp, tiebreak)
+        else:
+            queryset = queryset.order_by(f'-{timestamp}', f'-{tiebreak}')
+        return list(queryset[:self.page_size + 1])
+
+    def position(self, item):
+        timestamp, tiebreak = self.ordering
+        if isinstance(item, dict):
+            return item[timestamp], item[tiebreak]
+        return getattr(item, timestamp), getattr(item, tiebreak)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, item, reverse):
+        at, key = self.position(item)
+        payload = [at.isoformat(), key, int(reverse)]
+        cursor = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            timestamp, tiebreak, reverse = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position = datetime.fromisoformat(timestamp), int(tiebreak)
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if reverse not in (0, 1):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
@@ -0,0 +1,242 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+
+from .db.recording import recording
+from .middleware import HybridMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Two development aids for slow endpoints.
+#
+# ProfilingMiddleware profiles single requests in production: a request
+# carrying a valid signed X-Profile header (see `manage.py profiling_token`),
+# or one in PROFILING_SAMPLE_RATE of all requests, runs under cProfile and
+# leaves a .prof file and a .json file with its full SQL trace in
+# PROFILING_DIR, which keeps the newest PROFILING_MAX_PROFILES. Under ASGI
+# cProfile only sees the event loop thread, so an async profile shows the
+# coroutines of every request the loop ran meanwhile and none of the work
+# in sync_to_async threads; its SQL trace is still the request's own. One
+# async request is profiled at a time; others arriving meanwhile are not.
+#
+# QueryInspectionMiddleware (QUERY_INSPECTION = "warn" or "raise", for
+# development and tests) logs statements a request repeats, the usual sign
+# of an N+1 lookup, and checks each view's declared query budget.
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+TOKEN_SALT = 'api.profiling'
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def make_profiling_token():
+    """A token for the X-Profile header, valid for PROFILING_TOKEN_MAX_AGE seconds."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(uuid.uuid4().hex)
+
+
+def has_profiling_token(request):
+    token = request.META.get(PROFILE_HEADER)
+    if not token:
+        return False
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class SQLRecorder:
+    """``execute_wrapper`` that keeps every statement of a request with its database, parameters and time."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': None if many else repr(params),
+                'many': many,
+                'seconds': round(time.perf_counter() - start, 6),
+            })
+
+
+def endpoint_name(request):
+    match = request.resolver_match
+    return match.view_name if match is not None else 'unmatched'
+
+
+# cProfile only profiles the thread it runs in, and concurrent coroutines
+# share the event loop thread, so async requests are profiled one at a time.
+_async_profile = threading.Lock()
+
+
+class ProfilingMiddleware(HybridMiddleware):
+
+    def handle(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with recording(SQLRecorder()) as recorder:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        save_profile(request, response, profiler, recorder.queries, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not should_profile(request) or not _async_profile.acquire(blocking=False):
+            return await self.get_response(request)
+
+        try:
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            with recording(SQLRecorder()) as recorder:
+                profiler.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            _async_profile.release()
+        await sync_to_async(save_profile, thread_sensitive=False)(
+            request, response, profiler, recorder.queries, time.perf_counter() - start)
+        return response
+
+
+def should_profile(request):
+    rate = settings.PROFILING_SAMPLE_RATE
+    return has_profiling_token(request) or bool(rate and random.random() < rate)
+
+
+def save_profile(request, response, profiler, queries, seconds):
+    """Write the profile of the request and name it in the response's X-Profile-Id."""
+    profile_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+    try:
+        write_profile(settings.PROFILING_DIR, profile_id, profiler, {
+            'id': profile_id,
+            'endpoint': endpoint_name(request),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'seconds': round(seconds, 6),
+            'queries': queries,
+        })
+    except OSError:
+        logger.exception('Could not write the profile of %s', request.path)
+    else:
+        response['X-Profile-Id'] = profile_id
+
+
+def write_profile(directory, profile_id, profiler, trace):
+    """Write ``<id>.prof`` (pstats, for snakeviz or flameprof) and ``<id>.json``, then rotate."""
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as file:
+        json.dump(trace, file, indent=1)
+    rotate_profiles(directory, settings.PROFILING_MAX_PROFILES)
+
+
+def rotate_profiles(directory, keep):
+    """Delete all but the newest ``keep`` profiles; ids start with their time, so names sort by age."""
+    ids = sorted(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:max(len(ids) - keep, 0)]:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Statements that differ only in their parameters or IN list lengths normalize the same."""
+    return IN_LIST_RE.sub('IN (...)', SPACE_RE.sub(' ', sql))
+
+
+def repeated_queries(queries, threshold):
+    """``(statement, times)`` of the statements run at least ``threshold`` times."""
+    counts = Counter(normalize(query['sql']) for query in queries)
+    return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+
+def get_query_budget(request):
+    """The ``query_budget`` declared on the resolved view (or its class), if any."""
+    match = request.resolver_match
+    if match is None:
+        return None
+    view = match.func
+    budget = getattr(view, 'query_budget', None)
+    if budget is None and hasattr(view, 'view_class'):
+        budget = getattr(view.view_class, 'query_budget', None)
+    return budget
+
+
+def query_budget(budget):
+    """Declare the most queries a function view may run, like ``query_budget`` on a view class."""
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+class QueryInspectionMiddleware(HybridMiddleware):
+
+    def handle(self, request):
+        mode = settings.QUERY_INSPECTION
+        if not mode:
+            return self.get_response(request)
+
+        with recording(SQLRecorder()) as recorder:
+            response = self.get_response(request)
+        inspect_queries(request, recorder.queries, mode)
+        return response
+
+    async def __acall__(self, request):
+        mode = settings.QUERY_INSPECTION
+        if not mode:
+            return await self.get_response(request)
+
+        with recording(SQLRecorder()) as recorder:
+            response = await self.get_response(request)
+        inspect_queries(request, recorder.queries, mode)
+        return response
+
+
+def inspect_queries(request, queries, mode):
+    """Log the statements the request repeated and check its query budget."""
+    endpoint = endpoint_name(request)
+
+    for sql, count in repeated_queries(queries, settings.QUERY_REPEAT_THRESHOLD):
+        logger.warning('%s ran the same query %d times: %s', endpoint, count, sql)
+
+    budget = get_query_budget(request)
+    if budget is not None and len(queries) > budget:
+        message = f'{endpoint} ran {len(queries)} queries, over its budget of {budget}.'
+        if mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
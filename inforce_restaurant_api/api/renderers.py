@@ -0,0 +1,125 @@
+import decimal
+
+from django.conf import settings
+from django.db.models.query import QuerySet
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON rendering and parsing with orjson, for the endpoints that return
+# large payloads or are hit on every poll. Views opt in with
+# ``renderer_classes = FAST_RENDERER_CLASSES`` and
+# ``parser_classes = FAST_PARSER_CLASSES``; without orjson installed both
+# fall back to DRF's json-based classes and give the same output.
+
+
+class Envelope:
+    """
+    The ``{"msg", "data", "success"}`` wrapper of an API response.
+
+    ``ORJSONRenderer`` writes the wrapper straight into the output bytes
+    around the encoded ``data``, rather than encoding a dict built for it.
+    It reads like a dict (``envelope["data"]``), so other renderers and
+    callers can treat it as one.
+    """
+
+    __slots__ = FIELDS = ('msg', 'data', 'success')
+
+    def __init__(self, msg, data, success):
+        self.msg = msg
+        self.data = data
+        self.success = success
+
+    def __getitem__(self, key):
+        if key not in Envelope.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return Envelope.FIELDS
+
+    def as_dict(self):
+        return {"msg": self.msg, "data": self.data, "success": self.success}
+
+    def render(self, dumps):
+        return b''.join((
+            b'{"msg":', dumps(self.msg),
+            b',"data":', dumps(self.data),
+            b',"success":', b'true' if self.success else b'false', b'}'))
+
+
+def _default(obj):
+    # The types orjson leaves to us that DRF's JSONEncoder handles.
+    if isinstance(obj, Promise):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, Envelope):
+        return obj.as_dict()
+    if isinstance(obj, QuerySet):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """
+    Encode ``data`` to compact UTF-8 JSON.
+
+    datetime, date, time and UUID values are encoded natively (RFC 3339,
+    without DRF's truncation to milliseconds); U+2028 and U+2029 are
+    escaped as DRF does, so the output is safe to embed in a script.
+    """
+    body = orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    if b'\xe2\x80\xa8' in body or b'\xe2\x80\xa9' in body:
+        body = body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return body
+
+
+class ORJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` on orjson, with ``Envelope`` written directly to bytes."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            if isinstance(data, Envelope):
+                data = data.as_dict()
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if isinstance(data, Envelope):
+            return data.render(dumps)
+        return dumps(data)
+
+
+class ORJSONParser(JSONParser):
+    """``JSONParser`` on orjson."""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read() if stream is not None else b''
+            if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+                body = body.decode(encoding).encode()
+            return orjson.loads(body)
+        except (ValueError, UnicodeError) as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+FAST_RENDERER_CLASSES = (ORJSONRenderer, BrowsableAPIRenderer)
+FAST_PARSER_CLASSES = (ORJSONParser, FormParser, MultiPartParser)
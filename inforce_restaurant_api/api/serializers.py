@@ -1,5 +1,13 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import User, Employee, Menu, Restaurant
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import is_revoked
+from .models import User, Employee, Menu, Restaurant, get_business_day
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -33,6 +41,28 @@ class UserLoginSerializer(serializers.Serializer):
         read_only_fields = ('id',)
 
 
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        try:
+            refresh = RefreshToken(attrs['refresh'])
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        if is_revoked(refresh):
+            raise InvalidToken('Token has been revoked')
+        return super().validate(attrs)
+
+
 class CreateRestaurantSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -49,11 +79,20 @@ class UploadMenuSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
 
         menu = Menu(
-            file=validated_data['file'],
             restaurant=validated_data['restaurant'],
-            uploaded_by=validated_data['uploaded_by']
+            uploaded_by=validated_data['uploaded_by'],
+            business_day=validated_data.get('business_day'),
         )
-        menu.save()
+        # Store the file before the savepoint, so its blob reference is not
+        # rolled back while the file delete below still drops it.
+        menu.file.save(validated_data['file'].name, validated_data['file'], save=False)
+        try:
+            with transaction.atomic():
+                menu.save()
+        except IntegrityError:
+            # Today's menu already exists; drop the file stored for this one.
+            menu.file.delete(save=False)
+            raise
         return menu
 
     class Meta:
@@ -85,6 +124,66 @@ class EmployeeSerializer(serializers.ModelSerializer):
         ]
 
 
+class EmployeeImportSerializer(serializers.Serializer):
+    """One row of a bulk employee import; uniqueness is checked per chunk, not per row."""
+
+    email = serializers.EmailField(max_length=255)
+    username = serializers.CharField(max_length=150)
+    employee_no = serializers.CharField(max_length=50)
+    first_name = serializers.CharField(max_length=150, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, allow_blank=True, default='')
+    phone = serializers.CharField(max_length=15)
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True)
+
+
+class ImportEmployeesSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], required=False)
+
+
+class ResultsHistorySerializer(serializers.Serializer):
+    """Query of the historical results; the range defaults to the 30 days before today."""
+
+    MAX_DAYS = 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    restaurant = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        end = data.get('end') or get_business_day() - timedelta(days=1)
+        start = data.get('start') or end - timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError('start must not be after end.')
+        if (end - start).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f'The range can span at most {self.MAX_DAYS} days.')
+        return dict(data, start=start, end=end)
+
+
+class RankedBallotSerializer(serializers.Serializer):
+    """Today's menus in order of preference; not every menu has to be ranked."""
+
+    rankings = serializers.ListField(child=serializers.IntegerField(min_value=1, max_value=2 ** 32 - 1), min_length=1)
+
+    def validate_rankings(self, rankings):
+        if len(set(rankings)) != len(rankings):
+            raise serializers.ValidationError('A menu can only be ranked once.')
+        if Menu.objects.filter(business_day=get_business_day(), id__in=rankings).count() != len(rankings):
+            raise serializers.ValidationError("Only today's menus can be ranked.")
+        return rankings
+
+
+class VoteChangeSerializer(serializers.Serializer):
+    """The menu of today to vote for instead."""
+
+    menu_id = serializers.IntegerField(min_value=1)
+
+    def validate_menu_id(self, menu_id):
+        if not Menu.objects.filter(business_day=get_business_day(), id=menu_id).exists():
+            raise serializers.ValidationError("You can only vote for today's menus.")
+        return menu_id
+
+
 class RestaurantListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Restaurant
@@ -94,15 +193,27 @@ class RestaurantListSerializer(serializers.ModelSerializer):
 class MenuListSerializer(serializers.ModelSerializer):
 
     restaurant = serializers.CharField(read_only=True)
+    votes = serializers.IntegerField(source='live_votes', read_only=True)
 
     class Meta:
         model = Menu
         fields = '__all__'
 
 
+class VoteHistorySerializer(serializers.Serializer):
+    """A vote as a ``values()`` row of ``Vote`` or ``VoteArchive``."""
+
+    id = serializers.IntegerField(read_only=True)
+    menu = serializers.IntegerField(source='menu_id', read_only=True)
+    restaurant = serializers.CharField(read_only=True)
+    business_day = serializers.DateField(read_only=True)
+    voted_at = serializers.DateTimeField(read_only=True)
+
+
 class ResultMenuListSerializer(serializers.ModelSerializer):
 
     restaurant = serializers.CharField(read_only=True)
+    votes = serializers.IntegerField(source='live_votes', read_only=True)
 
     class Meta:
         model = Menu
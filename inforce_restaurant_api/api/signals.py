@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import leaderboard
+from .caching import bump_content_version
+from .counters import menu_votes_changed, menu_votes_changing
+from .models import Employee, Menu, RankedBallot, Restaurant, Vote, VoteArchive
+
+
+@receiver(menu_votes_changing)
+def update_leaderboard_votes(sender, menu_id, amount, **kwargs):
+    leaderboard.record_votes_on_commit(menu_id, amount)
+
+
+@receiver(post_save, sender=Menu)
+def add_menu_to_leaderboard(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: leaderboard.add_menu(instance))
+
+
+@receiver(post_delete, sender=Menu)
+def remove_menu_from_leaderboard(sender, instance, **kwargs):
+    menu_id = instance.id
+    transaction.on_commit(lambda: leaderboard.remove_menu(menu_id))
+
+
+@receiver(post_delete, sender=Menu)
+def delete_archived_menu_votes(sender, instance, **kwargs):
+    # Archived votes hold plain ids; delete them like the CASCADE of Vote.
+    VoteArchive.objects.filter(menu_id=instance.id).delete()
+
+
+@receiver(post_delete, sender=Employee)
+def delete_archived_employee_votes(sender, instance, **kwargs):
+    VoteArchive.objects.filter(employee_id=instance.id).delete()
+
+
+@receiver(post_delete, sender=Menu)
+def release_menu_file(sender, instance, **kwargs):
+    if instance.file:
+        name, storage = instance.file.name, instance.file.storage
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(menu_votes_changed)
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_delete, sender=Vote)
+@receiver(post_save, sender=RankedBallot)
+@receiver(post_delete, sender=RankedBallot)
+def bump_version_on_write(sender, **kwargs):
+    bump_content_version()
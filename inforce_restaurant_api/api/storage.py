@@ -0,0 +1,110 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that keeps one copy of each distinct file.
+
+    Uploads are streamed to a temporary file in ``CHUNK_SIZE`` pieces and
+    hashed on the way, so memory use does not depend on the file size. The
+    file is then stored under its SHA-256 digest, e.g.
+    ``menus/3f/3fa9...e1.pdf``; uploading the same bytes again returns the
+    existing name. A ``StoredBlob`` row counts the references to each file,
+    and ``delete`` only removes the file when the last one goes away.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the final name from the content.
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()[:10]
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.path(directory), suffix='.upload', delete=False) as temporary:
+            try:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temporary.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.remove(temporary.name)
+                raise
+
+        digest = digest.hexdigest()
+        blob_name = posixpath.join(directory, digest[:2], digest + extension)
+        try:
+            with transaction.atomic():
+                blob = _add_reference(StoredBlob, digest, blob_name, size)
+                os.makedirs(os.path.dirname(self.path(blob.name)), exist_ok=True)
+                # Replace even if the file is there: the bytes are the same, and a
+                # concurrent delete of the last reference may just have removed it.
+                os.replace(temporary.name, self.path(blob.name))
+                if self.file_permissions_mode is not None:
+                    os.chmod(self.path(blob.name), self.file_permissions_mode)
+        finally:
+            if os.path.exists(temporary.name):
+                os.remove(temporary.name)
+        return blob.name
+
+    def delete(self, name):
+        """Drop one reference to ``name``, removing the file with the last one."""
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refcount > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            # Files stored before this backend have no blob and one owner.
+            super().delete(name)
+            if blob is not None:
+                blob.delete()
+                try:
+                    os.rmdir(os.path.dirname(self.path(name)))
+                except OSError:
+                    # Other blobs share the prefix directory.
+                    pass
+
+
+def _add_reference(model, digest, name, size):
+    blobs = model.objects.select_for_update().filter(digest=digest)
+    blob = blobs.first()
+    if blob is None:
+        try:
+            with transaction.atomic():
+                return model.objects.create(digest=digest, name=name, size=size, refcount=1)
+        except IntegrityError:
+            # Someone stored the same bytes at the same moment.
+            blob = blobs.get()
+    blobs.update(refcount=F('refcount') + 1)
+    return blob
+
+
+_storage = None
+
+
+def get_menu_storage():
+    """Storage of ``Menu.file``, built from ``settings.MENU_FILE_STORAGE``."""
+    global _storage
+    if _storage is None:
+        _storage = import_string(settings.MENU_FILE_STORAGE)()
+    return _storage
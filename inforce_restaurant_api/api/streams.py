@@ -0,0 +1,177 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import leaderboard
+from .clock import get_clock
+
+KEEPALIVE = b': keepalive\n\n'
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+def diff_rankings(previous, current):
+    """Entries that are new or changed in ``current``, and ids that disappeared."""
+    previous = {entry['id']: entry for entry in previous}
+    changed = [entry for entry in current if previous.get(entry['id']) != entry]
+    current_ids = {entry['id'] for entry in current}
+    removed = [menu_id for menu_id in previous if menu_id not in current_ids]
+    return changed, removed
+
+
+class Subscriber:
+    """
+    One connected client.
+
+    Messages wait in a small bounded queue. A client too slow to drain it
+    loses its queued deltas and is sent a fresh snapshot instead, so a
+    stalled connection costs a fixed amount of memory and never holds up
+    the broadcaster.
+    """
+
+    def __init__(self, max_queued):
+        self.queue = asyncio.Queue(max_queued)
+        self.resyncs = 0
+
+    def push(self, message, snapshot):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(snapshot())
+            self.resyncs += 1
+
+
+class ResultsBroadcaster:
+    """
+    Fans today's ranking out to every subscriber in this process.
+
+    While anyone is subscribed, a single task checks the shared
+    leaderboard version at most ``max_rate`` times per second. All votes
+    landed since the previous check (on any worker) are coalesced into one
+    delta that is serialised once and handed to every subscriber.
+    """
+
+    def __init__(self, board=None, clock=None, max_rate=None, max_queued=None, keepalive=None):
+        self.board = board
+        self.clock = clock
+        self.interval = 1 / (max_rate or settings.RESULTS_STREAM_MAX_RATE)
+        self.max_queued = max_queued or settings.RESULTS_STREAM_BUFFER
+        self.keepalive = keepalive or settings.RESULTS_STREAM_KEEPALIVE
+        self.subscribers = set()
+        self.published = 0
+        self._day = None
+        self._version = None
+        self._ranking = []
+        self._snapshot = None
+        self._task = None
+
+    async def subscribe(self):
+        if self._snapshot is None:
+            await self.refresh()
+        subscriber = Subscriber(self.max_queued)
+        subscriber.push(self._snapshot, self.get_snapshot)
+        self.subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def get_snapshot(self):
+        return self._snapshot
+
+    async def refresh(self):
+        """Read the board if it changed and publish the difference. Returns True if it did."""
+        board = self.board or leaderboard.get_leaderboard()
+        day = (self.clock or get_clock()).today()
+        version = board.get_version()
+        if day == self._day and version == self._version:
+            return False
+
+        ranking = board.get_ranking(day)
+        if ranking is None:
+            ranking = await sync_to_async(leaderboard.load_from_database)(day)
+            version = board.get_version()
+
+        if day != self._day:
+            message = None
+        else:
+            changed, removed = diff_rankings(self._ranking, ranking)
+            message = format_event('delta', {'version': version, 'changed': changed, 'removed': removed})
+
+        self._day, self._version, self._ranking = day, version, ranking
+        self._snapshot = format_event(
+            'snapshot', {'version': version, 'day': day.isoformat(), 'ranking': ranking})
+        self.published += 1
+        for subscriber in list(self.subscribers):
+            subscriber.push(message or self._snapshot, self.get_snapshot)
+        return True
+
+    async def _run(self):
+        while self.subscribers:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
+
+    async def stream(self, scope, receive, send):
+        subscriber = await self.subscribe()
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+            while not disconnected.done():
+                message = asyncio.ensure_future(subscriber.queue.get())
+                await asyncio.wait((message, disconnected), timeout=self.keepalive,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if message.done():
+                    body = message.result()
+                elif disconnected.done():
+                    message.cancel()
+                    break
+                else:
+                    message.cancel()
+                    body = KEEPALIVE
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            self.unsubscribe(subscriber)
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+_broadcaster = None
+
+
+def get_broadcaster():
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = ResultsBroadcaster()
+    return _broadcaster
+
+
+def route_results_stream(application, path=None, broadcaster=None):
+    """Wrap an ASGI application so that GET ``path`` streams live results as Server-Sent Events."""
+    path = path or settings.RESULTS_STREAM_PATH
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == path and scope['method'] == 'GET':
+            await (broadcaster or get_broadcaster()).stream(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,278 @@
+import threading
+from array import array
+from datetime import timedelta
+
+from .models import Menu, RankedBallot, unpack_ranking
+
+# Ranked-choice results of a business day, by instant runoff (IRV) or
+# Borda count.
+#
+# A Tally keeps its ballots grouped by ranking (identical ballots are
+# stored once, with a count) in flat arrays, and keeps the IRV rounds
+# between ballots: a new ballot adds one vote to each round's tally and
+# the rounds are only recounted from the first one whose elimination it
+# changes. Borda points and first choices are running sums, so reading
+# either result does not touch the ballots.
+#
+# Ties are broken the same way every time. IRV eliminates, among the
+# menus with the fewest votes, the one that had fewer votes in the latest
+# earlier round where they differed, and failing that the newest menu
+# (the highest id). Borda orders equal points by first choices, then by
+# menu id.
+
+METHODS = ('irv', 'borda')
+
+# A round number past every real round: "never eliminated", "nothing to recount".
+NEVER = 1 << 30
+
+
+class Tally:
+
+    def __init__(self, candidates=()):
+        # Candidates are kept in menu id order, so comparing their indexes
+        # compares menu ids.
+        self.candidates = sorted(set(candidates))
+        self.index = {menu_id: number for number, menu_id in enumerate(self.candidates)}
+        size = len(self.candidates)
+        self.ballots = 0
+        # Ballot groups: the rankings of group g (as candidate indexes) are
+        # choices[offsets[g]:offsets[g + 1]], cast by counts[g] ballots.
+        self.groups = {}
+        self.choices = array('H')
+        self.offsets = array('I', [0])
+        self.counts = array('I')
+        self.first_choices = [0] * size
+        self.appearances = [0] * size
+        self.position_sums = [0] * size
+        # IRV: the tallies of each round and the candidate eliminated after
+        # it; the last round has the winner. Rounds from ``stale_from`` on
+        # must be recounted.
+        self.rounds = []
+        self.eliminated = []
+        self.eliminated_in = [NEVER] * size
+        self.winner = None
+        self.stale_from = 0
+
+    def add(self, menu_ids, count=1):
+        """Add ``count`` ballots ranking ``menu_ids``; menus that are not candidates are skipped."""
+        ranking = []
+        for menu_id in menu_ids:
+            number = self.index.get(menu_id)
+            if number is not None and number not in ranking:
+                ranking.append(number)
+        ranking = tuple(ranking)
+
+        group = self.groups.get(ranking)
+        if group is None:
+            group = self.groups[ranking] = len(self.counts)
+            self.choices.extend(ranking)
+            self.offsets.append(len(self.choices))
+            self.counts.append(0)
+        self.counts[group] += count
+        self.ballots += count
+
+        if ranking:
+            self.first_choices[ranking[0]] += count
+        for position, number in enumerate(ranking):
+            self.appearances[number] += count
+            self.position_sums[number] += position * count
+        self._add_to_rounds(ranking, count)
+
+    def _add_to_rounds(self, ranking, count):
+        counted = min(self.stale_from, len(self.rounds))
+        position = 0
+        for number in range(counted):
+            while position < len(ranking) and self.eliminated_in[ranking[position]] < number:
+                position += 1
+            if position == len(ranking):
+                break
+            self.rounds[number][ranking[position]] += count
+        for number in range(counted):
+            if self._decide(number) != self._decision(number):
+                self.stale_from = number
+                break
+
+    def _decision(self, number):
+        if number < len(self.eliminated):
+            return False, self.eliminated[number]
+        return True, self.winner
+
+    def _decide(self, number):
+        """``(True, winner)`` if round ``number`` ends the count, else ``(False, eliminated)``."""
+        votes = self.rounds[number]
+        active = [candidate for candidate, out in enumerate(self.eliminated_in) if out >= number]
+        continuing = sum(votes[candidate] for candidate in active)
+        if not continuing:
+            return True, None
+        leader = max(active, key=votes.__getitem__)
+        if len(active) == 1 or 2 * votes[leader] > continuing:
+            return True, leader
+
+        fewest = min(votes[candidate] for candidate in active)
+        tied = [candidate for candidate in active if votes[candidate] == fewest]
+        for earlier in range(number - 1, -1, -1):
+            if len(tied) == 1:
+                break
+            fewest = min(self.rounds[earlier][candidate] for candidate in tied)
+            tied = [candidate for candidate in tied if self.rounds[earlier][candidate] == fewest]
+        return False, max(tied)
+
+    def _count_rounds(self):
+        start = self.stale_from
+        del self.rounds[start:]
+        del self.eliminated[start:]
+        for candidate, out in enumerate(self.eliminated_in):
+            if out != NEVER and out >= start:
+                self.eliminated_in[candidate] = NEVER
+
+        # Each group's current choice, and the groups each candidate holds.
+        positions = array('I', bytes(4 * len(self.counts)))
+        piles = [[] for _ in self.candidates]
+        votes = [0] * len(self.candidates)
+        for group, count in enumerate(self.counts):
+            position, end = self.offsets[group], self.offsets[group + 1]
+            while position < end and self.eliminated_in[self.choices[position]] < start:
+                position += 1
+            positions[group] = position
+            if position < end:
+                votes[self.choices[position]] += count
+                piles[self.choices[position]].append(group)
+
+        while True:
+            number = len(self.rounds)
+            self.rounds.append(votes)
+            done, candidate = self._decide(number)
+            if done:
+                self.winner = candidate
+                break
+            self.eliminated.append(candidate)
+            self.eliminated_in[candidate] = number
+            votes = list(votes)
+            votes[candidate] = 0
+            for group in piles[candidate]:
+                position, end = positions[group] + 1, self.offsets[group + 1]
+                while position < end and self.eliminated_in[self.choices[position]] <= number:
+                    position += 1
+                positions[group] = position
+                if position < end:
+                    votes[self.choices[position]] += self.counts[group]
+                    piles[self.choices[position]].append(group)
+            piles[candidate] = []
+        self.stale_from = NEVER
+
+    def irv(self):
+        """The instant-runoff winner and each round's votes."""
+        if self.stale_from < NEVER:
+            self._count_rounds()
+        rounds = []
+        for number, votes in enumerate(self.rounds):
+            active = [candidate for candidate, out in enumerate(self.eliminated_in) if out >= number]
+            active.sort(key=lambda candidate: (-votes[candidate], candidate))
+            eliminated = self.eliminated[number] if number < len(self.eliminated) else None
+            rounds.append({
+                'round': number + 1,
+                'votes': [{'menu': self.candidates[candidate], 'votes': votes[candidate]} for candidate in active],
+                'exhausted': self.ballots - sum(votes[candidate] for candidate in active),
+                'eliminated': None if eliminated is None else self.candidates[eliminated],
+            })
+        return {
+            'method': 'irv',
+            'ballots': self.ballots,
+            'winner': None if self.winner is None else self.candidates[self.winner],
+            'rounds': rounds,
+        }
+
+    def borda(self):
+        """
+        The Borda count: with n candidates, a ballot gives its first choice
+        n - 1 points, its second n - 2 and so on; unranked menus get none.
+        """
+        top = len(self.candidates) - 1
+        order = sorted(
+            range(len(self.candidates)),
+            key=lambda candidate: (
+                self.position_sums[candidate] - top * self.appearances[candidate],
+                -self.first_choices[candidate],
+                candidate))
+        ranking = [{
+            'menu': self.candidates[candidate],
+            'points': top * self.appearances[candidate] - self.position_sums[candidate],
+            'first_choices': self.first_choices[candidate],
+        } for candidate in order]
+        return {
+            'method': 'borda',
+            'ballots': self.ballots,
+            'winner': self.candidates[order[0]] if order and self.appearances[order[0]] else None,
+            'ranking': ranking,
+        }
+
+    def result(self, method):
+        return self.irv() if method == 'irv' else self.borda()
+
+    def with_candidates(self, candidates):
+        """A new tally of the same ballots for other candidates."""
+        tally = Tally(candidates)
+        for ranking, group in self.groups.items():
+            tally.add([self.candidates[number] for number in ranking], self.counts[group])
+        return tally
+
+
+class DayTally:
+    """The tally of a business day in this process, and the ballots it holds."""
+
+    # Ballots cast this long before the newest one seen are read again,
+    # in case they committed after it.
+    CATCH_UP = timedelta(seconds=30)
+
+    def __init__(self, day):
+        self.day = day
+        self.tally = Tally()
+        self.seen = set()
+        self.newest = None
+        self.lock = threading.Lock()
+
+    def sync(self):
+        """Bring the tally up to date with the day's menus and ballots."""
+        menus = list(Menu.objects.filter(business_day=self.day).values_list('id', flat=True))
+        if set(menus) != set(self.tally.candidates):
+            self.tally = self.tally.with_candidates(menus)
+
+        ballots = RankedBallot.objects.filter(business_day=self.day)
+        count = ballots.count()
+        if self.newest is not None:
+            self._read(ballots.filter(cast_at__gte=self.newest - self.CATCH_UP))
+        if count != len(self.seen):
+            # Ballots were deleted, or committed later than CATCH_UP.
+            self.tally, self.seen, self.newest = Tally(menus), set(), None
+            self._read(ballots)
+
+    def _read(self, ballots):
+        for ballot_id, rankings, cast_at in ballots.values_list('id', 'rankings', 'cast_at').iterator():
+            if ballot_id in self.seen:
+                continue
+            self.seen.add(ballot_id)
+            self.tally.add(unpack_ranking(rankings))
+            if self.newest is None or cast_at > self.newest:
+                self.newest = cast_at
+
+
+_day_tally = None
+_day_tally_lock = threading.Lock()
+
+
+def get_ranked_results(day, method):
+    """Ranked-choice results of ``day`` by ``method``, one of METHODS."""
+    global _day_tally
+    with _day_tally_lock:
+        if _day_tally is None or _day_tally.day != day:
+            _day_tally = DayTally(day)
+        day_tally = _day_tally
+    with day_tally.lock:
+        day_tally.sync()
+        return day_tally.tally.result(method)
+
+
+def reset_tallies():
+    global _day_tally
+    with _day_tally_lock:
+        _day_tally = None
@@ -1,11 +1,85 @@
-from django.urls import reverse
+import asyncio
+import base64
+import gc
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import pstats
+import subprocess
+import threading
+from datetime import date, datetime, timezone as dt_timezone
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.handlers.base import BaseHandler
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.utils import load_backend
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.test import APITestCase
-
-from api.models import User, Restaurant, Menu, Employee, Vote
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from api import async_views
+from api.archive import archive_votes
+from api.authentication import RevokedTokens
+from api.benchmarks import EndpointStats, Result, compare_baseline, percentile
+from api.caching import bump_content_version
+from api.clock import FrozenClock, SystemClock, set_clock
+from api.db.routers import PIN_COOKIE, RandomStrategy, ReplicaMiddleware, ReplicaRouter, RoutingState, \
+    _state as routing_state
+from api.db.pool import ConnectionPool, PoolExhausted, PoolExhaustedMiddleware, close_pools, pool_stats
+from api.counters import get_menu_votes, increment_menu_votes, reconcile_menu_votes, with_live_votes
+from api.hashing import HashingOverloaded, HashingPool
+from api.history import get_history, pending_days, rollup_closed_days
+from api.importing import import_employees
+from api.ingestion import VoteBuffer
+from api.metrics import LATENCY_BUCKETS, MetricsMiddleware, MetricsRegistry, registry, render
+from api.profiling import ProfilingMiddleware, QueryBudgetExceeded, make_profiling_token, repeated_queries
+from api.leaderboard import Leaderboard, get_leaderboard, load_from_database
+from api.listing import menu_rows, serialize_menu_rows
+from api.renderers import Envelope, ORJSONParser, ORJSONRenderer
+from api.tally import Tally, reset_tallies
+from api.streams import ResultsBroadcaster, Subscriber, route_results_stream
+from api.models import User, Restaurant, Menu, Employee, Vote, MenuVoteCounter, StoredBlob, DailyResult, \
+    VoteArchive, RankedBallot, get_business_day, pack_ranking, unpack_ranking
+from api.storage import ContentAddressedStorage
+from api.serializers import MenuListSerializer
 from api.token import get_token
+from api.views import MenuListAPIView, get_menu_list_data
+from api.voting import cast_vote
+
+
+def setUpModule():
+    # MEDIA_ROOT is unset, so uploaded menus would land in the working directory.
+    media_root = tempfile.TemporaryDirectory()
+    unittest.addModuleCleanup(media_root.cleanup)
+    media = override_settings(MEDIA_ROOT=media_root.name)
+    media.enable()
+    unittest.addModuleCleanup(media.disable)
+
+
+# The default file cache outlives test runs and is shared with the
+# development server; tests that keep state in it use this one instead.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-tests'}}
 
 
 class TestRegisterUserAPI(APITestCase):
@@ -201,3 +275,1845 @@ class TestGetResultsAPI(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
 
+class TestVoteCounters(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.employee = Employee.objects.create(user=self.user, employee_no="007")
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.file = SimpleUploadedFile("file.txt", b"abc", content_type="text/plain")
+        self.menu = Menu.objects.create(restaurant=self.restaurant, file=self.file, uploaded_by=self.user.username)
+
+    @override_settings(VOTE_COUNTER_SHARDS=4)
+    def test_sharded_increments_are_summed_on_read(self):
+        for _ in range(10):
+            increment_menu_votes(self.menu.id)
+
+        self.assertEqual(get_menu_votes(self.menu.id), 10)
+        self.assertLessEqual(MenuVoteCounter.objects.filter(menu=self.menu).count(), 4)
+
+    @override_settings(VOTE_COUNTER_SHARDS=4)
+    def test_reconcile_rebuilds_votes_from_vote_table(self):
+        Vote.objects.create(employee=self.employee, menu=self.menu)
+        for _ in range(3):
+            increment_menu_votes(self.menu.id)
+
+        call_command('reconcile_votes', stdout=open(os.devnull, 'w'))
+
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.votes, 1)
+        self.assertFalse(MenuVoteCounter.objects.filter(menu=self.menu).exists())
+        self.assertEqual(get_menu_votes(self.menu.id), 1)
+
+
+class TestConcurrentVoteCounting(TransactionTestCase):
+    workers = 16
+    votes = 2000
+
+    def setUp(self):
+        restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.menu = Menu.objects.create(restaurant=restaurant, file='menus/file.txt')
+
+    def fire_votes(self):
+        def vote(_):
+            try:
+                increment_menu_votes(self.menu.id)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(vote, range(self.votes)))
+
+    def test_parallel_votes_are_not_lost(self):
+        self.fire_votes()
+        self.assertEqual(get_menu_votes(self.menu.id), self.votes)
+
+    @override_settings(VOTE_COUNTER_SHARDS=8)
+    def test_parallel_sharded_votes_are_not_lost(self):
+        self.fire_votes()
+        self.assertEqual(get_menu_votes(self.menu.id), self.votes)
+
+    def test_parallel_cast_votes_match_the_vote_rows(self):
+        employees = Employee.objects.bulk_create(Employee(employee_no=str(number)) for number in range(200))
+
+        def vote(employee):
+            try:
+                return cast_vote(employee.id, self.menu.id)[0]['success']
+            finally:
+                connection.close()
+
+        # Every employee votes twice; only the first vote may count.
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            accepted = sum(executor.map(vote, employees + employees))
+
+        self.assertEqual(accepted, len(employees))
+        self.assertEqual(Vote.objects.filter(menu=self.menu).count(), len(employees))
+        self.assertEqual(get_menu_votes(self.menu.id), len(employees))
+
+
+class TestBufferedVoteIngestion(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.employee = Employee.objects.create(user=self.user, employee_no="007")
+        self.token = get_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.file = SimpleUploadedFile("file.txt", b"abc", content_type="text/plain")
+        self.menu = Menu.objects.create(restaurant=self.restaurant, file=self.file, uploaded_by=self.user.username)
+        self.journal_dir = tempfile.mkdtemp()
+
+    @override_settings(VOTE_INGESTION='buffered')
+    def test_buffered_vote_is_acknowledged_then_flushed(self):
+        buffer = VoteBuffer(max_size=100, flush_interval=None)
+        with mock.patch('api.voting.get_vote_buffer', return_value=buffer):
+            res = self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menu.id}))
+            duplicate = self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menu.id}))
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(duplicate.json()['success'], False)
+        self.assertEqual(Vote.objects.count(), 0)
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(get_menu_votes(self.menu.id), 1)
+
+    def test_flush_writes_one_insert_and_one_counter_update_per_menu(self):
+        other = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name='Puzata hata', contact_no='+3809777777', address='Lviv'),
+            file=self.file,
+            uploaded_by=self.user.username)
+        employees = [Employee.objects.create(employee_no=str(no)) for no in range(10)]
+        buffer = VoteBuffer(max_size=100, flush_interval=None)
+        for no, employee in enumerate(employees):
+            buffer.add(employee.id, self.menu.id if no % 2 else other.id)
+
+        # menu, employee and existing-votes lookups, bulk insert and one
+        # counter update per menu, plus the savepoint pair of the enclosing
+        # atomic block
+        with self.assertNumQueries(8):
+            self.assertEqual(buffer.flush(), 10)
+        self.assertEqual(get_menu_votes(self.menu.id), 5)
+        self.assertEqual(get_menu_votes(other.id), 5)
+
+    def test_size_threshold_triggers_flush(self):
+        buffer = VoteBuffer(max_size=1, flush_interval=None)
+        buffer.add(self.employee.id, self.menu.id)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_journaled_votes_survive_a_crash(self):
+        crashed = VoteBuffer(max_size=100, flush_interval=None, journal_dir=self.journal_dir)
+        crashed.add(self.employee.id, self.menu.id)
+        # A dead process releases its journal lock without flushing.
+        crashed._journal.close()
+
+        restarted = VoteBuffer(max_size=100, flush_interval=None, journal_dir=self.journal_dir)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(get_menu_votes(self.menu.id), 1)
+        restarted.close()
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_votes_for_deleted_menus_do_not_block_the_others(self):
+        other = Menu.objects.create(
+            restaurant=Restaurant.objects.create(name='Puzata hata', contact_no='+3809777777', address='Lviv'),
+            file=self.file,
+            uploaded_by=self.user.username)
+        colleague = Employee.objects.create(employee_no="008")
+        buffer = VoteBuffer(max_size=100, flush_interval=None)
+        buffer.add(self.employee.id, other.id)
+        buffer.add(colleague.id, self.menu.id)
+        other.delete()
+
+        with self.assertLogs('api.ingestion', 'WARNING'):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(Vote.objects.values_list('employee_id', 'menu_id')), [(colleague.id, self.menu.id)])
+
+        crashed = VoteBuffer(max_size=100, flush_interval=None, journal_dir=self.journal_dir)
+        crashed.add(self.employee.id, self.menu.id)
+        crashed.add(Employee.objects.create(employee_no="009").id, self.menu.id - 1000)
+        crashed._journal.close()
+
+        with self.assertLogs('api.ingestion', 'WARNING'):
+            restarted = VoteBuffer(max_size=100, flush_interval=None, journal_dir=self.journal_dir)
+        self.assertEqual(get_menu_votes(self.menu.id), 2)
+        restarted.close()
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_failed_replays_do_not_stop_the_buffer(self):
+        crashed = VoteBuffer(max_size=100, flush_interval=None, journal_dir=self.journal_dir)
+        crashed.add(self.employee.id, self.menu.id)
+        crashed._journal.close()
+        # Journals are named after the pid of their worker.
+        leftover = os.path.join(self.journal_dir, 'votes-1.journal')
+        os.rename(crashed._journal.name, leftover)
+
+        with mock.patch('api.ingestion.write_votes', side_effect=IntegrityError), \
+                self.assertLogs('api.ingestion', 'ERROR'):
+            restarted = VoteBuffer(max_size=100, flush_interval=None, journal_dir=self.journal_dir)
+        self.assertTrue(restarted.add(self.employee.id, self.menu.id))
+        restarted.close()
+        self.assertEqual(Vote.objects.count(), 1)
+        # The journal that failed to replay is kept for the next start.
+        self.assertEqual(os.listdir(self.journal_dir), ['votes-1.journal'])
+
+
+class TestLiveLeaderboard(APITestCase):
+
+    def setUp(self):
+        get_leaderboard().reset()
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.employee = Employee.objects.create(user=self.user, employee_no="007")
+        self.token = get_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+        self.file = SimpleUploadedFile("file.txt", b"abc", content_type="text/plain")
+        self.menus = [
+            Menu.objects.create(
+                restaurant=Restaurant.objects.create(name=name, contact_no='+3809777777', address='Lviv'),
+                file=self.file,
+                uploaded_by=self.user.username)
+            for name in ('Burger King', 'Puzata hata', 'Kryivka')
+        ]
+
+    def test_results_are_served_from_shared_memory(self):
+        self.client.get(reverse("api:results"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menus[1].id}))
+
+        self.client.credentials()
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse("api:results"))
+
+        data = res.json()['data']
+        self.assertEqual(data['id'], self.menus[1].id)
+        self.assertEqual(data['votes'], 1)
+        self.assertEqual(data['restaurant'], 'Puzata hata')
+        self.assertEqual([entry['rank'] for entry in data['ranking']], [1, 2, 2])
+
+    def test_tied_winners_share_first_rank(self):
+        for menu in self.menus[:2]:
+            increment_menu_votes(menu.id, 2)
+
+        res = self.client.get(reverse("api:results"))
+
+        self.assertEqual(res.json()['msg'], 'Several restaurants are tied for today.')
+        self.assertEqual(
+            [entry['id'] for entry in res.json()['data']['winners']],
+            sorted(menu.id for menu in self.menus[:2]))
+
+    def test_votes_are_visible_to_other_workers(self):
+        path = os.path.join(tempfile.mkdtemp(), 'leaderboard')
+        worker, other_worker = Leaderboard(path, 8), Leaderboard(path, 8)
+        today = self.menus[0].created_at.date()
+        worker.load(today, [{
+            'id': 1, 'file': 'menus/file.txt', 'restaurant': 'Burger King', 'votes': 0, 'created_at': '',
+        }])
+
+        worker.record_votes(1, 3)
+
+        self.assertEqual(other_worker.get_ranking(today)[0]['votes'], 3)
+        self.assertIsNone(other_worker.get_ranking(today.replace(year=today.year - 1)))
+
+    def test_a_second_load_keeps_recorded_votes(self):
+        path = os.path.join(tempfile.mkdtemp(), 'leaderboard')
+        worker, other_worker = Leaderboard(path, 8), Leaderboard(path, 8)
+        today = self.menus[0].created_at.date()
+        entries = [{'id': 1, 'file': 'menus/file.txt', 'restaurant': 'Burger King', 'votes': 0, 'created_at': ''}]
+        worker.load_missing(today, lambda: [dict(entry) for entry in entries])
+        worker.record_votes(1, 3)
+
+        ranking = other_worker.load_missing(today, lambda: self.fail('the board already holds today'))
+
+        self.assertEqual(ranking[0]['votes'], 3)
+
+    def test_votes_a_reload_read_are_not_counted_twice(self):
+        menu = self.menus[0]
+        self.client.get(reverse("api:results"))
+        with self.captureOnCommitCallbacks(execute=True):
+            increment_menu_votes(menu.id)
+            # Another worker reloads the board after the commit, before the callback runs.
+            get_leaderboard().reset()
+            load_from_database(menu.business_day)
+        with self.captureOnCommitCallbacks(execute=True):
+            increment_menu_votes(menu.id)
+
+        ranking = get_leaderboard().get_ranking(menu.business_day)
+        self.assertEqual({entry['id']: entry['votes'] for entry in ranking}[menu.id], 2)
+
+    def test_deleted_menus_leave_the_results(self):
+        self.client.get(reverse("api:results"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menus[0].id}))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menus[0].restaurant.delete()
+
+        ranking = self.client.get(reverse("api:results")).json()['data']['ranking']
+
+        self.assertEqual(sorted(entry['id'] for entry in ranking), sorted(menu.id for menu in self.menus[1:]))
+
+    def test_reconcile_rebuilds_the_results(self):
+        self.client.get(reverse("api:results"))
+        with self.captureOnCommitCallbacks(execute=True):
+            increment_menu_votes(self.menus[2].id, 5)
+        self.client.get(reverse("api:results"))
+
+        call_command('reconcile_votes', stdout=open(os.devnull, 'w'))
+
+        res = self.client.get(reverse("api:results"))
+        self.assertEqual([entry['votes'] for entry in res.json()['data']['ranking']], [0, 0, 0])
+
+
+class TestConditionalGet(APITestCase):
+
+    def setUp(self):
+        get_leaderboard().reset()
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.file = SimpleUploadedFile("file.txt", b"abc", content_type="text/plain")
+        self.menu = Menu.objects.create(restaurant=self.restaurant, file=self.file, uploaded_by=self.user.username)
+
+    def test_unchanged_poll_returns_not_modified_without_queries(self):
+        for url in (reverse("api:menu-list"), reverse("api:results")):
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            with self.assertNumQueries(0):
+                cached = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+            self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(cached['ETag'], res['ETag'])
+
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+            self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_writes_change_the_etag(self):
+        res = self.client.get(reverse("api:menu-list"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            increment_menu_votes(self.menu.id)
+
+        changed = self.client.get(reverse("api:menu-list"), HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], res['ETag'])
+        self.assertEqual(changed.json()['data'][0]['votes'], 1)
+
+    def test_gzip_body_is_served_when_accepted(self):
+        plain = self.client.get(reverse("api:menu-list"))
+        compressed = self.client.get(reverse("api:menu-list"), HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), plain.json())
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+
+
+class TestBusinessDayConstraints(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.employee = Employee.objects.create(user=self.user, employee_no="007")
+        self.token = get_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.file = SimpleUploadedFile("file.txt", b"abc", content_type="text/plain")
+
+    def test_business_day_uses_configured_time_zone(self):
+        late_evening_utc = datetime(2022, 7, 20, 22, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(get_business_day(late_evening_utc).isoformat(), '2022-07-21')
+
+    def test_employee_votes_once_per_day(self):
+        menus = [
+            Menu.objects.create(
+                restaurant=Restaurant.objects.create(name=name, contact_no='+3809777777', address='Lviv'),
+                file=self.file)
+            for name in ('Puzata hata', 'Kryivka')
+        ]
+
+        first = self.client.get(reverse("api:new-vote", kwargs={'menu_id': menus[0].id}))
+        second = self.client.get(reverse("api:new-vote", kwargs={'menu_id': menus[1].id}))
+
+        self.assertEqual(first.json()['success'], True)
+        self.assertEqual(second.json()['msg'], 'You already voted!')
+        self.assertEqual(Vote.objects.get().business_day, get_business_day())
+        self.assertEqual(get_menu_votes(menus[1].id), 0)
+
+    def test_second_menu_for_the_same_day_is_rejected(self):
+        payload = {'restaurant': self.restaurant.id, 'uploaded_by': 'Volodymyr'}
+        self.client.post(
+            reverse("api:upload-menu"),
+            data=dict(payload, file=SimpleUploadedFile("one.txt", b"abc")),
+            format="multipart")
+        res = self.client.post(
+            reverse("api:upload-menu"),
+            data=dict(payload, file=SimpleUploadedFile("two.txt", b"abc")),
+            format="multipart")
+
+        self.assertEqual(res.json()['msg'], 'Menu already added.')
+        self.assertEqual(Menu.objects.filter(restaurant=self.restaurant).count(), 1)
+
+
+class TestBusinessClock(APITestCase):
+
+    def setUp(self):
+        get_leaderboard().reset()
+        self.clock = FrozenClock(datetime(2022, 7, 20, 11, 45))
+        self.addCleanup(set_clock, set_clock(self.clock))
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.token = get_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.payload = {'restaurant': self.restaurant.id, 'uploaded_by': 'Volodymyr'}
+
+    def upload_menu(self):
+        return self.client.post(
+            reverse("api:upload-menu"),
+            data=dict(self.payload, file=SimpleUploadedFile("file.txt", b"abc")),
+            format="multipart")
+
+    def test_running_worker_moves_to_the_next_day(self):
+        self.upload_menu()
+        self.assertEqual(len(self.client.get(reverse("api:menu-list")).json()['data']), 1)
+
+        self.clock.advance(days=1)
+
+        self.assertEqual(self.client.get(reverse("api:menu-list")).json()['data'], [])
+        self.assertEqual(self.client.get(reverse("api:results")).json()['success'], False)
+        self.assertEqual(self.upload_menu().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(Menu.objects.values_list('business_day', flat=True)),
+            [date(2022, 7, 20), date(2022, 7, 21)])
+
+    def test_system_clock_follows_the_calendar(self):
+        clock = SystemClock()
+        self.assertEqual(clock.today(), date.today())
+        clock._rollover_at = 0
+        self.assertEqual(clock.today(), date.today())
+
+
+class TestResultsStream(SimpleTestCase):
+    subscribers = 1000
+
+    def setUp(self):
+        day = date(2022, 7, 20)
+        self.board = Leaderboard(os.path.join(tempfile.mkdtemp(), 'leaderboard'), 8)
+        self.board.load(day, [
+            {'id': menu_id, 'file': 'menus/file.txt', 'restaurant': name, 'votes': 0, 'created_at': ''}
+            for menu_id, name in ((1, 'Burger King'), (2, 'Puzata hata'))
+        ])
+        self.broadcaster = ResultsBroadcaster(
+            board=self.board, clock=FrozenClock(datetime(2022, 7, 20, 11, 45)), max_rate=50)
+        self.app = route_results_stream(None, path='/api/results/stream/', broadcaster=self.broadcaster)
+
+    async def wait_for(self, condition, timeout=10):
+        async def poll():
+            while not condition():
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(poll(), timeout)
+
+    async def test_votes_are_pushed_to_concurrent_subscribers(self):
+        disconnect = asyncio.Event()
+        received = [[] for _ in range(self.subscribers)]
+
+        async def client(messages):
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.body':
+                    messages.append(message['body'])
+
+            await self.app({'type': 'http', 'path': '/api/results/stream/', 'method': 'GET'}, receive, send)
+
+        clients = [asyncio.ensure_future(client(messages)) for messages in received]
+        await self.wait_for(lambda: all(received))
+        self.assertTrue(received[0][0].startswith(b'event: snapshot'))
+
+        self.board.record_votes(2, 3)
+        self.board.record_votes(1, 1)
+        await self.wait_for(lambda: all(len(messages) == 2 for messages in received))
+
+        # Both votes are coalesced into one delta, serialised once for everybody.
+        self.assertEqual(self.broadcaster.published, 2)
+        self.assertEqual(len({messages[1] for messages in received}), 1)
+        delta = json.loads(received[0][1].split(b'data: ')[1])
+        self.assertEqual(
+            [(entry['id'], entry['votes'], entry['rank']) for entry in delta['changed']],
+            [(2, 3, 1), (1, 1, 2)])
+
+        disconnect.set()
+        await asyncio.gather(*clients)
+        self.assertEqual(self.broadcaster.subscribers, set())
+
+    async def test_slow_subscriber_is_resynced_with_a_snapshot(self):
+        subscriber = Subscriber(max_queued=2)
+        for number in range(3):
+            subscriber.push(f'delta {number}'.encode(), lambda: b'snapshot')
+
+        self.assertEqual(subscriber.queue.qsize(), 1)
+        self.assertEqual(subscriber.resyncs, 1)
+        self.assertEqual(subscriber.queue.get_nowait(), b'snapshot')
+
+
+class TestAsyncViews(APITestCase):
+
+    def setUp(self):
+        get_leaderboard().reset()
+        # AsyncRequestFactory only takes headers from Django 4.2 on; the views
+        # accept any HttpRequest.
+        self.factory = RequestFactory()
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.employee = Employee.objects.create(user=self.user, employee_no="007")
+        self.token = get_token(self.user)
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.file = SimpleUploadedFile("file.txt", b"abc", content_type="text/plain")
+        self.menu = Menu.objects.create(restaurant=self.restaurant, file=self.file, uploaded_by=self.user.username)
+
+    async def test_async_vote(self):
+        url = reverse("api:new-vote", kwargs={'menu_id': self.menu.id})
+        request = self.factory.get(url, HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+
+        res = await async_views.vote(request, menu_id=self.menu.id)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(res.content)['msg'], 'You voted successfully!')
+        self.assertEqual(await sync_to_async(Vote.objects.filter(employee=self.employee).count)(), 1)
+
+    async def test_async_vote_requires_a_valid_token(self):
+        url = reverse("api:new-vote", kwargs={'menu_id': self.menu.id})
+
+        missing = await async_views.vote(self.factory.get(url), menu_id=self.menu.id)
+        invalid = await async_views.vote(
+            self.factory.get(url, HTTP_AUTHORIZATION='Bearer nonsense'), menu_id=self.menu.id)
+
+        self.assertEqual(missing.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(invalid.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_async_reads_match_the_sync_views(self):
+        for name, view in (
+                ("api:restaurants", async_views.restaurants),
+                ("api:menu-list", async_views.menu_list),
+                ("api:results", async_views.results)):
+            url = reverse(name)
+            expected = await sync_to_async(self.client.get)(url)
+
+            res = await view(self.factory.get(url))
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(res.content), expected.json())
+
+    async def test_async_read_returns_not_modified(self):
+        url = reverse("api:results")
+        res = await async_views.results(self.factory.get(url))
+
+        cached = await async_views.results(self.factory.get(url, HTTP_IF_NONE_MATCH=res['ETag']))
+
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TestClaimsAuthentication(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('api.authentication._revoked', RevokedTokens())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.employee = Employee.objects.create(user=self.user, employee_no="007")
+        self.token = get_token(self.user)
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.file = SimpleUploadedFile("file.txt", b"abc", content_type="text/plain")
+        self.menu = Menu.objects.create(restaurant=self.restaurant, file=self.file, uploaded_by=self.user.username)
+
+    def test_token_carries_employee_claims(self):
+        token = AccessToken(self.token["access"])
+
+        self.assertEqual(token['employee_id'], self.employee.id)
+        self.assertEqual(token['role'], 'admin')
+        self.assertEqual(token['username'], 'admin')
+
+    def test_vote_does_not_load_the_user_or_employee(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menu.id}))
+
+        self.assertEqual(res.json()['msg'], 'You voted successfully!')
+        tables = (User._meta.db_table, Employee._meta.db_table)
+        self.assertFalse([query for query in queries if any(table in query['sql'] for table in tables)])
+
+    def test_token_without_claims_falls_back_to_the_database(self):
+        access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        res = self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menu.id}))
+
+        self.assertEqual(res.json()['msg'], 'You voted successfully!')
+        self.assertEqual(Vote.objects.get().employee, self.employee)
+
+    def test_logout_revokes_the_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+
+        res = self.client.post(reverse("api:logout"), data={"refresh": self.token["refresh"]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menu.id}))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials()
+        res = self.client.post(reverse("api:token_refresh"), data={"refresh": self.token["refresh"]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_revocations_reach_other_workers_between_cache_reads(self):
+        url = reverse("api:restaurants")
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        # Another worker logs the token out.
+        access = AccessToken(self.token["access"])
+        RevokedTokens().add(access['jti'], access['exp'])
+        with mock.patch('api.authentication.cache') as shared_cache:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        shared_cache.get.assert_not_called()
+
+        with override_settings(REVOKED_TOKENS_REFRESH_INTERVAL=0):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestPasswordHashing(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(first_name='Volodymyr', last_name='Potapenko', email='vova9199@ukr.net')
+        self.data = {"email": "vova9199@ukr.net", "password": "testpass"}
+
+    def test_login_upgrades_an_outdated_hash(self):
+        old_hash = PBKDF2PasswordHasher().encode('testpass', 'salt', iterations=1000)
+        User.objects.filter(pk=self.user.pk).update(password=old_hash)
+
+        res = self.client.post(reverse("api:login"), data=self.data)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.password, old_hash)
+        self.assertFalse(PBKDF2PasswordHasher().must_update(self.user.password))
+        self.assertTrue(self.user.check_password('testpass'))
+
+    def test_wrong_password_is_not_upgraded(self):
+        old_hash = PBKDF2PasswordHasher().encode('testpass', 'salt', iterations=1000)
+        User.objects.filter(pk=self.user.pk).update(password=old_hash)
+
+        res = self.client.post(reverse("api:login"), data=dict(self.data, password='wrong'))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, old_hash)
+
+    def test_registration_hashes_the_password(self):
+        data = {
+            "email": "vova9199test@ukr.net",
+            "first_name": "Volodymyr",
+            "last_name": "Potapenko",
+            "phone": "+380977544577",
+            "username": "vova_test",
+            "password": "testpass"
+        }
+        self.client.post(reverse("api:registration"), data=data)
+
+        self.assertTrue(User.objects.get(email="vova9199test@ukr.net").check_password("testpass"))
+
+    def test_overloaded_pool_rejects_work(self):
+        pool = HashingPool(max_workers=1, max_queued=0)
+        self.addCleanup(pool.shutdown)
+
+        pool.submit(time.sleep, 1)
+        with self.assertRaises(HashingOverloaded):
+            pool.submit(time.sleep, 0)
+
+    def test_login_returns_service_unavailable_when_overloaded(self):
+        with mock.patch('api.views.verify_password', side_effect=HashingOverloaded()):
+            res = self.client.post(reverse("api:login"), data=self.data)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertFalse(res.json()['success'])
+
+
+class TestEmployeeImport(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        Employee.objects.create(user=self.user, employee_no="007")
+        self.token = get_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+
+    def rows(self, count, start=1):
+        return [
+            {"email": f"employee{n}@example.com", "username": f"employee{n}", "employee_no": f"E{n}",
+             "first_name": "volodymyr", "last_name": "potapenko", "phone": "+3809777777"}
+            for n in range(start, start + count)
+        ]
+
+    def test_csv_import_reports_rejected_rows(self):
+        rows = self.rows(3)
+        rows[1]["employee_no"] = "007"
+        rows[2]["email"] = "not an email"
+        rows[0]["password"] = "testpass"
+        content = "email,username,employee_no,first_name,last_name,phone,password\n" + "".join(
+            f'{r["email"]},{r["username"]},{r["employee_no"]},{r["first_name"]},{r["last_name"]},'
+            f'{r["phone"]},{r.get("password", "")}\n' for r in rows)
+        upload = SimpleUploadedFile("employees.csv", content.encode(), content_type="text/csv")
+
+        res = self.client.post(reverse("api:import-employees"), data={"file": upload}, format="multipart")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        data = res.json()["data"]
+        self.assertEqual(data["created"], 1)
+        self.assertEqual([rejected["row"] for rejected in data["rejected"]], [3, 4])
+        self.assertIn("employee_no", data["rejected"][0]["errors"])
+        self.assertIn("email", data["rejected"][1]["errors"])
+        user = User.objects.get(email="employee1@example.com")
+        self.assertEqual(user.first_name, "Volodymyr")
+        self.assertTrue(user.check_password("testpass"))
+        self.assertEqual(Employee.objects.get(user=user).employee_no, "E1")
+
+    def test_ndjson_import_rejects_duplicates_within_the_upload(self):
+        rows = self.rows(3)
+        rows[2]["username"] = rows[0]["username"]
+        lines = [json.dumps(row) for row in rows] + ["{not json"]
+        upload = SimpleUploadedFile("employees.ndjson", "\n".join(lines).encode())
+
+        res = self.client.post(reverse("api:import-employees"), data={"file": upload}, format="multipart")
+
+        data = res.json()["data"]
+        self.assertEqual(data["created"], 2)
+        self.assertEqual([rejected["row"] for rejected in data["rejected"]], [3, 4])
+        self.assertFalse(res.json()["success"])
+
+    def test_import_queries_do_not_grow_with_the_chunk(self):
+        query_counts = []
+        for count in (10, 50):
+            rows = [(n, row) for n, row in enumerate(self.rows(count, start=count), start=1)]
+            with CaptureQueriesContext(connection) as queries:
+                report = import_employees(rows, chunk_size=count)
+            self.assertEqual(report.created, count)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_import_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'employees.ndjson')
+        rows = self.rows(2)
+        rows[1]["employee_no"] = "007"
+        with open(path, 'w') as f:
+            f.write("\n".join(json.dumps(row) for row in rows))
+        stdout, stderr = io.StringIO(), io.StringIO()
+
+        call_command('import_employees', path, stdout=stdout, stderr=stderr)
+
+        self.assertIn('Imported 1 employees, rejected 1 rows.', stdout.getvalue())
+        self.assertIn('row 2: employee_no: EMPLOYEE NO 007 already exists', stderr.getvalue())
+
+
+class TestContentAddressedStorage(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.token = get_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token["access"])
+        self.restaurants = [
+            Restaurant.objects.create(name=name, contact_no='+3809777777', address='Lviv')
+            for name in ('Burger King', 'Puzata hata')
+        ]
+
+    def upload(self, restaurant, content=b"same menu"):
+        payload = {
+            "file": SimpleUploadedFile("menu.pdf", content, content_type="application/pdf"),
+            "restaurant": restaurant.id,
+            "uploaded_by": "Volodymyr"}
+        return self.client.post(reverse("api:upload-menu"), data=payload, format="multipart")
+
+    def test_identical_uploads_share_one_file(self):
+        self.upload(self.restaurants[0])
+        self.upload(self.restaurants[1])
+
+        first, second = Menu.objects.order_by('id')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.endswith(hashlib.sha256(b"same menu").hexdigest() + '.pdf'))
+        blob = StoredBlob.objects.get()
+        self.assertEqual((blob.name, blob.refcount, blob.size), (first.file.name, 2, 9))
+
+    def test_file_is_removed_with_its_last_reference(self):
+        self.upload(self.restaurants[0])
+        self.upload(self.restaurants[1])
+        first, second = Menu.objects.order_by('id')
+        path = first.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_rejected_upload_releases_its_reference(self):
+        self.upload(self.restaurants[0])
+
+        res = self.upload(self.restaurants[0])
+
+        self.assertEqual(res.json()["msg"], "Menu already added.")
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+
+    def test_large_files_are_stored_in_chunks(self):
+        storage = ContentAddressedStorage(location=tempfile.mkdtemp())
+        content = os.urandom(5 * 64 * 1024 + 123)
+
+        name = storage.save('menus/big.jpg', ContentFile(content))
+
+        self.assertEqual(name, f'menus/{hashlib.sha256(content).hexdigest()[:2]}/'
+                               f'{hashlib.sha256(content).hexdigest()}.jpg')
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(storage.save('menus/copy.jpg', ContentFile(content)), name)
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(name))), [os.path.basename(name)])
+
+
+class TestMenuFileDownload(APITestCase):
+
+    def setUp(self):
+        self.content = b"0123456789" * 10
+        self.restaurant = Restaurant.objects.create(name='Burger King', contact_no='+3809777777', address='Lviv')
+        self.file = SimpleUploadedFile("menu.pdf", self.content, content_type="application/pdf")
+        self.menu = Menu.objects.create(restaurant=self.restaurant, file=self.file, uploaded_by='Volodymyr')
+        self.url = reverse("api:menu-file", kwargs={'menu_id': self.menu.id})
+
+    def get(self, **headers):
+        res = self.client.get(self.url, **headers)
+        # Reading a streamed body to the end closes the file.
+        res.body = b''.join(res.streaming_content) if res.streaming else res.content
+        return res
+
+    def test_download(self):
+        res = self.get(HTTP_ACCEPT='application/pdf')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.body, self.content)
+        self.assertEqual(res['Content-Type'], 'application/pdf')
+        self.assertEqual(res['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+
+    def test_if_none_match(self):
+        etag = self.get()['ETag']
+
+        res = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_requests(self):
+        for header, expected, content_range in (
+                ('bytes=2-4', self.content[2:5], 'bytes 2-4/100'),
+                ('bytes=95-', self.content[95:], 'bytes 95-99/100'),
+                ('bytes=-3', self.content[-3:], 'bytes 97-99/100'),
+                ('bytes=90-200', self.content[90:], 'bytes 90-99/100')):
+            res = self.get(HTTP_RANGE=header)
+
+            self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+            self.assertEqual(res.body, expected)
+            self.assertEqual(res['Content-Length'], str(len(expected)))
+            self.assertEqual(res['Content-Range'], content_range)
+
+    def test_unsatisfiable_range(self):
+        res = self.get(HTTP_RANGE='bytes=100-')
+
+        self.assertEqual(res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(res['Content-Range'], 'bytes */100')
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        res = self.get(HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.body, self.content)
+
+    @override_settings(MENU_FILE_SENDFILE='x-accel-redirect', MENU_FILE_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        res = self.get()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], '/protected-media/' + self.menu.file.name)
+        self.assertEqual(res.body, b'')
+
+    def test_missing_menu(self):
+        res = self.client.get(reverse("api:menu-file", kwargs={'menu_id': self.menu.id + 1}))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestKeysetPagination(APITestCase):
+
+    def setUp(self):
+        created_at = datetime(2022, 7, 1, 12, 0)
+        self.restaurants = []
+        for number in range(7):
+            restaurant = Restaurant.objects.create(name=f'Restaurant {number}', contact_no='+380', address='Lviv')
+            # Pairs share a timestamp, so pages must break ties on id.
+            Restaurant.objects.filter(pk=restaurant.pk).update(created_at=created_at.replace(minute=number // 2))
+            self.restaurants.append(restaurant)
+        self.expected = list(Restaurant.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            res = self.client.get(url)
+            ids.extend(restaurant['id'] for restaurant in res.json()['results'])
+            url = res.json()['next']
+        return ids
+
+    def test_pages_follow_created_at_and_id(self):
+        self.assertEqual(self.walk(reverse("api:restaurants") + '?page_size=3'), self.expected)
+
+    def test_inserts_do_not_shift_later_pages(self):
+        res = self.client.get(reverse("api:restaurants") + '?page_size=3')
+        Restaurant.objects.create(name='Newcomer', contact_no='+380', address='Lviv')
+
+        rest = self.walk(res.json()['next'])
+
+        self.assertEqual([r['id'] for r in res.json()['results']] + rest, self.expected)
+
+    def test_previous_link(self):
+        first = self.client.get(reverse("api:restaurants") + '?page_size=3').json()
+        second = self.client.get(first['next']).json()
+
+        previous = self.client.get(second['previous']).json()
+
+        self.assertEqual(previous['results'], first['results'])
+        self.assertIsNone(previous['previous'])
+        self.assertIsNone(first['previous'])
+
+    def test_deep_pages_cost_one_query(self):
+        url = self.client.get(reverse("api:restaurants") + '?page_size=2').json()['next']
+        url = self.client.get(url).json()['next']
+
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_invalid_cursor(self):
+        res = self.client.get(reverse("api:restaurants") + '?cursor=nonsense')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_malformed_cursor(self):
+        for payload in (["2024-01-01T00:00:00", "abc", 0], ["2024-01-01T00:00:00", None, 0],
+                        ["2024-01-01T00:00:00", 1, 2], ["2024-01-01T00:00:00", 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            res = self.client.get(reverse("api:restaurants"), {'cursor': cursor})
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND, payload)
+
+    def test_vote_history_lists_own_votes_newest_first(self):
+        user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        employee = Employee.objects.create(user=user, employee_no="007")
+        other = Employee.objects.create(
+            user=User.objects.create(username='other', email='other@example.com'), employee_no="008")
+        menus = [
+            Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"))
+            for restaurant in self.restaurants[:3]
+        ]
+        votes = [
+            Vote.objects.create(employee=employee, menu=menu, business_day=date(2022, 7, day),
+                                voted_at=datetime(2022, 7, day, 11, 0))
+            for day, menu in enumerate(menus, start=1)
+        ]
+        Vote.objects.create(employee=other, menu=menus[0], business_day=date(2022, 7, 1))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_token(user)["access"])
+
+        res = self.client.get(reverse("api:vote-history") + '?page_size=2')
+        rest = self.client.get(res.json()['next']).json()['results']
+
+        self.assertEqual([vote['id'] for vote in res.json()['results'] + rest], [vote.id for vote in votes[::-1]])
+        self.assertEqual(res.json()['results'][0]['restaurant'], 'Restaurant 2')
+
+
+class TestMenuListFastPath(APITestCase):
+
+    def setUp(self):
+        self.menus = []
+        for number in range(3):
+            restaurant = Restaurant.objects.create(name=f'Restaurant "{number}"', contact_no='+380', address='Lviv')
+            self.menus.append(Menu.objects.create(
+                restaurant=restaurant, file=SimpleUploadedFile(f"menu{number}.txt", b"abc"),
+                uploaded_by='Volodymyr' if number else None, votes=number))
+        with override_settings(VOTE_COUNTER_SHARDS=4):
+            increment_menu_votes(self.menus[0].id, 2)
+
+    def test_output_is_byte_identical_to_the_serializer(self):
+        request = Request(RequestFactory().get('/api/menus/'))
+        queryset = Menu.objects.filter(business_day=get_business_day())
+
+        for context, fast_request in (({}, None), ({'request': request}, request)):
+            expected = MenuListSerializer(with_live_votes(queryset), many=True, context=context).data
+            data = serialize_menu_rows(menu_rows(queryset), fast_request)
+            self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_query_count_does_not_depend_on_the_number_of_menus(self):
+        day = get_business_day()
+        with self.assertNumQueries(1):
+            get_menu_list_data(day)
+        for number in range(10):
+            restaurant = Restaurant.objects.create(name=f'More {number}', contact_no='+380', address='Lviv')
+            Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(get_menu_list_data(day)["data"]), 13)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(load_from_database(day)), 13)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("api:menus"))
+
+
+class TestORJSONRendering(APITestCase):
+
+    def setUp(self):
+        for number in range(3):
+            restaurant = Restaurant.objects.create(name=f'Ресторан "{number}"\u2028', contact_no='+380', address='Lviv')
+            Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"), votes=number)
+
+    def test_output_matches_the_json_renderer(self):
+        envelope = get_menu_list_data(get_business_day())
+        self.assertEqual(ORJSONRenderer().render(envelope), JSONRenderer().render(envelope.as_dict()))
+        self.assertEqual(ORJSONRenderer().render(envelope.as_dict()), JSONRenderer().render(envelope.as_dict()))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_envelope_reads_like_a_dict(self):
+        envelope = Envelope('failed', None, False)
+        self.assertEqual(dict(envelope), {"msg": 'failed', "data": None, "success": False})
+        self.assertEqual(ORJSONRenderer().render(envelope), b'{"msg":"failed","data":null,"success":false}')
+        self.assertEqual(JSONRenderer().render(envelope), ORJSONRenderer().render(envelope))
+
+    def test_native_types(self):
+        value = {"at": datetime(2022, 7, 1, 11, 0, 0, 123456), "day": date(2022, 7, 1), 1: "one"}
+        self.assertEqual(
+            ORJSONRenderer().render(value), b'{"at":"2022-07-01T11:00:00.123456","day":"2022-07-01","1":"one"}')
+
+    def test_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO('{"name": "Ресторан"}'.encode())), {"name": "Ресторан"})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"name":'))
+
+    def test_views_render_with_orjson(self):
+        res = self.client.get(reverse("api:menu-list"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(b'\\u2028', res.content)
+        self.assertEqual(len(res.json()["data"]), 3)
+
+        res = self.client.get(reverse("api:menu-list"), HTTP_ACCEPT='text/html')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/html'))
+
+        res = self.client.post(reverse("api:login"), data=b'{"email":', content_type='application/json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestResultsHistory(APITestCase):
+
+    def setUp(self):
+        self.clock = FrozenClock(datetime(2022, 7, 9, 12, 0))
+        self.addCleanup(set_clock, set_clock(self.clock))
+        self.restaurants = [
+            Restaurant.objects.create(name=f'Restaurant {number}', contact_no='+380', address='Lviv')
+            for number in range(3)
+        ]
+        # Votes per restaurant for Mon 4 July .. Fri 8 July; the 6th has no menus.
+        self.votes = {4: (5, 3, 2), 5: (6, 1, 1), 7: (2, 2, 0), 8: (1, 4, 3), 9: (9, 0, 0)}
+        for day, counts in self.votes.items():
+            for restaurant, count in zip(self.restaurants, counts):
+                Menu.objects.create(
+                    restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"),
+                    votes=count, business_day=date(2022, 7, day))
+
+    def test_rollup_only_covers_new_closed_days(self):
+        self.assertEqual(rollup_closed_days(), [date(2022, 7, day) for day in (4, 5, 7, 8)])
+        self.assertEqual(DailyResult.objects.count(), 12)
+        self.assertEqual(
+            list(DailyResult.objects.filter(business_day=date(2022, 7, 7)).values_list('votes', 'rank')),
+            [(2, 1), (2, 1), (0, 3)])
+        self.assertEqual(pending_days(), [])
+
+        self.clock.advance(days=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(pending_days(), [date(2022, 7, 9)])
+
+    def test_days_before_a_rolled_up_day_are_still_pending(self):
+        call_command('rollup_results', '--date', '2022-07-08', stdout=io.StringIO())
+        self.assertEqual(pending_days(), [date(2022, 7, day) for day in (4, 5, 7)])
+
+    def test_history_streaks_and_shares(self):
+        rollup_closed_days()
+        with self.assertNumQueries(1):
+            history = get_history(date(2022, 7, 1), date(2022, 7, 31))
+
+        self.assertEqual(history['total_votes'], 30)
+        self.assertEqual([day['business_day'] for day in history['days']],
+                         ['2022-07-04', '2022-07-05', '2022-07-07', '2022-07-08'])
+        self.assertEqual(history['days'][2]['winners'], ['Restaurant 0', 'Restaurant 1'])
+        self.assertEqual(history['days'][0]['results'][0]['vote_share'], 0.5)
+
+        first, second, third = history['restaurants']
+        self.assertEqual((first['name'], first['wins'], first['votes']), ('Restaurant 0', 3, 14))
+        self.assertEqual((first['longest_streak'], first['current_streak']), (3, 0))
+        self.assertEqual((second['wins'], second['longest_streak'], second['current_streak']), (2, 2, 2))
+        self.assertEqual(second['vote_share'], round(10 / 30, 4))
+        self.assertEqual((third['wins'], third['days']), (0, 4))
+
+    def test_history_endpoint(self):
+        restaurant = self.restaurants[1]
+        rollup_closed_days()
+        res = self.client.get(
+            reverse("api:results-history"), {'start': '2022-07-05', 'end': '2022-07-08', 'restaurant': restaurant.id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        data = res.json()['data']
+        self.assertEqual([summary['id'] for summary in data['restaurants']], [restaurant.id])
+        self.assertEqual(data['restaurants'][0]['current_streak'], 2)
+        self.assertEqual([len(day['results']) for day in data['days']], [1, 1, 1])
+        self.assertEqual(data['total_votes'], 20)
+
+        res = self.client.get(reverse("api:results-history"))
+        self.assertEqual((res.json()['data']['from'], res.json()['data']['to']), ('2022-06-09', '2022-07-08'))
+
+    def test_invalid_range(self):
+        for query in ({'start': '2022-07-08', 'end': '2022-07-01'}, {'start': '2020-01-01', 'end': '2022-07-01'},
+                      {'start': 'yesterday'}):
+            res = self.client.get(reverse("api:results-history"), query)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command_rolls_up_a_day_again(self):
+        call_command('rollup_results', stdout=io.StringIO())
+        Menu.objects.filter(restaurant=self.restaurants[2], business_day=date(2022, 7, 8)).update(votes=7)
+
+        call_command('rollup_results', '--date', '2022-07-08', stdout=io.StringIO())
+
+        winner = DailyResult.objects.get(business_day=date(2022, 7, 8), rank=1)
+        self.assertEqual((winner.restaurant, winner.votes), (self.restaurants[2], 7))
+
+
+@override_settings(VOTE_ARCHIVE_AFTER_DAYS=7, VOTE_RETENTION_DAYS=None)
+class TestVoteArchive(APITestCase):
+
+    def setUp(self):
+        self.addCleanup(set_clock, set_clock(FrozenClock(datetime(2022, 9, 10, 12, 0))))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        restaurant = Restaurant.objects.create(name='Burger King', contact_no='+380', address='Lviv')
+        employees = [
+            Employee.objects.create(
+                user=User.objects.create(username=f'user{number}', email=f'user{number}@example.com'),
+                employee_no=str(number))
+            for number in range(3)
+        ]
+        self.menus = {}
+        self.employees = employees
+        for month, day in ((7, 29), (8, 31), (9, 5)):
+            menu = Menu.objects.create(
+                restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"),
+                votes=len(employees), business_day=date(2022, month, day))
+            self.menus[month] = menu
+            for employee in employees:
+                Vote.objects.create(employee=employee, menu=menu, voted_at=datetime(2022, month, day, 11, 0))
+
+    def test_closed_months_are_archived_and_exported(self):
+        report = archive_votes(self.directory)
+
+        self.assertEqual(report.archived, {date(2022, 7, 1): 3, date(2022, 8, 1): 3})
+        self.assertEqual(list(Vote.objects.values_list('business_day', flat=True).distinct()), [date(2022, 9, 5)])
+        self.assertEqual(VoteArchive.objects.count(), 6)
+        with gzip.open(os.path.join(self.directory, 'votes-2022-08.ndjson.gz'), 'rt') as file:
+            votes = [json.loads(line) for line in file]
+        self.assertEqual([vote['menu_id'] for vote in votes], [self.menus[8].id] * 3)
+        self.assertEqual(votes[0]['business_day'], '2022-08-31')
+
+        # Archived votes still count when the menus are reconciled.
+        self.assertEqual(reconcile_menu_votes(Menu.objects.all()), 0)
+
+        report = archive_votes(self.directory)
+        self.assertEqual((report.archived, report.exported), ({}, {}))
+
+    def test_history_includes_archived_votes(self):
+        archive_votes(self.directory)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_token(self.employees[0].user)["access"])
+
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse("api:vote-history") + '?page_size=2')
+        rest = self.client.get(res.json()['next']).json()
+
+        votes = res.json()['results'] + rest['results']
+        self.assertEqual([vote['business_day'] for vote in votes], ['2022-09-05', '2022-08-31', '2022-07-29'])
+        self.assertEqual({vote['restaurant'] for vote in votes}, {'Burger King'})
+        self.assertIsNone(rest['next'])
+        previous = self.client.get(rest['previous']).json()['results']
+        self.assertEqual([vote['id'] for vote in previous], [vote['id'] for vote in votes[:2]])
+
+    def test_archived_votes_go_with_their_menu_or_employee(self):
+        archive_votes(self.directory)
+
+        self.menus[7].delete()
+        self.employees[0].delete()
+
+        self.assertEqual(
+            sorted(VoteArchive.objects.values_list('menu_id', 'employee_id')),
+            [(self.menus[8].id, employee.id) for employee in self.employees[1:]])
+
+    def test_exported_months_past_retention_are_pruned(self):
+        with override_settings(VOTE_RETENTION_DAYS=40):
+            report = archive_votes(None)
+            self.assertEqual(report.not_exported, [date(2022, 7, 1)])
+            self.assertEqual(VoteArchive.objects.count(), 6)
+
+            report = archive_votes(self.directory)
+
+            self.assertEqual(report.pruned, [date(2022, 7, 1)])
+            self.assertEqual(sorted(VoteArchive.objects.values_list('menu_id', flat=True).distinct()),
+                             [self.menus[8].id])
+            self.assertTrue(os.path.exists(os.path.join(self.directory, 'votes-2022-07.ndjson.gz')))
+            # The pruned menu keeps its count.
+            reconcile_menu_votes(Menu.objects.all())
+            self.assertEqual(Menu.objects.get(id=self.menus[7].id).votes, 3)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('archive_votes', '--export-dir', self.directory, stdout=out)
+        self.assertIn('Archived 3 votes of 2022-07.', out.getvalue())
+        self.assertIn('Exported 3 votes of 2022-08.', out.getvalue())
+
+
+class TestLoadBenchmarkHelpers(SimpleTestCase):
+
+    def test_percentiles_and_stats(self):
+        self.assertEqual(percentile(list(range(1, 101)), 0.95), 95)
+        self.assertEqual(percentile([3.0], 0.99), 3.0)
+        self.assertIsNone(percentile([], 0.5))
+
+        stats = EndpointStats()
+        for status_code, seconds in ((200, 0.010), (304, 0.002), (503, 0.001), (202, 0.020)):
+            stats.add(Result(status_code, None, seconds, 2))
+        stats.seconds = 0.5
+        self.assertEqual(stats.as_dict(), {
+            'requests': 4, 'errors': 1, 'throughput': 8.0,
+            'p50': 2.0, 'p95': 20.0, 'p99': 20.0, 'queries': 2.0})
+
+    def test_regressions_against_the_baseline(self):
+        baseline = {'vote': {'requests': 100, 'errors': 0, 'throughput': 100.0,
+                             'p50': 5.0, 'p95': 10.0, 'p99': 12.0, 'queries': 4.0}}
+        steady = dict(baseline['vote'], p95=12.0, throughput=80.0, queries=4.3)
+        self.assertEqual(compare_baseline({'vote': steady}, baseline, 0.25), [])
+
+        slower = dict(baseline['vote'], p95=13.0, throughput=70.0, queries=5.0, errors=1)
+        self.assertEqual(len(compare_baseline({'vote': slower, 'login': slower}, baseline, 0.25)), 4)
+
+
+class TestMetrics(APITestCase):
+
+    def setUp(self):
+        registry.reset()
+        restaurant = Restaurant.objects.create(name='Burger King', contact_no='+380', address='Lviv')
+        Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"))
+
+    def scrape(self):
+        res = self.client.get('/metrics')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return res.content.decode().splitlines()
+
+    def test_requests_are_recorded_per_url_name(self):
+        size = len(self.client.get(reverse("api:menus")).content)
+        self.client.get(reverse("api:menus"))
+        self.client.get('/api/no-such-endpoint/')
+
+        lines = self.scrape()
+
+        menus = 'endpoint="api:menus",method="GET",status="200"'
+        self.assertIn(f'api_requests_total{{{menus}}} 2', lines)
+        self.assertIn(f'api_db_queries_total{{{menus}}} 2', lines)
+        self.assertIn(f'api_response_bytes_total{{{menus}}} {2 * size}', lines)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{menus},le="+Inf"}} 2', lines)
+        self.assertIn(f'api_request_duration_seconds_count{{{menus}}} 2', lines)
+        self.assertIn('api_requests_total{endpoint="unmatched",method="GET",status="404"} 1', lines)
+        self.assertFalse([line for line in lines if 'endpoint="metrics"' in line])
+
+    def test_threads_record_without_losing_counts(self):
+        metrics = MetricsRegistry()
+
+        def record(_):
+            for _ in range(1000):
+                metrics.observe('api:results', 'GET', 200, 0.002, 1, 0.0005, 100)
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(record, range(8)))
+
+        series = metrics.snapshot()[('api:results', 'GET', '200')]
+        self.assertEqual(series[:3], [8000, series[1], 8000])
+        self.assertEqual(series[5], 8000)
+
+    def test_workers_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other_worker = ['api:results', 'GET', '200', 3, 0.3, 6, 0.01, 300] + [0] * 4 + [3] + [0] * 6
+            with open(os.path.join(directory, f'metrics-{os.getppid()}.json'), 'w') as file:
+                json.dump({'buckets': list(LATENCY_BUCKETS), 'series': [other_worker]}, file)
+
+            self.client.get(reverse("api:results"))
+            lines = self.scrape()
+
+        self.assertIn('api_workers 2', lines)
+        self.assertIn('api_requests_total{endpoint="api:results",method="GET",status="200"} 4', lines)
+        self.assertIn(
+            'api_request_duration_seconds_bucket{endpoint="api:results",method="GET",status="200",le="10.0"} 4', lines)
+
+    def test_exited_workers_keep_their_counters_but_not_their_gauges(self):
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            series = ['api:results', 'GET', '200', 3, 0.3, 6, 0.01, 300] + [0] * 4 + [3] + [0] * 6
+            pools = {'archive': {'size': 10, 'in_use': 2, 'idle': 3, 'checkouts': 7}}
+            with open(os.path.join(directory, f'metrics-{exited.pid}.json'), 'w') as file:
+                json.dump({'buckets': list(LATENCY_BUCKETS), 'series': [series], 'pools': pools}, file)
+
+            for _ in range(2):
+                lines = self.scrape()
+            self.assertEqual(set(os.listdir(directory)),
+                             {'metrics-retired.json', f'metrics-{os.getpid()}.json', 'metrics.lock'})
+
+        self.assertIn('api_workers 1', lines)
+        self.assertIn('api_requests_total{endpoint="api:results",method="GET",status="200"} 3', lines)
+        self.assertIn('api_db_pool_checkouts_total{alias="archive"} 7', lines)
+        self.assertIn('api_db_pool_size{alias="archive"} 0', lines)
+        self.assertIn('api_db_pool_connections{alias="archive",state="in_use"} 0', lines)
+
+    def test_series_of_ended_threads_are_kept(self):
+        metrics = MetricsRegistry()
+        thread = threading.Thread(target=metrics.observe, args=('api:results', 'GET', 200, 0.002, 1, 0.0005, 100))
+        thread.start()
+        thread.join()
+        del thread
+        gc.collect()
+
+        self.assertEqual(metrics._shards, {})
+        self.assertEqual(metrics.snapshot()[('api:results', 'GET', '200')][0], 1)
+
+    async def test_async_stack_records_the_queries_of_its_threads(self):
+        async def get_response(request):
+            return await sync_to_async(self.client.get)(reverse("api:menus"))
+
+        middleware = MetricsMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = RequestFactory().get('/api/restaurants/')
+        request.resolver_match = resolve('/api/restaurants/')
+        await middleware(request)
+
+        series = registry.snapshot()[('api:restaurants', 'GET', '200')]
+        self.assertEqual((series[0], series[2]), (1, 1))
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_scrapes_can_be_limited_to_some_addresses(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, status.HTTP_200_OK)
+
+
+class TestProfiling(APITestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        restaurant = Restaurant.objects.create(name='Burger King', contact_no='+380', address='Lviv')
+        Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"))
+
+    def test_signed_header_profiles_the_request(self):
+        with override_settings(PROFILING_DIR=self.directory):
+            res = self.client.get(reverse("api:menus"), HTTP_X_PROFILE=make_profiling_token())
+
+        profile_id = res['X-Profile-Id']
+        with open(os.path.join(self.directory, f'{profile_id}.json')) as file:
+            trace = json.load(file)
+        self.assertEqual((trace['endpoint'], trace['status']), ('api:menus', 200))
+        self.assertEqual(len(trace['queries']), 1)
+        self.assertIn('"api_menu"', trace['queries'][0]['sql'])
+        stats = pstats.Stats(os.path.join(self.directory, f'{profile_id}.prof'))
+        self.assertTrue(stats.total_calls)
+
+    def test_unsigned_header_is_ignored(self):
+        with override_settings(PROFILING_DIR=self.directory):
+            res = self.client.get(reverse("api:menus"), HTTP_X_PROFILE='1:forged:token')
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_sampled_profiles_are_rotated(self):
+        with override_settings(PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_PROFILES=2):
+            ids = [self.client.get(reverse("api:menus"))['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(
+            f'{profile_id}{extension}' for profile_id in sorted(ids)[1:] for extension in ('.json', '.prof')))
+
+    async def test_async_profiles_trace_the_queries_of_their_threads(self):
+        async def get_response(request):
+            return await sync_to_async(self.client.get)(reverse("api:menus"))
+
+        middleware = ProfilingMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = RequestFactory().get('/api/menus/', HTTP_X_PROFILE=make_profiling_token())
+        with override_settings(PROFILING_DIR=self.directory):
+            res = await middleware(request)
+
+        with open(os.path.join(self.directory, f'{res["X-Profile-Id"]}.json')) as file:
+            trace = json.load(file)
+        self.assertEqual([query['alias'] for query in trace['queries']], ['default'])
+
+
+@override_settings(QUERY_INSPECTION='raise')
+class TestQueryInspection(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123', first_name='A', last_name='B')
+        employee = Employee.objects.create(user=self.user, employee_no="007")
+        for number in range(10):
+            restaurant = Restaurant.objects.create(name=f'Restaurant {number}', contact_no='+380', address='Lviv')
+            menu = Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"))
+            Vote.objects.create(employee=employee, menu=menu, business_day=date(2022, 7, number + 1))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_token(self.user)["access"])
+
+    def test_endpoints_stay_within_their_budgets(self):
+        for name in ("restaurants", "menus", "menu-list", "results", "vote-history"):
+            self.assertEqual(self.client.get(reverse(f"api:{name}")).status_code, status.HTTP_200_OK, name)
+        menu = Menu.objects.first()
+        Vote.objects.all().delete()
+        self.assertEqual(self.client.get(reverse("api:new-vote", kwargs={'menu_id': menu.id})).status_code,
+                         status.HTTP_200_OK)
+
+    def test_going_over_the_budget_raises(self):
+        with mock.patch.object(MenuListAPIView, 'query_budget', 0):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse("api:menus"))
+
+    def test_repeated_lookups_are_flagged(self):
+        with CaptureQueriesContext(connection) as queries:
+            [str(vote.employee) for vote in Vote.objects.all()]
+        self.assertEqual(len(repeated_queries(queries.captured_queries, 3)), 2)
+
+        self.client.force_login(self.user)
+        with self.assertNoLogs('api.profiling', 'WARNING'):
+            for model in ('vote', 'employee', 'menu'):
+                self.assertEqual(self.client.get(f'/admin/api/{model}/').status_code, status.HTTP_200_OK)
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(SimpleTestCase):
+    pooled_backends = {'sqlite': 'api.db.backends.sqlite3', 'postgresql': 'api.db.backends.postgresql'}
+
+    def make_pool(self, max_size=2, timeout=0.01, max_lifetime=60, check_after=60, check=None, reset=None):
+        return ConnectionPool(
+            max_size, timeout, max_lifetime, check_after, check or (lambda c: True), reset or (lambda c: None))
+
+    def test_connections_are_reused_and_bounded(self):
+        pool = self.make_pool()
+        first = pool.checkout(FakeConnection)
+        pool.release(first)
+        self.assertIs(pool.checkout(FakeConnection), first)
+        second = pool.checkout(FakeConnection)
+
+        with self.assertRaises(PoolExhausted):
+            pool.checkout(FakeConnection)
+        pool.release(second)
+        self.assertIs(pool.checkout(FakeConnection), second)
+
+        stats = pool.snapshot()
+        self.assertEqual((stats['checkouts'], stats['opened'], stats['failures']), (4, 2, 1))
+        self.assertEqual((stats['in_use'], stats['idle']), (2, 0))
+
+    def test_old_broken_and_dirty_connections_are_closed(self):
+        healthy = {'value': True}
+        pool = self.make_pool(check_after=0, check=lambda c: healthy['value'])
+        connection = pool.checkout(FakeConnection)
+        pool.release(connection)
+        healthy['value'] = False
+        self.assertIsNot(pool.checkout(FakeConnection), connection)
+        self.assertTrue(connection.closed)
+
+        pool = self.make_pool(max_lifetime=0)
+        connection = pool.checkout(FakeConnection)
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+
+        pool = self.make_pool(reset=mock.Mock(side_effect=OSError))
+        connection = pool.checkout(FakeConnection)
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.snapshot()['idle'], 0)
+
+        pool = self.make_pool()
+        connection = pool.checkout(FakeConnection)
+        pool.close()
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+
+    @skipUnless(connection.vendor in pooled_backends, 'No pooled backend for this database.')
+    def test_pooled_backend_reuses_connections(self):
+        self.addCleanup(close_pools, 'pooled')
+        backend = load_backend(self.pooled_backends[connection.vendor])
+        settings_dict = {**connection.settings_dict, 'POOL': {'MAX_SIZE': 1, 'TIMEOUT': 0.01}}
+
+        first = backend.DatabaseWrapper(settings_dict, alias='pooled')
+        with first.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = first.connection
+        first.close()
+
+        second = backend.DatabaseWrapper(settings_dict, alias='pooled')
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 2')
+            self.assertEqual(cursor.fetchone(), (2,))
+        self.assertIs(second.connection, raw)
+        with self.assertRaises(PoolExhausted):
+            backend.DatabaseWrapper(settings_dict, alias='pooled').ensure_connection()
+        second.close()
+
+        stats = pool_stats()['pooled']
+        self.assertEqual((stats['checkouts'], stats['opened'], stats['failures']), (2, 1, 1))
+        lines = render({}, LATENCY_BUCKETS, pools=pool_stats()).splitlines()
+        self.assertIn('api_db_pool_checkouts_total{alias="pooled"} 2', lines)
+        self.assertIn('api_db_pool_connections{alias="pooled",state="idle"} 1', lines)
+
+
+class TestPoolExhaustedResponses(APITestCase):
+
+    def test_api_views_answer_503(self):
+        with mock.patch.object(MenuListAPIView, 'get_queryset', side_effect=PoolExhausted):
+            res = self.client.get(reverse("api:menus"))
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_other_views_answer_503(self):
+        middleware = PoolExhaustedMiddleware(lambda request: None)
+        res = middleware.process_exception(RequestFactory().get('/admin/'), PoolExhausted())
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertIsNone(middleware.process_exception(RequestFactory().get('/admin/'), ValueError()))
+
+    async def test_async_stacks_are_not_adapted(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = PoolExhaustedMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual((await middleware(RequestFactory().get('/admin/'))).status_code, status.HTTP_200_OK)
+
+
+class RecordingStrategy:
+    """Reads from the default database, which stands in for a replica, and records each pick."""
+    picks = []
+
+    def choose(self, replicas):
+        self.picks.append(replicas[0])
+        return replicas[0]
+
+
+class TestReplicaRouter(SimpleTestCase):
+
+    def route(self, replicas, state):
+        token = routing_state.set(state)
+        self.addCleanup(routing_state.reset, token)
+        return override_settings(
+            DATABASE_REPLICAS=replicas, DATABASE_REPLICA_STRATEGY='api.db.routers.RoundRobinStrategy')
+
+    def test_reads_go_round_robin_until_the_request_writes(self):
+        router, state = ReplicaRouter(), RoutingState()
+        state.use_replicas = True
+        with self.route(['replica1', 'replica2'], state):
+            first = router.db_for_read(Menu)
+            self.assertEqual({first, router.db_for_read(Menu)}, {'replica1', 'replica2'})
+            self.assertEqual(router.db_for_read(Menu), first)
+            self.assertEqual(router.db_for_write(Menu), 'default')
+            self.assertIsNone(router.db_for_read(Menu))
+            self.assertIs(router.allow_migrate('replica1', 'api'), False)
+            self.assertIsNone(router.allow_migrate('default', 'api'))
+
+    def test_primary_without_replicas_or_outside_replica_views(self):
+        router = ReplicaRouter()
+        with self.route(['replica1'], RoutingState()):
+            self.assertIsNone(router.db_for_read(Menu))
+        state = RoutingState()
+        state.use_replicas = True
+        with self.route([], state):
+            self.assertIsNone(router.db_for_read(Menu))
+        self.assertIn(RandomStrategy().choose(['replica1', 'replica2']), ('replica1', 'replica2'))
+
+
+@override_settings(DATABASE_REPLICAS=['default'], DATABASE_REPLICA_STRATEGY='api.tests.RecordingStrategy')
+class TestReplicaRouting(APITestCase):
+
+    def setUp(self):
+        RecordingStrategy.picks = []
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        Employee.objects.create(user=self.user, employee_no="007")
+        restaurant = Restaurant.objects.create(name='Burger King', contact_no='+380', address='Lviv')
+        self.menu = Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc"))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_token(self.user)["access"])
+
+    def test_clients_read_their_own_writes_from_the_primary(self):
+        res = self.client.get(reverse("api:restaurants"))
+        self.assertNotIn(PIN_COOKIE, res.cookies)
+        self.assertEqual(len(RecordingStrategy.picks), 1)
+
+        res = self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menu.id}))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.cookies[PIN_COOKIE]['max-age'], 5)
+        self.assertEqual(len(RecordingStrategy.picks), 1)
+
+        self.client.get(reverse("api:restaurants"))
+        self.assertEqual(len(RecordingStrategy.picks), 1)
+        self.client.cookies.clear()
+        self.client.get(reverse("api:restaurants"))
+        self.assertEqual(len(RecordingStrategy.picks), 2)
+
+    def test_fresh_writes_are_cached_from_the_primary(self):
+        self.client.get(reverse("api:menu-list"))
+        self.assertEqual(RecordingStrategy.picks, [])
+
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            bump_content_version()
+            self.client.get(reverse("api:menu-list"))
+        self.assertEqual(RecordingStrategy.picks, ['default'])
+
+    async def test_async_stacks_route_without_thread_hops(self):
+        async def get_response(request):
+            return await sync_to_async(ReplicaRouter().db_for_read)(Menu)
+
+        url = reverse("api:restaurants")
+        request = RequestFactory().get(url)
+        request.resolver_match = resolve(url)
+        middleware = ReplicaMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(await middleware(request), 'default')
+
+        # Django logs every sync middleware, or middleware method, it puts on a thread.
+        with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            BaseHandler().load_middleware(is_async=True)
+
+
+def instant_runoff(candidates, ballots):
+    """Instant runoff counted from scratch, with the tie-breaks of api.tally."""
+    eliminated, rounds = set(), []
+    while True:
+        votes = {candidate: 0 for candidate in candidates if candidate not in eliminated}
+        for ballot in ballots:
+            choice = next((menu for menu in ballot if menu in votes), None)
+            if choice is not None:
+                votes[choice] += 1
+        rounds.append(votes)
+        continuing = sum(votes.values())
+        if not continuing:
+            return None
+        leader = max(votes, key=votes.get)
+        if len(votes) == 1 or 2 * votes[leader] > continuing:
+            return leader
+        tied = [menu for menu in votes if votes[menu] == min(votes.values())]
+        for earlier in reversed(rounds[:-1]):
+            tied = [menu for menu in tied if earlier[menu] == min(earlier[menu] for menu in tied)]
+        eliminated.add(max(tied))
+
+
+class TestTally(SimpleTestCase):
+
+    def test_incremental_runoff_matches_a_full_count(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            candidates = rng.sample(range(1, 40), rng.randint(1, 6))
+            tally, ballots = Tally(candidates), []
+            for _ in range(rng.randint(0, 50)):
+                ballot = rng.sample(candidates, rng.randint(0, len(candidates)))
+                ballots.append(ballot)
+                tally.add(ballot)
+                if rng.random() < 0.3:
+                    self.assertEqual(tally.irv()['winner'], instant_runoff(candidates, ballots))
+            self.assertEqual(tally.irv()['winner'], instant_runoff(candidates, ballots))
+
+    def test_runoff_ties_are_broken_by_earlier_rounds_then_newest_menu(self):
+        tally = Tally([1, 2, 3, 4])
+        for ballot, count in (([1], 4), ([2], 2), ([3], 3), ([4, 2], 1)):
+            tally.add(ballot, count)
+        result = tally.irv()
+        self.assertEqual([round['eliminated'] for round in result['rounds']], [4, 2, None])
+        self.assertEqual(result['rounds'][1]['votes'], [
+            {'menu': 1, 'votes': 4}, {'menu': 2, 'votes': 3}, {'menu': 3, 'votes': 3}])
+        self.assertEqual((result['winner'], result['rounds'][2]['exhausted']), (1, 3))
+
+        tally = Tally([1, 2, 3])
+        for ballot in ([1], [1], [2], [3]):
+            tally.add(ballot)
+        self.assertEqual(tally.irv()['rounds'][0]['eliminated'], 3)
+
+    def test_borda_points(self):
+        tally = Tally([1, 2, 3])
+        for ballot in ([1, 2], [2, 1], [2, 3], [9, 3]):
+            tally.add(ballot)
+        result = tally.borda()
+        self.assertEqual(result['winner'], 2)
+        self.assertEqual(result['ranking'], [
+            {'menu': 2, 'points': 5, 'first_choices': 2},
+            {'menu': 1, 'points': 3, 'first_choices': 1},
+            {'menu': 3, 'points': 3, 'first_choices': 1},
+        ])
+        self.assertEqual(
+            tally.with_candidates([1, 3]).borda()['ranking'][0], {'menu': 1, 'points': 2, 'first_choices': 2})
+
+    def test_identical_ballots_are_stored_once(self):
+        tally = Tally([1, 2, 3])
+        for _ in range(100):
+            tally.add([3, 1])
+        self.assertEqual((len(tally.groups), list(tally.counts), list(tally.choices)), (1, [100], [2, 0]))
+        self.assertEqual(list(unpack_ranking(pack_ranking([3, 1]))), [3, 1])
+
+
+class TestRankedBallots(APITestCase):
+
+    def setUp(self):
+        reset_tallies()
+        self.menus = []
+        for name in ('Burger King', 'Pizza Hut', 'Sushi Bar'):
+            restaurant = Restaurant.objects.create(name=name, contact_no='+380', address='Lviv')
+            self.menus.append(Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc")))
+        self.tokens = []
+        for number in range(5):
+            user = User.objects.create_user(f'user{number}', f'user{number}@example.com', 'password123')
+            Employee.objects.create(user=user, employee_no=str(number))
+            self.tokens.append('Bearer ' + get_token(user)["access"])
+
+    def submit(self, number, rankings):
+        return self.client.post(
+            reverse("api:ballot"), {'rankings': rankings}, format='json', HTTP_AUTHORIZATION=self.tokens[number])
+
+    def test_ballots_are_validated_and_stored_once_a_day(self):
+        burger, pizza, sushi = (menu.id for menu in self.menus)
+        res = self.submit(0, [pizza, burger])
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(RankedBallot.objects.get().menu_ids, [pizza, burger])
+
+        self.assertEqual(self.submit(0, [sushi]).json()['msg'], 'You already submitted a ballot today!')
+        self.assertEqual(self.submit(1, [pizza, pizza]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.submit(1, [sushi + 100]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.submit(1, []).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(RankedBallot.objects.count(), 1)
+
+    def test_results_follow_new_ballots(self):
+        burger, pizza, sushi = (menu.id for menu in self.menus)
+        res = self.client.get(reverse("api:ranked-results", kwargs={'method': 'irv'}))
+        self.assertEqual(res.json()['data']['ballots'], 0)
+        self.assertFalse(res.json()['success'])
+
+        for number, rankings in enumerate(([burger, sushi], [pizza, sushi], [pizza], [sushi, burger], [burger])):
+            self.submit(number, rankings)
+            irv = self.client.get(reverse("api:ranked-results", kwargs={'method': 'irv'})).json()['data']
+            self.assertEqual(irv['ballots'], number + 1)
+        self.assertEqual(irv['winner'], burger)
+        self.assertEqual([round['eliminated'] for round in irv['rounds']], [sushi, None])
+
+        borda = self.client.get(reverse("api:ranked-results", kwargs={'method': 'borda'})).json()['data']
+        self.assertEqual([entry['menu'] for entry in borda['ranking']], [burger, pizza, sushi])
+
+        res = self.client.get(reverse("api:ranked-results", kwargs={'method': 'condorcet'}))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleted_ballots_leave_the_tally(self):
+        self.submit(0, [self.menus[0].id])
+        self.client.get(reverse("api:ranked-results", kwargs={'method': 'irv'}))
+        RankedBallot.objects.all().delete()
+        self.submit(1, [self.menus[1].id])
+        irv = self.client.get(reverse("api:ranked-results", kwargs={'method': 'irv'})).json()['data']
+        self.assertEqual((irv['ballots'], irv['winner']), (1, self.menus[1].id))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TestVoteChanges(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'admin123')
+        self.employee = Employee.objects.create(user=self.user, employee_no="007")
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_token(self.user)["access"])
+        self.menus = []
+        for name in ('Burger King', 'Pizza Hut'):
+            restaurant = Restaurant.objects.create(name=name, contact_no='+380', address='Lviv')
+            self.menus.append(Menu.objects.create(restaurant=restaurant, file=SimpleUploadedFile("menu.txt", b"abc")))
+
+    def change(self, menu, **headers):
+        return self.client.put(reverse("api:vote"), {'menu_id': menu.id}, format='json', **headers)
+
+    def counts(self):
+        return [get_menu_votes(menu.id) for menu in self.menus]
+
+    @override_settings(QUERY_INSPECTION='raise')
+    def test_vote_is_moved_then_withdrawn(self):
+        burger, pizza = self.menus
+        self.client.get(reverse("api:new-vote", kwargs={'menu_id': burger.id}))
+
+        res = self.change(pizza)
+        self.assertEqual(res.json()['msg'], 'Your vote has been changed!')
+        self.assertEqual(Vote.objects.get().menu_id, pizza.id)
+        self.assertEqual(self.counts(), [0, 1])
+        self.assertEqual(self.change(pizza).json()['msg'], 'You already voted for this menu.')
+        self.assertEqual(self.counts(), [0, 1])
+
+        self.assertEqual(self.client.delete(reverse("api:vote")).status_code, status.HTTP_200_OK)
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(self.counts(), [0, 0])
+        self.assertEqual(self.client.delete(reverse("api:vote")).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.assertEqual(self.change(burger).json()['msg'], 'You voted successfully!')
+        self.assertEqual(self.counts(), [1, 0])
+
+    @override_settings(VOTE_COUNTER_SHARDS=4)
+    def test_sharded_counters_follow_changes(self):
+        burger, pizza = self.menus
+        for menu in (burger, pizza, burger, pizza):
+            self.change(menu)
+        self.assertEqual(self.counts(), [0, 1])
+        self.client.delete(reverse("api:vote"))
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_only_todays_menus(self):
+        self.menus[0].business_day = date(2022, 7, 1)
+        self.menus[0].save()
+        self.assertEqual(self.change(self.menus[0]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_retries_with_the_same_idempotency_key_are_not_repeated(self):
+        burger, pizza = self.menus
+        key = 'change-1'
+        first = self.change(burger, HTTP_IDEMPOTENCY_KEY=key)
+        self.change(pizza)
+        retry = self.change(burger, HTTP_IDEMPOTENCY_KEY=key)
+
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.counts(), [0, 1])
+        self.assertEqual(self.change(pizza, HTTP_IDEMPOTENCY_KEY=key).status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        withdraw = self.client.delete(reverse("api:vote"), HTTP_IDEMPOTENCY_KEY=key + '-delete')
+        retry = self.client.delete(reverse("api:vote"), HTTP_IDEMPOTENCY_KEY=key + '-delete')
+        self.assertEqual((withdraw.status_code, retry.status_code), (status.HTTP_200_OK, status.HTTP_200_OK))
+        self.assertEqual(self.counts(), [0, 0])
+
+    @override_settings(VOTE_INGESTION='buffered')
+    def test_buffered_vote_is_written_before_it_changes(self):
+        buffer = VoteBuffer(max_size=100, flush_interval=None)
+        with mock.patch('api.voting.get_vote_buffer', return_value=buffer):
+            self.client.get(reverse("api:new-vote", kwargs={'menu_id': self.menus[0].id}))
+            self.change(self.menus[1])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Vote.objects.get().menu_id, self.menus[1].id)
+        self.assertEqual(self.counts(), [0, 1])
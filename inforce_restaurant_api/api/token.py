@@ -1,11 +1,25 @@
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from .models import Employee
+
+
+def get_role(user):
+    if user.is_superuser:
+        return 'admin'
+    if user.is_staff:
+        return 'staff'
+    return 'user'
+
 
 def get_token(user):
     refresh = RefreshToken.for_user(user)
+    # Access tokens copy these claims, so authenticated requests (and tokens
+    # refreshed later) know the caller without reading the database.
+    refresh['employee_id'] = Employee.objects.filter(user=user).values_list('id', flat=True).first()
+    refresh['role'] = get_role(user)
+    refresh['username'] = user.username
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
 
     }
-
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenVerifyView, TokenRefreshView
 from rest_framework.versioning import AcceptHeaderVersioning
@@ -5,17 +6,39 @@ from rest_framework.versioning import AcceptHeaderVersioning
 from .views import (
     RegisterUserAPIView,
     UserLoginAPIView,
+    LogoutAPIView,
     CreateRestaurantAPIView,
     UploadMenuAPIView,
     CreateEmployeeAPIView,
+    ImportEmployeesAPIView,
     RestaurantListAPIView,
+    MenuListAPIView,
     CurrentDayMenuList,
     VoteAPIView,
-    ResultsAPIView
+    VoteChangeAPIView,
+    VoteHistoryAPIView,
+    MenuFileView,
+    ResultsAPIView,
+    ResultsHistoryAPIView,
+    RankedBallotAPIView,
+    RankedResultsAPIView
 )
+from . import async_views
+from .serializers import RevocableTokenRefreshSerializer
 
 app_name = 'api'
 
+if settings.API_ASYNC_VIEWS:
+    restaurants_view = async_views.restaurants
+    menu_list_view = async_views.menu_list
+    vote_view = async_views.vote
+    results_view = async_views.results
+else:
+    restaurants_view = RestaurantListAPIView.as_view()
+    menu_list_view = CurrentDayMenuList.as_view()
+    vote_view = VoteAPIView.as_view()
+    results_view = ResultsAPIView.as_view()
+
 
 urlpatterns = [
     path(
@@ -26,6 +49,10 @@ urlpatterns = [
         'login/',
         UserLoginAPIView.as_view(),
         name="login"),
+    path(
+        'logout/',
+        LogoutAPIView.as_view(),
+        name="logout"),
     path(
         'create_restaurant/',
         CreateRestaurantAPIView.as_view(),
@@ -38,21 +65,56 @@ urlpatterns = [
         'create_employee/',
         CreateEmployeeAPIView.as_view(),
         name="create-employee"),
+    path(
+        'import_employees/',
+        ImportEmployeesAPIView.as_view(),
+        name="import-employees"),
     path(
         'restaurants/',
-        RestaurantListAPIView.as_view(),
+        restaurants_view,
         name="restaurants"),
     path(
         'menu_list/',
-        CurrentDayMenuList.as_view(),
+        menu_list_view,
         name="menu-list"),
+    path(
+        'menus/',
+        MenuListAPIView.as_view(),
+        name="menus"),
+    path(
+        'menus/<int:menu_id>/file/',
+        MenuFileView.as_view(),
+        name="menu-file"),
     path(
         'vote/<int:menu_id>/',
-        VoteAPIView.as_view(),
+        vote_view,
         name="new-vote"),
+    path(
+        'vote/',
+        VoteChangeAPIView.as_view(),
+        name="vote"),
+    path(
+        'votes/',
+        VoteHistoryAPIView.as_view(),
+        name="vote-history"),
     path(
         'results/',
-        ResultsAPIView.as_view(),
+        results_view,
         name="results"),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path(
+        'results/history/',
+        ResultsHistoryAPIView.as_view(),
+        name="results-history"),
+    path(
+        'ballot/',
+        RankedBallotAPIView.as_view(),
+        name="ballot"),
+    path(
+        'results/ranked/<str:method>/',
+        RankedResultsAPIView.as_view(),
+        name="ranked-results"),
+    path(
+        'token/refresh/',
+        TokenRefreshView.as_view(serializer_class=RevocableTokenRefreshSerializer),
+        name='token_refresh'),
 ]
@@ -1,18 +1,38 @@
+import csv
+
 from .token import get_token
-from django.conf import settings
-from django.contrib.auth.hashers import check_password
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.http import JsonResponse
+from django.views import View
 from rest_framework import generics
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import permissions
 
-from .models import User, Employee, Restaurant, Menu, Vote
+from .caching import ConditionalGetMixin
+from .downloads import serve_file
+from .hashing import HashingOverloaded, hash_password, verify_password
+from .history import get_history
+from .importing import guess_format, import_employees, read_rows
+from .listing import menu_rows, serialize_menu_rows
+from .leaderboard import get_ranking
+from .models import User, Employee, Restaurant, Menu, Vote, VoteArchive, RankedBallot, get_business_day, pack_ranking
+from .renderers import FAST_PARSER_CLASSES, FAST_RENDERER_CLASSES, Envelope
+from .tally import METHODS, get_ranked_results
+from .authentication import revoke_token
+from .idempotency import REPLAYED_HEADER, run_idempotent
+from .voting import cast_vote, change_vote, get_employee_id, retract_vote
 from .serializers import UserSerializer, UserLoginSerializer, CreateRestaurantSerializer, \
-    UploadMenuSerializer, EmployeeSerializer, RestaurantListSerializer, MenuListSerializer, ResultMenuListSerializer
+    UploadMenuSerializer, EmployeeSerializer, RestaurantListSerializer, MenuListSerializer, \
+    LogoutSerializer, ImportEmployeesSerializer, VoteHistorySerializer, ResultsHistorySerializer, \
+    RankedBallotSerializer, VoteChangeSerializer
+
 
-today_date = settings.CURRENT_DATE.date()
+def overloaded_response(exc):
+    res = {"msg": str(exc.detail), "success": False, "data": None}
+    return Response(data=res, status=exc.status_code, headers={"Retry-After": "1"})
 
 
 class RegisterUserAPIView(generics.CreateAPIView):
@@ -20,14 +40,13 @@ class RegisterUserAPIView(generics.CreateAPIView):
     serializer_class = UserSerializer
 
     def perform_create(self, serializer):
-        instance = serializer.save()
-        instance.set_password(instance.password)
-        instance.save()
+        serializer.save(password=hash_password(serializer.validated_data['password']))
 
 
 class UserLoginAPIView(APIView):
     queryset = User.objects.all()
     serializer_class = UserLoginSerializer
+    parser_classes = FAST_PARSER_CLASSES
 
     def post(self, request):
         email = request.data["email"]
@@ -35,7 +54,10 @@ class UserLoginAPIView(APIView):
         try:
             user = User.objects.get(email=email)
             fullname = user.first_name + " " + user.last_name
-            if check_password(password, user.password):
+            is_correct, upgraded_password = verify_password(password, user.password)
+            if upgraded_password:
+                User.objects.filter(pk=user.pk).update(password=upgraded_password)
+            if is_correct:
                 jwt_token = get_token(user)
                 jwt_access_token = jwt_token["access"]
                 jwt_refresh_token = jwt_token["refresh"]
@@ -55,11 +77,31 @@ class UserLoginAPIView(APIView):
                     "data": None,
                     "success": False}
                 return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+        except HashingOverloaded as e:
+            return overloaded_response(e)
         except Exception as e:
             res = {"msg": str(e), "success": False, "data": None}
             return Response(data=res, status=status.HTTP_200_OK)
 
 
+class LogoutAPIView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    parser_classes = FAST_PARSER_CLASSES
+
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            res = {"msg": str(serializer.errors), "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.auth is not None:
+            revoke_token(request.auth)
+        if serializer.validated_data.get('refresh') is not None:
+            revoke_token(serializer.validated_data['refresh'])
+        res = {"msg": "Logout success", "data": None, "success": True}
+        return Response(data=res, status=status.HTTP_200_OK)
+
+
 class CreateRestaurantAPIView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = CreateRestaurantSerializer
@@ -73,16 +115,16 @@ class UploadMenuAPIView(APIView):
 
         try:
             req = request.data
-            menu = Menu.objects.filter(restaurant=req.get('restaurant'), created_at__date=settings.CURRENT_DATE)
-            if menu.exists():
-                res = {
-                    "msg": "Menu already added.",
-                    "success": False,
-                    "data": None}
-                return Response(data=res, status=status.HTTP_200_OK)
             serializer = UploadMenuSerializer(data=req)
             if serializer.is_valid():
-                serializer.save()
+                try:
+                    serializer.save(business_day=get_business_day())
+                except IntegrityError:
+                    res = {
+                        "msg": "Menu already added.",
+                        "success": False,
+                        "data": None}
+                    return Response(data=res, status=status.HTTP_200_OK)
                 res = {
                     "msg": "Menu successful uploaded",
                     "success": True,
@@ -122,6 +164,10 @@ class CreateEmployeeAPIView(APIView):
         serializer = EmployeeSerializer(data=req)
 
         if serializer.is_valid():
+            try:
+                password = hash_password(req.get("password"))
+            except HashingOverloaded as e:
+                return overloaded_response(e)
             try:
                 new_user = User.objects.create(
                     email=req.get('email'),
@@ -131,14 +177,11 @@ class CreateEmployeeAPIView(APIView):
                     is_active=True,
                     phone=req.get('phone'),
                     is_staff=True,
-                    created_by=user
+                    created_by=user,
+                    password=password
 
                 )
 
-                password = req.get("password")
-                new_user.set_password(password)
-                new_user.save()
-
                 Employee.objects.create(
                     user=new_user,
                     employee_no=req.get('employee_no'),
@@ -159,67 +202,234 @@ class CreateEmployeeAPIView(APIView):
         return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ImportEmployeesAPIView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        serializer = ImportEmployeesSerializer(data=request.data)
+        if not serializer.is_valid():
+            res = {"msg": str(serializer.errors), "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = serializer.validated_data['file']
+        file_format = serializer.validated_data.get('format') or guess_format(upload.name, upload.content_type)
+        if file_format is None:
+            res = {"msg": "Unknown file format, send format=csv or format=ndjson.", "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = import_employees(read_rows(upload, file_format), created_by=request.user.username)
+        except (UnicodeDecodeError, csv.Error) as e:
+            res = {"msg": f"Could not read the file: {e}", "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+
+        res = {
+            "msg": f"{report.created} employees imported, {len(report.rejected)} rows rejected.",
+            "data": report.as_dict(),
+            "success": not report.rejected}
+        return Response(
+            data=res, status=status.HTTP_201_CREATED if report.created else status.HTTP_400_BAD_REQUEST)
+
+
 class RestaurantListAPIView(generics.ListAPIView):
     serializer_class = RestaurantListSerializer
+    renderer_classes = FAST_RENDERER_CLASSES
+    query_budget = 1
+    replica_reads = True
     queryset = Restaurant.objects.all()
 
 
-class CurrentDayMenuList(APIView):
+class MenuListAPIView(generics.ListAPIView):
+    serializer_class = MenuListSerializer
+    renderer_classes = FAST_RENDERER_CLASSES
+    query_budget = 1
+    replica_reads = True
+
+    def get_queryset(self):
+        return menu_rows()
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(serialize_menu_rows(page, request))
+
+
+class CurrentDayMenuList(ConditionalGetMixin, APIView):
+    renderer_classes = FAST_RENDERER_CLASSES
+    query_budget = 1
+    replica_reads = True
 
     def get(self, request):
-        query = Menu.objects.filter(Q(created_at__date=today_date))
-        serializer = MenuListSerializer(query, many=True)
-        res = {"msg": 'success', "data": serializer.data, "success": True}
-        return Response(data=res, status=status.HTTP_200_OK)
+        return self.conditional_get(request, get_business_day())
+
+    def get_conditional_data(self, request, today):
+        return get_menu_list_data(today)
+
+
+class MenuFileView(View):
+    """
+    Download a menu's file, with Range and If-None-Match support.
+
+    A plain Django view: clients such as PDF viewers send Accept headers
+    that DRF's content negotiation would turn away.
+    """
+
+    def get(self, request, menu_id):
+        name = Menu.objects.filter(id=menu_id).values_list('file', flat=True).first()
+        try:
+            if name:
+                return serve_file(request, Menu._meta.get_field('file').storage, name)
+        except FileNotFoundError:
+            pass
+        res = {"msg": "Menu file not found.", "data": None, "success": False}
+        return JsonResponse(res, status=status.HTTP_404_NOT_FOUND)
 
 
 class VoteAPIView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = FAST_RENDERER_CLASSES
+    # Menu lookup, vote insert and counter update, inside a savepoint.
+    query_budget = 5
 
     def get(self, request, menu_id):
-        username = request.user.username
+        res, status_code = cast_vote(get_employee_id(request.user), menu_id)
+        return Response(data=res, status=status_code)
 
-        employee = Employee.objects.get(user__username=username)
-        menu = Menu.objects.get(id=menu_id)
 
-        if Vote.objects.filter(
-                employee__user__username=username,
-                voted_at__date=today_date,
-                menu__id=menu_id).exists():
-            res = {"msg": 'You already voted!', "data": None, "success": False}
-            return Response(data=res, status=status.HTTP_200_OK)
-        else:
-            new_vote = Vote.objects.create(
-                employee=employee,
-                menu=menu
-
-            )
-            new_vote.save()
-            menu.votes += 1
-            menu.save()
-            res = {
-                "msg": 'You voted successfully!',
-                "data": f"You voted for the restaurant with the number {menu_id}",
-                "success": True}
-            return Response(data=res, status=status.HTTP_200_OK)
+class VoteChangeAPIView(APIView):
+    """
+    Change today's vote: PUT ``{"menu_id": ...}`` moves it to that menu
+    (or casts it), DELETE withdraws it. Retries carrying the same
+    ``Idempotency-Key`` header get the first response back.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = FAST_RENDERER_CLASSES
+    parser_classes = FAST_PARSER_CLASSES
+    # Menu check, then the locked vote lookup, vote update and both counter
+    # updates inside a savepoint.
+    query_budget = 7
+
+    def put(self, request):
+        serializer = VoteChangeSerializer(data=request.data)
+        if not serializer.is_valid():
+            res = {"msg": str(serializer.errors), "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+        menu_id = serializer.validated_data['menu_id']
+        return self.respond(request, f'PUT {menu_id}', lambda employee_id: change_vote(employee_id, menu_id))
+
+    def delete(self, request):
+        return self.respond(request, 'DELETE', retract_vote)
+
+    def respond(self, request, fingerprint, action):
+        employee_id = get_employee_id(request.user)
+        res, status_code, replayed = run_idempotent(request, employee_id, fingerprint, lambda: action(employee_id))
+        response = Response(data=res, status=status_code)
+        if replayed:
+            response[REPLAYED_HEADER] = 'true'
+        return response
+
+
+class VoteHistoryAPIView(generics.ListAPIView):
+    """The caller's votes, newest first, including the months `archive_votes` moved to VoteArchive."""
+    serializer_class = VoteHistorySerializer
+    renderer_classes = FAST_RENDERER_CLASSES
+    # One page of votes and one of archived votes.
+    query_budget = 2
+    permission_classes = (permissions.IsAuthenticated,)
+    keyset_ordering = ('voted_at', 'id')
 
+    def get_queryset(self):
+        employee_id = get_employee_id(self.request.user)
+        fields = ('id', 'menu_id', 'restaurant', 'business_day', 'voted_at')
+        votes = Vote.objects.filter(employee_id=employee_id).annotate(
+            restaurant=F('menu__restaurant__name')).values(*fields)
+        archived = VoteArchive.objects.filter(employee_id=employee_id).annotate(
+            restaurant=Subquery(Menu.objects.filter(id=OuterRef('menu_id')).values('restaurant__name'))).values(*fields)
+        return [votes, archived]
 
-class ResultsAPIView(APIView):
+
+class ResultsAPIView(ConditionalGetMixin, APIView):
+    renderer_classes = FAST_RENDERER_CLASSES
+    query_budget = 1
+    replica_reads = True
 
     def get(self, request):
-        today = settings.CURRENT_DATE
-        current_menu_qs = Menu.objects.filter(
-            Q(created_at__date=today)).order_by('-votes').first()
-        if not current_menu_qs:
-            res = {
-                "msg": 'Results not found! no menus found for today.',
-                "data": None,
-                "success": False}
+        return self.conditional_get(request, get_business_day())
+
+    def get_conditional_data(self, request, today):
+        return get_results_data(today)
+
+
+class RankedBallotAPIView(APIView):
+    """Submit today's ranked ballot: ``{"rankings": [menu ids, most preferred first]}``."""
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = FAST_RENDERER_CLASSES
+    parser_classes = FAST_PARSER_CLASSES
+
+    def post(self, request):
+        serializer = RankedBallotSerializer(data=request.data)
+        if not serializer.is_valid():
+            res = {"msg": str(serializer.errors), "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+        rankings = serializer.validated_data['rankings']
+        try:
+            with transaction.atomic():
+                RankedBallot.objects.create(employee_id=get_employee_id(request.user), rankings=pack_ranking(rankings))
+        except IntegrityError:
+            res = {"msg": 'You already submitted a ballot today!', "data": None, "success": False}
             return Response(data=res, status=status.HTTP_200_OK)
-        serializer = ResultMenuListSerializer(current_menu_qs)
-        data = {
-            "msg": 'The restaurant chosen for today.',
-            "data": serializer.data,
-            "success": True
-        }
-        return Response(data=data, status=status.HTTP_200_OK)
+        res = {"msg": 'Your ballot has been accepted!', "data": {"rankings": rankings}, "success": True}
+        return Response(data=res, status=status.HTTP_201_CREATED)
+
+
+class RankedResultsAPIView(ConditionalGetMixin, APIView):
+    """Today's ranked-choice results by instant runoff (``irv``) or Borda count (``borda``)."""
+    renderer_classes = FAST_RENDERER_CLASSES
+    # Menus, ballot count and new ballots; all the day's ballots after a delete.
+    query_budget = 4
+
+    def get(self, request, method):
+        if method not in METHODS:
+            res = {"msg": f"Unknown method {method}, use one of: {', '.join(METHODS)}.", "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_404_NOT_FOUND)
+        return self.conditional_get(request, get_business_day())
+
+    def get_conditional_data(self, request, today):
+        result = get_ranked_results(today, self.kwargs['method'])
+        if not result['ballots']:
+            return Envelope('Results not found! no ballots submitted today.', result, False)
+        return Envelope('success', result, True)
+
+
+class ResultsHistoryAPIView(APIView):
+    """
+    Winners, vote shares and win streaks of past business days.
+
+    Answered from the DailyResult rollup, which `manage.py rollup_results`
+    fills once a day; days it has not rolled up yet are not listed.
+    """
+    renderer_classes = FAST_RENDERER_CLASSES
+
+    def get(self, request):
+        serializer = ResultsHistorySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            res = {"msg": str(serializer.errors), "data": None, "success": False}
+            return Response(data=res, status=status.HTTP_400_BAD_REQUEST)
+        query = serializer.validated_data
+        data = get_history(query['start'], query['end'], query.get('restaurant'))
+        return Response(data=Envelope('success', data, True))
+
+
+def get_menu_list_data(today):
+    data = serialize_menu_rows(menu_rows(Menu.objects.filter(business_day=today)))
+    return Envelope('success', data, True)
+
+
+def get_results_data(today, ranking=None):
+    ranking = ranking if ranking is not None else get_ranking(today)
+    if not ranking:
+        return Envelope('Results not found! no menus found for today.', None, False)
+    winners = [entry for entry in ranking if entry["rank"] == 1]
+    return Envelope(
+        'The restaurant chosen for today.' if len(winners) == 1 else 'Several restaurants are tied for today.',
+        dict(ranking[0], winners=winners, ranking=ranking),
+        True)
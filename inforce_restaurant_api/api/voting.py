@@ -0,0 +1,128 @@
+from django.db import IntegrityError, transaction
+from rest_framework import status
+
+from .counters import increment_menu_votes
+from .ingestion import get_vote_buffer, is_buffered
+from .models import Employee, Menu, Vote, get_business_day, get_current_time
+
+
+def get_employee_id(user):
+    """The caller's employee id, from the token claims when it has them."""
+    employee_id = getattr(user, 'employee_id', None)
+    if employee_id is None:
+        employee_id = Employee.objects.filter(user_id=user.id).values_list('id', flat=True).get()
+    return employee_id
+
+
+def cast_vote(employee_id, menu_id):
+    """Record today's vote of an employee. Returns the response payload and status."""
+    menu = Menu.objects.only('id').get(id=menu_id)
+    now = get_current_time()
+    today = get_business_day(now)
+
+    if is_buffered():
+        already_voted = Vote.objects.filter(
+            employee_id=employee_id,
+            business_day=today).exists() or not get_vote_buffer().add(employee_id, menu.id, now)
+        if not already_voted:
+            res = {
+                "msg": 'Your vote has been accepted!',
+                "data": f"You voted for the restaurant with the number {menu_id}",
+                "success": True}
+            return res, status.HTTP_202_ACCEPTED
+    else:
+        try:
+            with transaction.atomic():
+                Vote.objects.create(
+                    employee_id=employee_id,
+                    menu=menu,
+                    voted_at=now,
+                    business_day=today
+                )
+                increment_menu_votes(menu.id)
+            already_voted = False
+        except IntegrityError:
+            already_voted = True
+
+    if already_voted:
+        res = {"msg": 'You already voted!', "data": None, "success": False}
+        return res, status.HTTP_200_OK
+    res = {
+        "msg": 'You voted successfully!',
+        "data": f"You voted for the restaurant with the number {menu_id}",
+        "success": True}
+    return res, status.HTTP_200_OK
+
+
+def flush_pending_vote(employee_id, day):
+    """
+    Write the employee's vote of ``day`` if it still waits in this worker's buffer.
+
+    A vote buffered by another worker is written by that worker's next
+    flush, which skips it if the employee voted again in between.
+    """
+    if is_buffered():
+        buffer = get_vote_buffer()
+        if buffer.is_pending(employee_id, day):
+            buffer.flush()
+
+
+def _move_vote(employee_id, menu_id, now, today):
+    previous = Vote.objects.select_for_update().filter(
+        employee_id=employee_id,
+        business_day=today).values_list('id', 'menu_id').first()
+    if previous is None:
+        Vote.objects.create(employee_id=employee_id, menu_id=menu_id, voted_at=now, business_day=today)
+        increment_menu_votes(menu_id)
+    elif previous[1] != menu_id:
+        Vote.objects.filter(id=previous[0]).update(menu_id=menu_id, voted_at=now)
+        increment_menu_votes(previous[1], -1)
+        increment_menu_votes(menu_id)
+    return previous
+
+
+def change_vote(employee_id, menu_id):
+    """
+    Make ``menu_id`` the employee's vote of today, casting it or moving it from another menu.
+
+    The vote row and both menus' counters change in one transaction,
+    without recounting. Returns the response payload and status.
+    """
+    now = get_current_time()
+    today = get_business_day(now)
+    flush_pending_vote(employee_id, today)
+    try:
+        with transaction.atomic():
+            previous = _move_vote(employee_id, menu_id, now, today)
+    except IntegrityError:
+        # A concurrent request of the employee cast the vote first; move that one.
+        with transaction.atomic():
+            previous = _move_vote(employee_id, menu_id, now, today)
+
+    if previous is None:
+        msg = 'You voted successfully!'
+    elif previous[1] == menu_id:
+        msg = 'You already voted for this menu.'
+    else:
+        msg = 'Your vote has been changed!'
+    res = {"msg": msg, "data": f"You voted for the restaurant with the number {menu_id}", "success": True}
+    return res, status.HTTP_200_OK
+
+
+def retract_vote(employee_id):
+    """Withdraw the employee's vote of today. Returns the response payload and status."""
+    today = get_business_day()
+    flush_pending_vote(employee_id, today)
+    with transaction.atomic():
+        vote = Vote.objects.select_for_update().filter(
+            employee_id=employee_id,
+            business_day=today).only('id', 'menu_id').first()
+        if vote is not None:
+            vote.delete()
+            increment_menu_votes(vote.menu_id, -1)
+
+    if vote is None:
+        res = {"msg": 'You have not voted today!', "data": None, "success": False}
+        return res, status.HTTP_404_NOT_FOUND
+    res = {"msg": 'Your vote has been withdrawn.', "data": None, "success": True}
+    return res, status.HTTP_200_OK
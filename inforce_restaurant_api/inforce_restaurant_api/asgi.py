@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inforce_restaurant_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.streams import route_results_stream  # noqa: E402
+
+# GET /api/results/stream/ is served as Server-Sent Events outside of
+# Django's request cycle; everything else goes to Django.
+application = route_results_stream(django_application)
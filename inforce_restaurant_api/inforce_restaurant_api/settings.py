@@ -10,7 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import os
-from datetime import datetime, timedelta
+import tempfile
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times the whole stack; see api/metrics.py.
+    'api.metrics.MetricsMiddleware',
+    # 503 rather than 500 when no database connection is free; see api/db/pool.py.
+    'api.db.pool.PoolExhaustedMiddleware',
+    # Before anything that queries; see api/db/routers.py.
+    'api.db.routers.ReplicaMiddleware',
+    # Profiling on demand and N+1 / query budget checks; see api/profiling.py.
+    'api.profiling.ProfilingMiddleware',
+    'api.profiling.QueryInspectionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,18 +98,78 @@ WSGI_APPLICATION = 'inforce_restaurant_api.wsgi.application'
 
 DATABASES = {
     "default": {
-        "ENGINE": os.environ.get("SQL_ENGINE", "django.db.backends.sqlite3"),
+        "ENGINE": os.environ.get("SQL_ENGINE", "api.db.backends.sqlite3"),
         "NAME": os.environ.get("SQL_DATABASE", os.path.join(BASE_DIR, "db.sqlite3")),
         "USER": os.environ.get("SQL_USER", "user"),
         "PASSWORD": os.environ.get("SQL_PASSWORD", "password"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        # Used by the pooled engines, api.db.backends.postgresql and
+        # api.db.backends.sqlite3: each worker process keeps up to MAX_SIZE
+        # connections open; a request waits up to TIMEOUT seconds for one and
+        # then gets 503. Connections idle CHECK_AFTER seconds are checked
+        # before use and closed MAX_LIFETIME seconds after they were opened.
+        "POOL": {
+            "MAX_SIZE": int(os.environ.get("SQL_POOL_SIZE", default=10)),
+            "TIMEOUT": float(os.environ.get("SQL_POOL_TIMEOUT", default=5)),
+            "CHECK_AFTER": float(os.environ.get("SQL_POOL_CHECK_AFTER", default=5)),
+            "MAX_LIFETIME": float(os.environ.get("SQL_POOL_MAX_LIFETIME", default=1800)),
+        },
+    }
+}
+
+if DATABASES["default"]["ENGINE"].endswith(".sqlite3"):
+    # The shared-cache in-memory test database fails concurrent writers with
+    # "database table is locked"; a file with a busy timeout lets them wait.
+    DATABASES["default"]["OPTIONS"] = {"timeout": 30}
+    DATABASES["default"]["TEST"] = {"NAME": os.path.join(BASE_DIR, "test_db.sqlite3")}
+    # Writers hold their pooled connection while they wait for the lock, so
+    # waiting for a connection must be allowed as long.
+    DATABASES["default"]["POOL"]["TIMEOUT"] = max(DATABASES["default"]["POOL"]["TIMEOUT"], 30)
+
+# Read replicas of the default database: SQL_REPLICAS lists their hosts
+# (for SQLite, their database files), comma separated. The read-only views
+# read from them, picked by DATABASE_REPLICA_STRATEGY; a client that wrote
+# reads from the primary for the next REPLICA_PIN_SECONDS, which must be
+# longer than the replication lag. See api/db/routers.py.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get("SQL_REPLICAS", "").split(",")), 1):
+    alias = f"replica{number}"
+    location = "NAME" if DATABASES["default"]["ENGINE"].endswith(".sqlite3") else "HOST"
+    DATABASES[alias] = {**DATABASES["default"], location: replica.strip(), "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["api.db.routers.ReplicaRouter"]
+DATABASE_REPLICA_STRATEGY = os.environ.get("DATABASE_REPLICA_STRATEGY", default="api.db.routers.RoundRobinStrategy")
+REPLICA_PIN_SECONDS = float(os.environ.get("REPLICA_PIN_SECONDS", default=5))
+
+# Caches
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Holds the content version behind the ETags of the read endpoints, so with
+# several workers it must be shared: the default file cache covers one
+# node, use memcached or redis across nodes.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "restaurant_api_cache")),
     }
 }
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
+# Password hashing runs in this many worker processes (api/hashing.py);
+# 0 hashes on the request thread. Once PASSWORD_HASHING_QUEUE more hashes
+# are waiting, logins and sign-ups get 503 until the pool catches up.
+# Every web worker process starts its own pool, so a node runs
+# WEB_CONCURRENCY (gunicorn's worker count) times as many hashing
+# processes; the default shares the node's cores between them.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", default=1))
+PASSWORD_HASHING_WORKERS = int(os.environ.get(
+    "PASSWORD_HASHING_WORKERS", default=max(1, (os.cpu_count() or 1) // max(WEB_CONCURRENCY, 1))))
+PASSWORD_HASHING_QUEUE = int(os.environ.get("PASSWORD_HASHING_QUEUE", default=4 * PASSWORD_HASHING_WORKERS))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -168,15 +238,21 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Each worker keeps the revoked tokens in memory and picks up revocations
+# made by other workers from the shared cache at most this often, so a
+# token logged out elsewhere is accepted for up to this many seconds more.
+REVOKED_TOKENS_REFRESH_INTERVAL = float(os.environ.get("REVOKED_TOKENS_REFRESH_INTERVAL", default=1))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSESS': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # The API authenticates with JWTs whose claims identify the user and
+    # employee (api/authentication.py), so no request reads the User table.
+    # Sessions are only used by the browsable API and admin.
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ),
 
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.AcceptHeaderVersioning',
@@ -190,7 +266,8 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.JSONParser',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Cursor pagination on (created_at, id); see api/pagination.py.
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
     'PAGE_SIZE': 100,
     'DEFAULT_RENDERER_CLASSESS': (
         'rest_framework.renderers.JSONRenderer',
@@ -198,6 +275,87 @@ REST_FRAMEWORK = {
     ),
 }
 
-CURRENT_DATE = datetime.now()
+# Serve the restaurant list, menu list, vote and results endpoints with
+# native async views (api/async_views.py). Only worth it under ASGI.
+API_ASYNC_VIEWS = int(os.environ.get("API_ASYNC_VIEWS", default=0))
+
+# Server-Sent Events stream of live results (ASGI only, see asgi.py).
+# Subscribers get at most RESULTS_STREAM_MAX_RATE updates per second; a
+# client with more than RESULTS_STREAM_BUFFER undelivered updates is
+# resynced with a snapshot instead.
+RESULTS_STREAM_PATH = "/api/results/stream/"
+RESULTS_STREAM_MAX_RATE = float(os.environ.get("RESULTS_STREAM_MAX_RATE", default=2))
+RESULTS_STREAM_BUFFER = int(os.environ.get("RESULTS_STREAM_BUFFER", default=16))
+RESULTS_STREAM_KEEPALIVE = 15
+
+# Storage of uploaded menu files. The default keeps one copy of each
+# distinct file, named by its SHA-256 digest (see api/storage.py).
+MENU_FILE_STORAGE = os.environ.get("MENU_FILE_STORAGE", default="api.storage.ContentAddressedStorage")
+
+# How GET /api/menus/<id>/file/ hands over file bodies: "" serves them from
+# Django (through the WSGI server's sendfile where it has one),
+# "x-accel-redirect" leaves them to nginx, where MENU_FILE_ACCEL_PREFIX must
+# be an internal location aliasing the media directory, and "x-sendfile"
+# to Apache or lighttpd.
+MENU_FILE_SENDFILE = os.environ.get("MENU_FILE_SENDFILE", default="")
+MENU_FILE_ACCEL_PREFIX = os.environ.get("MENU_FILE_ACCEL_PREFIX", default="/protected-media/")
+
+# Source of "now" and of the business day; see api/clock.py.
+BUSINESS_CLOCK = "api.clock.SystemClock"
+
+# Number of counter rows each menu's votes are spread over. 1 keeps the
+# count in Menu.votes; run `manage.py reconcile_votes` after lowering it.
+VOTE_COUNTER_SHARDS = int(os.environ.get("VOTE_COUNTER_SHARDS", default=1))
+
+# "sync" writes each vote inside the request; "buffered" acknowledges it
+# right away and writes it in batches (see api/ingestion.py). Setting a
+# journal directory makes buffered votes survive a worker crash.
+VOTE_INGESTION = os.environ.get("VOTE_INGESTION", default="sync")
+VOTE_BUFFER_MAX_SIZE = int(os.environ.get("VOTE_BUFFER_MAX_SIZE", default=500))
+VOTE_BUFFER_FLUSH_INTERVAL = float(os.environ.get("VOTE_BUFFER_FLUSH_INTERVAL", default=1.0))
+VOTE_BUFFER_JOURNAL_DIR = os.environ.get("VOTE_BUFFER_JOURNAL_DIR")
+
+# PUT and DELETE /api/vote/ answer a repeated Idempotency-Key with the
+# stored response of its first request for this many seconds (see
+# api/idempotency.py). The cache must be shared by all workers.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", default=24 * 60 * 60))
+
+# `manage.py archive_votes` handles votes by month (see api/archive.py). A
+# month is closed VOTE_ARCHIVE_AFTER_DAYS days after it ends; closed months
+# leave the hot Vote table (except on PostgreSQL, where it is partitioned
+# by month) and are exported to VOTE_ARCHIVE_DIR. Exported months older
+# than VOTE_RETENTION_DAYS are deleted; unset keeps them forever.
+VOTE_ARCHIVE_AFTER_DAYS = int(os.environ.get("VOTE_ARCHIVE_AFTER_DAYS", default=7))
+VOTE_ARCHIVE_DIR = os.environ.get("VOTE_ARCHIVE_DIR", default=os.path.join(BASE_DIR, "archive"))
+VOTE_RETENTION_DAYS = int(os.environ["VOTE_RETENTION_DAYS"]) if os.environ.get("VOTE_RETENTION_DAYS") else None
+
+# Memory-mapped file holding today's results, shared by all workers on a
+# node. Defaults to a per-database file in /dev/shm.
+LEADERBOARD_PATH = os.environ.get("LEADERBOARD_PATH")
+LEADERBOARD_CAPACITY = int(os.environ.get("LEADERBOARD_CAPACITY", default=256))
+
+# Prometheus metrics at /metrics (api/metrics.py). With several worker
+# processes, point METRICS_DIR at a directory they share on the node; each
+# worker writes its totals there every METRICS_FLUSH_INTERVAL seconds and
+# /metrics adds them up, keeping the counters of exited workers.
+# METRICS_ALLOWED_IPS limits who may scrape, e.g. "10.0.0.5,127.0.0.1".
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", default=1.0))
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get("METRICS_ALLOWED_IPS", default="").split(",") if ip]
+
+# Requests with a signed X-Profile header (`manage.py profiling_token`),
+# plus PROFILING_SAMPLE_RATE of all requests, are profiled into
+# PROFILING_DIR, which keeps the newest PROFILING_MAX_PROFILES.
+PROFILING_DIR = os.environ.get(
+    "PROFILING_DIR", default=os.path.join(tempfile.gettempdir(), "restaurant_api_profiles"))
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", default=0))
+PROFILING_MAX_PROFILES = int(os.environ.get("PROFILING_MAX_PROFILES", default=100))
+PROFILING_TOKEN_MAX_AGE = int(os.environ.get("PROFILING_TOKEN_MAX_AGE", default=3600))
+
+# "warn" logs queries a request repeats QUERY_REPEAT_THRESHOLD times or
+# more, and requests over their view's query_budget; "raise" raises for
+# the latter. For development and tests.
+QUERY_INSPECTION = os.environ.get("QUERY_INSPECTION", default="")
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", default=3))
 
 AUTH_USER_MODEL = 'api.User'